@@ -0,0 +1,69 @@
+"""Stage timings of the python/ pipeline (link-based recursive logit + policy iteration)."""
+
+import csv
+import json
+import os
+import sys
+
+from stage_timer import StageTimer, add_pipeline_path
+
+add_pipeline_path()
+add_pipeline_path('python')
+
+from network_loader import load_network_from_csv, load_od_demand  # noqa: E402
+from utility_func import UtilityFunction  # noqa: E402
+from recursive_logit import RecursiveLogitModel  # noqa: E402
+from rl_static_assignment import RLStaticAssigner  # noqa: E402
+from multiagent_rollout_test import MultiAgentPolicyIteration, VehicleAgent  # noqa: E402
+
+
+def run(data_dir, network_info, repeats=1, out_dir=None):
+    out_dir = out_dir or data_dir
+    timer = StageTimer('python', network_info)
+    for rep in range(repeats):
+        with timer.stage('load', rep):
+            net = load_network_from_csv(os.path.join(data_dir, 'node.csv'), os.path.join(data_dir, 'link.csv'))
+            demands = load_od_demand(os.path.join(data_dir, 'demand.csv'), net)
+
+        rl_model = RecursiveLogitModel(net, UtilityFunction({'time': -0.5, 'distance': -0.2}), mu=1.0)
+        with timer.stage('value_function', rep):
+            for record in demands.demands:
+                rl_model.get_value_function(record.destination_link_id)
+
+        with timer.stage('initial_assignment', rep):
+            RLStaticAssigner(net, rl_model).assign(demands)
+
+        vehicles = [
+            VehicleAgent(f"{record.origin_link_id}_{record.destination_link_id}_{i}",
+                         record.origin_link_id, record.destination_link_id)
+            for record in demands.demands for i in range(int(record.volume))
+        ]
+        pi = MultiAgentPolicyIteration(net, rl_model, vehicles, random_seed=42)
+        with timer.stage('rollout_step', rep):
+            pi.policy_iteration(n_iters=1, patience=1)
+
+        with timer.stage('gap', rep):
+            # average policy travel time minus the base-policy (shortest) travel time per OD
+            path_costs = pi.paths.path_costs()
+            shortest = {}
+            for record in demands.demands:
+                od = (record.origin_link_id, record.destination_link_id)
+                path = pi.get_base_policy_path(*od)
+                shortest[od] = sum(net.links[lid].attributes.get('travel_time', 1.0) for lid in path)
+            gaps = [path_costs[pid] - shortest[(v.origin, v.destination)] for v, pid in zip(vehicles, pi.current_policy)]
+            sum(gaps) / max(1, len(gaps))
+
+        with timer.stage('export', rep):
+            flows = pi.get_link_flows()
+            with open(os.path.join(out_dir, 'python_link_performance.csv'), 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["link_id", "from_node_id", "to_node_id", "flow", "travel_time"])
+                for link_id, link in net.links.items():
+                    writer.writerow([link_id, link.start_node, link.end_node, flows.get(link_id, 0.0),
+                                     link.attributes.get("travel_time", 0.0)])
+    return timer.records
+
+
+if __name__ == "__main__":
+    data_dir, network_info, repeats = sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3])
+    print(json.dumps(run(data_dir, network_info, repeats)))
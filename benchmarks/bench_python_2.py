@@ -0,0 +1,56 @@
+"""Stage timings of the python_2 pipeline (stochastic multi-agent rollout + path gap)."""
+
+import json
+import os
+import sys
+
+import pandas as pd
+
+from stage_timer import StageTimer, add_pipeline_path
+
+add_pipeline_path()
+add_pipeline_path('python_2')
+
+from python_3.network_loader import load_network  # noqa: E402
+from python_3.demand_loader import load_demand  # noqa: E402
+from python_3.value_function_solver import solve_value_function  # noqa: E402
+from python_3.results_exporter import export_link_performance  # noqa: E402
+from path_assignment import assign_initial_paths  # noqa: E402
+from stochastic_multi_agent_rollout import multi_agent_rollout  # noqa: E402
+from gap_function import compute_max_path_gap  # noqa: E402
+
+
+def run(data_dir, network_info, repeats=1, out_dir=None):
+    out_dir = out_dir or data_dir
+    timer = StageTimer('python_2', network_info)
+    for rep in range(repeats):
+        with timer.stage('load', rep):
+            G = load_network(os.path.join(data_dir, 'node.csv'), os.path.join(data_dir, 'link.csv'))
+            agents, destination_zones = load_demand(os.path.join(data_dir, 'demand.csv'))
+        for u, v, attr in G.edges(data=True):
+            attr['flow'] = 0
+            attr['current_travel_time'] = attr['free_flow_travel_time']
+
+        with timer.stage('value_function', rep):
+            value_function_dict = {dest: solve_value_function(G, dest) for dest in destination_zones}
+
+        with timer.stage('initial_assignment', rep):
+            assign_initial_paths(G, agents, value_function_dict, method='shortest_path')
+
+        with timer.stage('rollout_step', rep):
+            agent_paths, link_flows = multi_agent_rollout(G, agents, value_function_dict, mu=0.1, random_seed=42)
+
+        with timer.stage('gap', rep):
+            compute_max_path_gap(G, agent_paths)
+
+        with timer.stage('export', rep):
+            for u, v, attr in G.edges(data=True):
+                attr['flow'] = link_flows[attr['link_id']]
+            pd.DataFrame(agent_paths).to_csv(os.path.join(out_dir, 'python_2_agent_result.csv'), index=False)
+            export_link_performance(G, os.path.join(out_dir, 'python_2_link_performance.csv'))
+    return timer.records
+
+
+if __name__ == "__main__":
+    data_dir, network_info, repeats = sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3])
+    print(json.dumps(run(data_dir, network_info, repeats)))
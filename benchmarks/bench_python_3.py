@@ -0,0 +1,66 @@
+"""Stage timings of the python_3 pipeline (replanned one-step rollout)."""
+
+import json
+import os
+import sys
+
+import networkx as nx
+
+from stage_timer import StageTimer, add_pipeline_path
+
+add_pipeline_path('python_3')
+
+from network_loader import load_network  # noqa: E402
+from demand_loader import load_demand  # noqa: E402
+from value_function_solver import solve_value_function  # noqa: E402
+from path_assignment import assign_paths_from_value_function  # noqa: E402
+from one_step_rollout_replanned import run_one_step_multiagent_rollout  # noqa: E402
+from results_exporter import export_agent_results, export_link_performance  # noqa: E402
+from utils import initialize_travel_times, update_link_cost_bpr  # noqa: E402
+
+
+def relative_gap(G, agents):
+    """(TSTT - SPTT) / TSTT with shortest paths on the current travel times."""
+    tstt = sum(attr['current_travel_time'] * attr['flow'] for _, _, attr in G.edges(data=True))
+    sptt = 0.0
+    by_origin = {}
+    for agent in agents:
+        by_origin.setdefault(agent['origin_node'], []).append(agent['destination_node'])
+    for origin, dests in by_origin.items():
+        dist = nx.single_source_dijkstra_path_length(G, origin, weight='current_travel_time')
+        sptt += sum(dist.get(d, 0.0) for d in dests)
+    return (tstt - sptt) / tstt if tstt > 0 else 0.0
+
+
+def run(data_dir, network_info, repeats=1, out_dir=None):
+    out_dir = out_dir or data_dir
+    timer = StageTimer('python_3', network_info)
+    for rep in range(repeats):
+        with timer.stage('load', rep):
+            G = load_network(os.path.join(data_dir, 'node.csv'), os.path.join(data_dir, 'link.csv'))
+            agents, destination_zones = load_demand(os.path.join(data_dir, 'demand.csv'))
+        initialize_travel_times(G)
+
+        with timer.stage('value_function', rep):
+            value_function_dict = {dest: solve_value_function(G, dest) for dest in destination_zones}
+
+        with timer.stage('initial_assignment', rep):
+            assign_paths_from_value_function(G, agents, value_function_dict)
+
+        with timer.stage('rollout_step', rep):
+            run_one_step_multiagent_rollout(G, agents, value_function_dict, mu=0.3, greedy=False, random_seed=42)
+            for u, v in G.edges():
+                update_link_cost_bpr(G, u, v)
+
+        with timer.stage('gap', rep):
+            relative_gap(G, agents)
+
+        with timer.stage('export', rep):
+            export_agent_results(agents, os.path.join(out_dir, 'python_3_agent_result.csv'))
+            export_link_performance(G, os.path.join(out_dir, 'python_3_link_performance.csv'))
+    return timer.records
+
+
+if __name__ == "__main__":
+    data_dir, network_info, repeats = sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3])
+    print(json.dumps(run(data_dir, network_info, repeats)))
@@ -0,0 +1,110 @@
+"""
+Accuracy and speed of packet agents (config.packet_size) in the python_3 replanned rollout.
+
+Runs the scenario pipeline on synthetic networks with agents carrying 1, 2, 5, ...
+vehicles and compares the final link flows and system travel time with the
+one-vehicle-per-agent runs (averaged over seeds). The seed-to-seed spread of the
+packet_size=1 runs is reported as the sampling noise floor:
+
+    python benchmarks/packet_size_study.py --packet-sizes 1 5 10 50 --seeds 1 2 3
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from stage_timer import add_pipeline_path
+from synthetic_network import make_grid_network, make_corridor_network
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+add_pipeline_path('python_3')
+
+from config import default_scenario  # noqa: E402
+from scenario_runner import load_dataset, run_scenario  # noqa: E402
+
+NETWORKS = [
+    lambda: make_grid_network(15, 15, n_od=6, total_volume=6000),
+    lambda: make_corridor_network(4, volume_per_corridor=2000),
+]
+FIELDS = ['network', 'packet_size', 'n_agents', 'seconds', 'speedup', 'flow_rmse', 'flow_rel_error',
+          'noise_rmse', 'system_travel_time', 'stt_rel_error']
+
+
+def run_packet_size(data_path, packet_size, seeds, iterations):
+    """Mean final link flows, system travel time and runtime over the seeds."""
+    flows, stts, seconds = [], [], []
+    n_agents = 0
+    for seed in seeds:
+        config = default_scenario(name=f"packet{packet_size}_seed{seed}", data_path=data_path,
+                                  packet_size=packet_size, random_seed=seed, max_outer_iterations=iterations)
+        # the pipeline prints progress; keep it out of the study output
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            G, agents, destination_zones = load_dataset(config)
+            start = time.perf_counter()
+            records, link_flows = run_scenario(config, G, agents, destination_zones, return_link_flows=True)
+            seconds.append(time.perf_counter() - start)
+        n_agents = len(agents)
+        link_ids = sorted(link_flows)
+        flows.append([link_flows[link_id] for link_id in link_ids])
+        stts.append(records[-1]['system_travel_time'])
+    return np.array(flows, dtype=float), float(np.mean(stts)), float(np.mean(seconds)), n_agents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--packet-sizes', type=float, nargs='+', default=[1, 2, 5, 10, 20, 50, 100])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'results'))
+    parser.add_argument('--tag', default=time.strftime('%Y%m%d_%H%M%S'))
+    args = parser.parse_args()
+    packet_sizes = sorted({1.0, *args.packet_sizes})
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for make_network in NETWORKS:
+            net = make_network()
+            data_path = net.write(os.path.join(tmp, net.name))
+            reference = None
+            for packet_size in packet_sizes:
+                packet_size = int(packet_size) if packet_size.is_integer() else packet_size
+                flows, stt, seconds, n_agents = run_packet_size(data_path, packet_size, args.seeds, args.iterations)
+                mean_flows = flows.mean(axis=0)
+                if reference is None:
+                    reference = (mean_flows, stt, seconds,
+                                 float(np.sqrt(np.mean((flows - mean_flows) ** 2))) if len(flows) > 1 else np.nan)
+                ref_flows, ref_stt, ref_seconds, noise = reference
+                rmse = float(np.sqrt(np.mean((mean_flows - ref_flows) ** 2)))
+                row = {
+                    'network': net.name,
+                    'packet_size': packet_size,
+                    'n_agents': n_agents,
+                    'seconds': seconds,
+                    'speedup': ref_seconds / seconds,
+                    'flow_rmse': rmse,
+                    'flow_rel_error': float(np.abs(mean_flows - ref_flows).sum() / max(ref_flows.sum(), 1e-12)),
+                    'noise_rmse': noise,
+                    'system_travel_time': stt,
+                    'stt_rel_error': abs(stt - ref_stt) / ref_stt,
+                }
+                rows.append(row)
+                print(f"{net.name:<24} packet {packet_size:>6} | {n_agents:>6} agents | {seconds:8.3f} s "
+                      f"(x{row['speedup']:6.1f}) | flow RMSE {rmse:8.2f} (noise {noise:6.2f}) | "
+                      f"STT error {row['stt_rel_error']:7.2%}")
+
+    os.makedirs(args.out, exist_ok=True)
+    out_file = os.path.join(args.out, f"packet_size_study_{args.tag}.csv")
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Packet size study written to {out_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Scaling benchmark for the python/, python_2 and python_3 pipelines.
+
+Generates synthetic GMNS networks of increasing size, times every pipeline stage
+(load, value_function, initial_assignment, rollout_step, gap, export) in a separate
+process per pipeline (their modules share names), and writes the records as CSV and
+JSON lines so runs can be compared over time:
+
+    python benchmarks/run_benchmarks.py --suite small --repeats 3
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_network import make_grid_network, make_corridor_network
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINES = {
+    'python': 'bench_python.py',
+    'python_2': 'bench_python_2.py',
+    'python_3': 'bench_python_3.py',
+}
+SUITES = {
+    'small': [
+        lambda: make_grid_network(5, 5, n_od=2, total_volume=200),
+        lambda: make_corridor_network(1, volume_per_corridor=200),
+        lambda: make_grid_network(10, 10, n_od=4, total_volume=1000),
+        lambda: make_corridor_network(4, volume_per_corridor=250),
+    ],
+    'medium': [
+        lambda: make_grid_network(20, 20, n_od=8, total_volume=4000),
+        lambda: make_corridor_network(16, n_segments=20, volume_per_corridor=250),
+        lambda: make_grid_network(30, 30, n_od=10, total_volume=10000),
+    ],
+    'large': [
+        lambda: make_grid_network(50, 50, n_od=20, total_volume=50000),
+        lambda: make_corridor_network(64, n_segments=40, volume_per_corridor=500),
+    ],
+}
+FIELDS = ['pipeline', 'network', 'n_nodes', 'n_links', 'n_od', 'n_agents', 'stage', 'repeat', 'seconds', 'status']
+
+
+def run_pipeline(pipeline, data_dir, network_info, repeats, timeout):
+    cmd = [sys.executable, os.path.join(BENCH_DIR, PIPELINES[pipeline]), data_dir, json.dumps(network_info), str(repeats)]
+    try:
+        proc = subprocess.run(cmd, cwd=BENCH_DIR, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return [{'pipeline': pipeline, **network_info, 'stage': 'all', 'repeat': 0, 'seconds': timeout,
+                 'status': 'timeout'}]
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        print(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'no output', file=sys.stderr)
+        return [{'pipeline': pipeline, **network_info, 'stage': 'all', 'repeat': 0, 'seconds': float('nan'),
+                 'status': 'error'}]
+    return [{**record, 'status': 'ok'} for record in json.loads(lines[-1])]
+
+
+def write_results(records, out_dir, tag):
+    os.makedirs(out_dir, exist_ok=True)
+    csv_file = os.path.join(out_dir, f"benchmark_{tag}.csv")
+    with open(csv_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    jsonl_file = os.path.join(out_dir, f"benchmark_{tag}.jsonl")
+    with open(jsonl_file, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return csv_file, jsonl_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--suite', choices=sorted(SUITES), default='small')
+    parser.add_argument('--pipelines', nargs='+', choices=sorted(PIPELINES), default=sorted(PIPELINES))
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=1800.0, help="seconds per pipeline and network")
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'results'))
+    parser.add_argument('--tag', default=time.strftime('%Y%m%d_%H%M%S'))
+    args = parser.parse_args()
+
+    records = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for make_network in SUITES[args.suite]:
+            net = make_network()
+            data_dir = net.write(os.path.join(tmp, net.name))
+            info = net.summary()
+            for pipeline in args.pipelines:
+                print(f"{pipeline:>8} | {info['network']:<24} | {info['n_links']:>6} links | {info['n_agents']:>7} agents")
+                pipeline_records = run_pipeline(pipeline, data_dir, info, args.repeats, args.timeout)
+                for record in pipeline_records:
+                    print(f"{'':>8}   {record['stage']:<20} {record['seconds']:10.4f} s  {record['status']}")
+                records.extend(pipeline_records)
+
+    csv_file, jsonl_file = write_results(records, args.out, args.tag)
+    print(f"Benchmark results written to {csv_file} and {jsonl_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import contextlib
+import os
+import sys
+import time
+
+
+class StageTimer:
+    """Collects wall-clock seconds per pipeline stage as flat benchmark records."""
+
+    def __init__(self, pipeline, network_info, quiet=True):
+        self.pipeline = pipeline
+        self.network_info = dict(network_info)
+        self.quiet = quiet
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, name, repeat=0):
+        # the pipelines print progress; keep it out of the measurement output
+        with open(os.devnull, 'w') as devnull:
+            redirect = contextlib.redirect_stdout(devnull) if self.quiet else contextlib.nullcontext()
+            with redirect:
+                start = time.perf_counter()
+                yield
+                seconds = time.perf_counter() - start
+        self.records.append({
+            'pipeline': self.pipeline,
+            **self.network_info,
+            'stage': name,
+            'repeat': repeat,
+            'seconds': seconds,
+        })
+
+
+def add_pipeline_path(*parts):
+    """Put a pipeline directory first on sys.path; the pipelines use flat imports."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    path = os.path.join(root, *parts)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return path
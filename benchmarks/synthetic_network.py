@@ -0,0 +1,132 @@
+"""
+Synthetic GMNS networks and demand for the benchmark suite.
+
+The files carry the columns read by both loaders: python/network_loader.py
+(vdf_length_mi, vdf_free_speed_mph) and python_3/network_loader.py (length in
+meters, free_speed in km/h). Zone nodes use zone_id == node_id, which both
+pipelines assume when they map zones to nodes.
+"""
+
+import csv
+import os
+
+METERS_PER_MILE = 1609.344
+KMH_PER_MPH = 1.609344
+
+NODE_COLUMNS = ['node_id', 'zone_id', 'x_coord', 'y_coord']
+LINK_COLUMNS = ['link_id', 'from_node_id', 'to_node_id', 'dir_flag', 'length', 'vdf_length_mi',
+                'lanes', 'free_speed', 'vdf_free_speed_mph', 'capacity']
+DEMAND_COLUMNS = ['o_zone_id', 'd_zone_id', 'volume']
+
+
+class SyntheticNetwork:
+    """Nodes, links and OD demand of a generated network, ready to be written as GMNS CSV files."""
+
+    def __init__(self, name):
+        self.name = name
+        self.nodes = []   # [node_id, zone_id, x, y]
+        self.links = []   # [from_node, to_node, length_m, lanes, speed_mph, capacity_per_lane]
+        self.demand = []  # [o_zone, d_zone, volume]
+
+    def add_node(self, x, y, zone=False):
+        node_id = len(self.nodes) + 1
+        self.nodes.append([node_id, node_id if zone else '', x, y])
+        return node_id
+
+    def add_link(self, from_node, to_node, length_m, lanes=1, speed_mph=30, capacity=1800):
+        self.links.append([from_node, to_node, length_m, lanes, speed_mph, capacity])
+
+    def write(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, 'node.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(NODE_COLUMNS)
+            writer.writerows(self.nodes)
+        with open(os.path.join(out_dir, 'link.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(LINK_COLUMNS)
+            for link_id, (u, v, length_m, lanes, speed_mph, capacity) in enumerate(self.links, start=1):
+                writer.writerow([link_id, u, v, 1, round(length_m, 3), round(length_m / METERS_PER_MILE, 6),
+                                 lanes, round(speed_mph * KMH_PER_MPH, 4), speed_mph, capacity])
+        with open(os.path.join(out_dir, 'demand.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(DEMAND_COLUMNS)
+            writer.writerows(self.demand)
+        return out_dir
+
+    def summary(self):
+        return {
+            'network': self.name,
+            'n_nodes': len(self.nodes),
+            'n_links': len(self.links),
+            'n_od': len(self.demand),
+            'n_agents': int(sum(int(vol) for _, _, vol in self.demand)),
+        }
+
+
+def make_grid_network(rows, cols, n_od=4, total_volume=1000, spacing_m=500.0, bidirectional=False):
+    """
+    rows x cols grid with links running east and north (acyclic), or both ways if
+    bidirectional=True. Origins sit on the west edge and destinations on the east edge,
+    north of their origin.
+    """
+    net = SyntheticNetwork(f"grid_{rows}x{cols}" + ("_bidir" if bidirectional else ""))
+    n_od = max(1, min(n_od, rows - 1))
+    # each destination lies north-east of its origin so it is reachable on the acyclic grid
+    origin_rows = _spread(rows - 1, n_od)
+    dest_rows = [min(rows - 1, r + max(1, rows // 2)) for r in origin_rows]
+    zone_cells = {(r, 0) for r in origin_rows} | {(r, cols - 1) for r in dest_rows}
+
+    node_at = {}
+    for r in range(rows):
+        for c in range(cols):
+            node_at[r, c] = net.add_node(c * spacing_m, r * spacing_m, zone=(r, c) in zone_cells)
+
+    for r in range(rows):
+        for c in range(cols):
+            # alternate arterials (2 lanes, 40 mph) and local streets (1 lane, 25 mph)
+            for dr, dc in ((0, 1), (1, 0)):
+                r2, c2 = r + dr, c + dc
+                if r2 >= rows or c2 >= cols:
+                    continue
+                arterial = (r if dc else c) % 3 == 0
+                lanes, speed = (2, 40) if arterial else (1, 25)
+                net.add_link(node_at[r, c], node_at[r2, c2], spacing_m, lanes, speed)
+                if bidirectional:
+                    net.add_link(node_at[r2, c2], node_at[r, c], spacing_m, lanes, speed)
+
+    volume = max(1, total_volume // n_od)
+    for o_row, d_row in zip(origin_rows, dest_rows):
+        net.demand.append([node_at[o_row, 0], node_at[d_row, cols - 1], volume])
+    return net
+
+
+def make_corridor_network(n_corridors, n_routes=3, n_segments=10, volume_per_corridor=1000, segment_m=800.0):
+    """
+    n_corridors independent copies of a 3-corridor style layout: one origin and one
+    destination joined by n_routes parallel routes of n_segments links each
+    (freeway, arterial, local).
+    """
+    net = SyntheticNetwork(f"corridor_{n_corridors}x{n_routes}x{n_segments}")
+    route_types = [(3, 65), (2, 45), (1, 30)]
+    for k in range(n_corridors):
+        y0 = k * (n_routes + 2) * segment_m
+        origin = net.add_node(0.0, y0, zone=True)
+        destination = net.add_node((n_segments + 1) * segment_m, y0, zone=True)
+        for r in range(n_routes):
+            lanes, speed = route_types[r % len(route_types)]
+            y = y0 + (r + 1) * segment_m
+            prev = origin
+            for s in range(1, n_segments + 1):
+                node = net.add_node(s * segment_m, y)
+                net.add_link(prev, node, segment_m, lanes, speed)
+                prev = node
+            net.add_link(prev, destination, segment_m, lanes, speed)
+        net.demand.append([origin, destination, volume_per_corridor])
+    return net
+
+
+def _spread(n, k):
+    if k >= n:
+        return list(range(n))
+    return [round(i * (n - 1) / max(1, k - 1)) for i in range(k)]
@@ -52,7 +52,7 @@ def main():
                                          ))
 
     # 5) Run policy iteration
-    pi = MultiAgentPolicyIteration(net, rl_model, vehicles)
+    pi = MultiAgentPolicyIteration(net, rl_model, vehicles, random_seed=42)
     pi.policy_iteration(n_iters=100, patience=10)
     flows = pi.get_link_flows()
 
@@ -1,6 +1,9 @@
 import math
-import random
+import numpy as np
 from collections import defaultdict, Counter
+from path_registry import PathRegistry
+from shortest_path_cache import ShortestPathService
+from python_3.rng_streams import RolloutStreams, sample_index
 
 class VehicleAgent:
     def __init__(self, agent_id, origin_link_id, destination_link_id):
@@ -9,106 +12,85 @@ class VehicleAgent:
         self.destination = destination_link_id
 
 class MultiAgentPolicyIteration:
-    def __init__(self, net, rl_model, vehicle_set):
+    def __init__(self, net, rl_model, vehicle_set, random_seed=None):
         self.net = net
         self.rl_model = rl_model
         self.vehicles = vehicle_set
-        self.current_policy = {}
-        self.previous_policy = {}
+        # one uniform per vehicle and rollout depth from counter-based streams (python_3 rng_streams),
+        # so results do not depend on the order in which vehicles are rolled out
+        self.streams = RolloutStreams(random_seed)
+        self.round_uniforms = []
+        # policies are arrays of path IDs aligned with self.vehicles
+        self.paths = PathRegistry(net)
+        # base policy trees, re-solved only when the link travel times change
+        self.shortest_paths = ShortestPathService(net)
+        self.current_policy = None
+        self.previous_policy = None
         self.reward_history = []
         self.change_rate_history = []
         self.path_distribution_history = []
 
     def get_base_policy_path(self, origin, destination):
-        dist = {lid: float('inf') for lid in self.net.links}
-        prev = {}
-        dist[origin] = 0
-        queue = [(0, origin)]
-        while queue:
-            queue.sort()
-            cost, u = queue.pop(0)
-            if u == destination:
-                break
-            for succ_id in self.net.get_successor_links(u):
-                travel_time = self.net.links[succ_id].attributes.get('travel_time', 1.0)
-                alt = cost + travel_time
-                if alt < dist[succ_id]:
-                    dist[succ_id] = alt
-                    prev[succ_id] = u
-                    queue.append((alt, succ_id))
-        path = []
-        current = destination
-        while current in prev:
-            path.append(current)
-            current = prev[current]
-        if path:
-            path.append(origin)
-            path.reverse()
-        return path if path and path[0] == origin else []
-
-    def rollout_one_agent(self, agent, choice_probs, link_flows, max_steps=50):
+        self.shortest_paths.update_costs()
+        return self.shortest_paths.path(origin, destination)
+
+    def rollout_one_agent(self, agent, successor_scores, link_flows, vehicle_index, max_steps=50):
         path = [agent.origin]
         current = agent.origin
         steps = 0
+        mu = self.rl_model.mu
         while current != agent.destination and steps < max_steps:
-            if current not in choice_probs:
+            if current not in successor_scores:
                 break
-            probs = choice_probs[current]
-            next_links = list(probs.keys())
-            weights = []
-            for a in next_links:
-                u = self.rl_model.utility_func.compute_utility(self.net, current, a, link_flows)
-                v = self.rl_model.get_value_function(agent.destination).get(a, -float('inf'))
-                weights.append(math.exp((u + v) / self.rl_model.mu))
-            if not weights:
-                break
-            total = sum(weights)
-            weights = [w / total for w in weights]
-            next_link = random.choices(next_links, weights=weights, k=1)[0]
+            # v(a|k) + V_d(a) comes precomputed per destination; only the flow term changes
+            next_links, scores, flow_coefficients = successor_scores[current]
+            weights = [math.exp((score + coefficient * link_flows.get(a, 0.0)) / mu)
+                       for a, score, coefficient in zip(next_links, scores, flow_coefficients)]
+            next_link = next_links[sample_index(weights, self.depth_uniforms(steps)[vehicle_index])]
             path.append(next_link)
             current = next_link
             steps += 1
         reward = -sum(self.net.links[link_id].attributes.get('travel_time', 1.0) for link_id in path)
         return path, reward
 
+    def depth_uniforms(self, depth):
+        """Uniforms of all vehicles for one rollout depth of the current round, drawn on first use."""
+        while len(self.round_uniforms) <= depth:
+            step = self.streams.next_step()
+            self.round_uniforms.append(self.streams.uniforms(step, 0, len(self.vehicles)).tolist())
+        return self.round_uniforms[depth]
+
     def evaluate_policy_cost(self, policy):
-        total_reward = 0.0
-        for agent in self.vehicles:
-            path = policy.get(agent.agent_id, [])
-            reward = -sum(self.net.links[link_id].attributes.get('travel_time', 1.0) for link_id in path)
-            total_reward += reward
-        return total_reward / len(self.vehicles)
+        path_rewards = -self.paths.path_costs()
+        return path_rewards[policy].sum() / len(self.vehicles)
 
     def policy_iteration(self, n_iters=10, patience=3):
         for it in range(n_iters):
             print(f"\nPolicy Iteration Round {it+1}")
-            all_choice_probs = {}
+            all_scores = {}
             for agent in self.vehicles:
-                if agent.destination not in all_choice_probs:
-                    all_choice_probs[agent.destination] = self.rl_model.get_choice_probabilities(agent.destination)
+                if agent.destination not in all_scores:
+                    all_scores[agent.destination] = self.rl_model.get_successor_scores(agent.destination)
 
-            new_policy = {}
-            path_freq = Counter()
+            new_policy = np.empty(len(self.vehicles), dtype=np.int64)
             total_reward = 0.0
             changed = 0
             link_flows = defaultdict(float)
+            self.round_uniforms = []
 
-            for agent in self.vehicles:
-                probs = all_choice_probs[agent.destination]
-                path, reward = self.rollout_one_agent(agent, probs, link_flows)
-                new_policy[agent.agent_id] = path
+            for i, agent in enumerate(self.vehicles):
+                scores = all_scores[agent.destination]
+                path, reward = self.rollout_one_agent(agent, scores, link_flows, i)
+                new_policy[i] = self.paths.intern(path)
                 total_reward += reward
                 for lid in path:
                     link_flows[lid] += 1.0
-                path_str = '->'.join(path)
-                path_freq[path_str] += 1
-
-            if self.current_policy:
-                for aid in new_policy:
-                    old = self.current_policy.get(aid, [])
-                    new = new_policy[aid]
-                    if old != new:
-                        changed += 1
+
+            counts = np.bincount(new_policy, minlength=len(self.paths))
+            path_freq = Counter({self.paths.path_str(pid): int(counts[pid]) for pid in np.flatnonzero(counts)})
+
+            if self.current_policy is not None:
+                changed = int(np.count_nonzero(new_policy != self.current_policy))
                 total = len(new_policy)
                 print(f"  Changed paths: {changed} / {total} ({changed / total:.1%})")
             else:
@@ -119,7 +101,7 @@ class MultiAgentPolicyIteration:
             print(f"  Avg reward this round: {avg_reward:.2f}")
 
             # Reward-based acceptance
-            old_avg_reward = self.evaluate_policy_cost(self.current_policy) if self.current_policy else float('-inf')
+            old_avg_reward = self.evaluate_policy_cost(self.current_policy) if self.current_policy is not None else float('-inf')
 
             if avg_reward >= old_avg_reward:
                 self.previous_policy = self.current_policy
@@ -138,7 +120,15 @@ class MultiAgentPolicyIteration:
 
     def get_link_flows(self):
         link_flows = defaultdict(float)
-        for path in self.current_policy.values():
-            for link_id in path:
-                link_flows[link_id] += 1.0
-        return link_flows
\ No newline at end of file
+        if self.current_policy is not None:
+            link_flows.update(self.paths.link_flows(self.current_policy))
+        return link_flows
+
+    def get_policy_paths(self, policy=None):
+        """
+        Expand a policy (array of path IDs) back into {agent_id: link path}.
+        """
+        policy = self.current_policy if policy is None else policy
+        if policy is None:
+            return {}
+        return {agent.agent_id: self.paths.get_path(pid) for agent, pid in zip(self.vehicles, policy)}
@@ -1,38 +1,72 @@
 
 import csv
+
+import numpy as np
+import pandas as pd
 from network_classes import Node, Link, Network
 from demand_classes import DemandSet
 from collections import defaultdict
+from python_3.network_cache import load_cached_arrays, network_cache_key as _cache_key
+
+CACHE_FORMAT = 1
+CACHE_NAMESPACE = f"rl-network-v{CACHE_FORMAT}"  # keeps this loader's entries apart in a shared cache folder
+
+NODE_COLUMNS = {'node_id': np.int64, 'zone_id': np.float64}
+LINK_COLUMNS = {'link_id': str, 'from_node_id': np.int64, 'to_node_id': np.int64, 'vdf_length_mi': np.float64,
+                'lanes': np.float64, 'capacity': np.float64, 'vdf_free_speed_mph': np.float64}
+
+
+def network_cache_key(node_file, link_file):
+    return _cache_key(node_file, link_file, CACHE_NAMESPACE)
+
+
+def _parse_network_arrays(node_file, link_file):
+    # only the columns used below, with fixed dtypes (skips geometry etc.)
+    node_df = pd.read_csv(node_file, usecols=lambda c: c in NODE_COLUMNS, dtype=NODE_COLUMNS)
+    link_df = pd.read_csv(link_file, usecols=list(LINK_COLUMNS), dtype=LINK_COLUMNS)
+    if 'zone_id' not in node_df:
+        node_df['zone_id'] = np.nan
+
+    return {
+        'node_id': node_df['node_id'].to_numpy(),
+        'zone_id': node_df['zone_id'].to_numpy(),
+        'link_id': link_df['link_id'].to_numpy(dtype=str),
+        'start_node': link_df['from_node_id'].to_numpy(),
+        'end_node': link_df['to_node_id'].to_numpy(),
+        'length': link_df['vdf_length_mi'].to_numpy(),
+        'travel_time': (link_df['vdf_length_mi'] / link_df['vdf_free_speed_mph']).to_numpy() * 60,  # in minutes
+        'capacity': (link_df['lanes'] * link_df['capacity']).to_numpy(),
+    }
 
-def load_network_from_csv(node_file, link_file):
+
+def load_network_arrays(node_file, link_file, cache_dir=None, use_cache=True):
+    """
+    Parsed node and link columns as numpy arrays. The arrays are cached as .npy files in
+    cache_dir/<hash of both files> (default: .network_cache next to the link file) and
+    memory-mapped on later calls with unchanged files.
+    """
+    return load_cached_arrays(node_file, link_file, _parse_network_arrays, CACHE_NAMESPACE,
+                              cache_dir=cache_dir, use_cache=use_cache)
+
+
+def load_network_from_csv(node_file, link_file, cache_dir=None, use_cache=True):
     net = Network()
+    arrays = load_network_arrays(node_file, link_file, cache_dir=cache_dir, use_cache=use_cache)
 
     # Load nodes
-    with open(node_file, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            node_id = int(row['node_id'])
-            zone_id = int(row['zone_id']) if 'zone_id' in row and row['zone_id'] else None
-            net.add_node(Node(node_id=node_id, zone_id=zone_id))
+    for node_id, zone_id in zip(arrays['node_id'].tolist(), arrays['zone_id'].tolist()):
+        net.add_node(Node(node_id=node_id, zone_id=int(zone_id) if zone_id == zone_id else None))
 
     # Load links
-    with open(link_file, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            link_id = row['link_id']
-            start = int(row['from_node_id'])
-            end = int(row['to_node_id'])
-            length = float(row['vdf_length_mi'])
-            lanes = float(row['lanes'])
-            cap_per_lane = float(row['capacity'])
-            speed = float(row['vdf_free_speed_mph'])
-            travel_time = (length / speed) * 60  # in minutes
-            attributes = {
-                'length': length,
-                'travel_time': travel_time,
-                'capacity': lanes * cap_per_lane
-            }
-            net.add_link(Link(link_id, start, end, attributes))
+    for link_id, start, end, length, travel_time, capacity in zip(
+            arrays['link_id'].tolist(), arrays['start_node'].tolist(), arrays['end_node'].tolist(),
+            arrays['length'].tolist(), arrays['travel_time'].tolist(), arrays['capacity'].tolist()):
+        attributes = {
+            'length': length,
+            'travel_time': travel_time,
+            'capacity': capacity
+        }
+        net.add_link(Link(link_id, start, end, attributes))
 
     return net
 
@@ -0,0 +1,90 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from network_classes import Network
+
+
+class PathRegistry:
+    """
+    Hash-consed store of link paths.
+
+    Every distinct path gets a stable integer ID and a row in a sparse
+    path-link incidence matrix, so policies can be kept as arrays of path IDs
+    and path costs / link flows become matrix products instead of per-vehicle loops.
+    """
+    def __init__(self, net: Network):
+        self.net = net
+        self.link_ids = list(net.links)
+        self.link_index = {lid: i for i, lid in enumerate(self.link_ids)}
+
+        self.path_ids = {}  # tuple(path) -> path_id
+        self.paths = []     # path_id -> tuple(path)
+
+        # incidence entries, appended as paths are interned
+        self._rows = []
+        self._cols = []
+        self._incidence = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def intern(self, path):
+        """
+        Return the ID of 'path' (a sequence of link IDs), registering it if it is new.
+        """
+        key = tuple(path)
+        pid = self.path_ids.get(key)
+        if pid is None:
+            pid = len(self.paths)
+            self.path_ids[key] = pid
+            self.paths.append(key)
+            for lid in key:
+                self._rows.append(pid)
+                self._cols.append(self.link_index[lid])
+            self._incidence = None
+        return pid
+
+    def get_path(self, pid):
+        return list(self.paths[pid])
+
+    def path_str(self, pid):
+        return '->'.join(map(str, self.paths[pid]))
+
+    def incidence_matrix(self):
+        """
+        Sparse (n_paths x n_links) matrix; entry (p, l) counts how often path p uses link l.
+        Rebuilt lazily only when new paths were interned since the last call.
+        """
+        if self._incidence is None:
+            data = np.ones(len(self._rows), dtype=float)
+            self._incidence = csr_matrix((data, (self._rows, self._cols)),
+                                         shape=(len(self.paths), len(self.link_ids)))
+        return self._incidence
+
+    def link_attribute_vector(self, attr='travel_time', default=1.0):
+        return np.array([self.net.links[lid].attributes.get(attr, default) for lid in self.link_ids],
+                        dtype=float)
+
+    def path_costs(self, link_costs=None):
+        """
+        Cost of every registered path, i.e. incidence @ link_costs.
+        Defaults to the links' 'travel_time' attribute.
+        """
+        if link_costs is None:
+            link_costs = self.link_attribute_vector()
+        return self.incidence_matrix() @ link_costs
+
+    def path_counts(self, policy):
+        """
+        Number of vehicles on each registered path for a policy (array of path IDs).
+        """
+        return np.bincount(policy, minlength=len(self.paths)).astype(float)
+
+    def link_flow_vector(self, policy):
+        """
+        Link flows (one unit per vehicle) aligned with self.link_ids.
+        """
+        return self.incidence_matrix().T @ self.path_counts(policy)
+
+    def link_flows(self, policy):
+        flows = self.link_flow_vector(policy)
+        return {self.link_ids[i]: float(flows[i]) for i in np.flatnonzero(flows)}
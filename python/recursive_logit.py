@@ -4,7 +4,7 @@
 @author: mabbas10
 """
 
-import math
+import numpy as np
 from collections import defaultdict, deque
 from network_classes import Network
 from utility_func import UtilityFunction
@@ -32,42 +32,41 @@ class RecursiveLogitModel:
         Because we have a DAG, we can solve in reverse topological order of links.
         We'll store results in a dict: Vdest[link_id] = ...
         """
-        # For convenience, let's define a local dictionary:
-        Vdest = defaultdict(float)
+        Vd = self.compute_value_array(dest_id)
+        return defaultdict(float, zip(self.utility_func.link_ids, Vd.tolist()))
 
-        # 1) Mark the absorbing link's value as 0
-        Vdest[dest_id] = 0.0
-
-        # We'll need an ordering of links that ensures we process successors first.
-        # Easiest is to define our own link-level topological order:
-        link_topo = self.build_link_topo_sort()
-
-        # We'll walk link_topo in reverse
-        for lk in reversed(link_topo):
-            if lk == dest_id:
+    def compute_value_array(self, dest_id):
+        """
+        Same as compute_value_function, but returns an array aligned with utility_func.link_ids.
+        Uses the compiled pair utilities of the utility function.
+        """
+        uf = self.utility_func
+        pair_util = uf.pair_utilities(self.net)
+        ptr, pair_to, link_index = uf.pair_ptr, uf.pair_to, uf.link_index
+        dest = link_index[dest_id]
+
+        # links the topological order does not reach keep the default value 0
+        Vd = np.zeros(len(uf.link_ids))
+
+        # We walk the link-level topological order in reverse
+        for lk_id in reversed(self.build_link_topo_sort()):
+            lk = link_index[lk_id]
+            if lk == dest:
                 continue
-            successors = self.net.get_successor_links(lk)
-            if len(successors) == 0:
+            s, e = ptr[lk], ptr[lk + 1]
+            if s == e:
                 # If no successor links, treat as a dead-end (unless it's the absorbing link)
-                # You might set Vdest[lk] = -999999 or something to reflect no valid path
-                Vdest[lk] = float('-inf')
+                Vd[lk] = -np.inf
+                continue
+            # V(k) = mu * log( sum_{a in successors} exp( [v(a|k) + V(a)] / mu ) )
+            exponent = (pair_util[s:e] + Vd[pair_to[s:e]]) / self.mu
+            m = exponent.max()
+            if m == -np.inf:
+                Vd[lk] = -np.inf
             else:
-                # V(k) = mu * log( sum_{a in successors} exp( [v(a|k) + V(a)] / mu ) )
-                # Implementation detail: typically we factor out 1/mu
-                sum_exp = 0.0
-                for a in successors:
-                    v_ak = self.utility_func.compute_utility(self.net, lk, a)
-                    # exponent = (v_ak + Vdest[a]) / mu
-                    exponent = (v_ak + Vdest[a]) / self.mu
-                    sum_exp += math.exp(exponent)
-
-                if sum_exp <= 1e-300: 
-                    # to avoid log(0) issues
-                    Vdest[lk] = float('-inf')
-                else:
-                    Vdest[lk] = self.mu * math.log(sum_exp)
-
-        return Vdest
+                Vd[lk] = self.mu * (m + np.log(np.exp(exponent - m).sum()))
+
+        return Vd
 
     def build_link_topo_sort(self):
         """
@@ -117,42 +116,61 @@ class RecursiveLogitModel:
     def link_choice_probability(self, k, a, dest_id):
         """
         P_d(a|k) = exp( (v(a|k) + V_d(a)) / mu ) / sum_{a' in A(k)} ...
-        We'll compute it on-the-fly. 
-        For repeated queries, you might want to cache these probabilities as well.
+        Read from the cached pair probabilities of destination dest_id.
         """
-        Vd = self.get_value_function(dest_id)  # get or compute
-        successors = self.net.get_successor_links(k)
-        denom = 0.0
-        for a_prime in successors:
-            v_ap = self.utility_func.compute_utility(self.net, k, a_prime)
-            exponent = (v_ap + Vd[a_prime]) / self.mu
-            denom += math.exp(exponent)
-
-        v_ak = self.utility_func.compute_utility(self.net, k, a)
-        numerator = math.exp((v_ak + Vd[a]) / self.mu)
+        probs = self.get_pair_probabilities(dest_id)
+        p = self.utility_func.pair_index.get((k, a))
+        return float(probs[p]) if p is not None else 0.0
 
-        if denom < 1e-300:
-            return 0.0
-        else:
-            return numerator / denom
+    def get_pair_probabilities(self, dest_id):
+        """
+        Array of P_d(a|k) over all link pairs (order of utility_func.pair_from / pair_to).
+        Cached per destination.
+        """
+        if dest_id not in self.prob_cache:
+            uf = self.utility_func
+            Vd = self.get_value_function(dest_id)
+            V = np.array([Vd[lid] for lid in uf.link_ids])
+            exponent = (uf.pair_utilities(self.net) + V[uf.pair_to]) / self.mu
+            # logsumexp over the successors of each link k
+            n_links = len(uf.link_ids)
+            m = np.full(n_links, -np.inf)
+            np.maximum.at(m, uf.pair_from, exponent)
+            m_pair = m[uf.pair_from]
+            shifted = np.exp(exponent - np.where(np.isfinite(m_pair), m_pair, 0.0))
+            denom = np.bincount(uf.pair_from, weights=shifted, minlength=n_links)
+            denom_pair = denom[uf.pair_from]
+            self.prob_cache[dest_id] = np.where(denom_pair > 0, shifted / np.where(denom_pair > 0, denom_pair, 1.0), 0.0)
+        return self.prob_cache[dest_id]
 
     def get_choice_probabilities(self, dest_id):
         """
         Return a dictionary prob[k][a] = P_d(a|k).
         """
-        Vd = self.get_value_function(dest_id)
+        uf = self.utility_func
+        probs = self.get_pair_probabilities(dest_id)
         prob = defaultdict(dict)
-        for k in self.net.links:
-            succs = self.net.get_successor_links(k)
-            sum_exp = 0.0
-            exps = {}
-            for a in succs:
-                val = self.utility_func.compute_utility(self.net, k, a) + Vd[a]
-                exps[a] = math.exp(val / self.mu)
-                sum_exp += exps[a]
-            for a in succs:
-                if sum_exp < 1e-300:
-                    prob[k][a] = 0.0
-                else:
-                    prob[k][a] = exps[a] / sum_exp
+        for k, a, p in zip(uf.pair_from.tolist(), uf.pair_to.tolist(), probs.tolist()):
+            prob[uf.link_ids[k]][uf.link_ids[a]] = p
         return prob
+
+    def get_successor_scores(self, dest_id):
+        """
+        Return a dictionary scores[k] = (successor links a, v(a|k) + V_d(a), flow coefficients)
+        for every link k with successors, for rollouts that load the links as they go:
+        P_d(a|k) is proportional to exp((score + coefficient * flow(a)) / mu).
+        """
+        uf = self.utility_func
+        Vd = self.get_value_function(dest_id)
+        pair_util = uf.pair_utilities(self.net)
+        V = np.array([Vd[lid] for lid in uf.link_ids])
+        base = (pair_util + V[uf.pair_to]).tolist()
+        coefficients = uf.flow_coefficient[uf.pair_to].tolist()
+        successors = [uf.link_ids[a] for a in uf.pair_to.tolist()]
+        ptr = uf.pair_ptr.tolist()
+        scores = {}
+        for k, lid in enumerate(uf.link_ids):
+            s, e = ptr[k], ptr[k + 1]
+            if s < e:
+                scores[lid] = (successors[s:e], base[s:e], coefficients[s:e])
+        return scores
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Maximum-likelihood estimation of the recursive logit parameters from observed paths.
+
+With z_d(k) = exp(V_d(k) / mu) the value function of every destination is the solution
+of a sparse linear system (I - M_d) z_d = e_d, where M_d[k, a] = exp(v(a|k) / mu) with
+the row of the absorbing link d removed. The log-likelihood of an observed path
+k_0 -> ... -> d telescopes to
+
+    ln P = sum_t v(k_{t+1}|k_t) / mu - ln z_d(k_0),
+
+so the whole sample is evaluated from one factorization of I - M_0 (all destination
+rows removed), shared by all destinations through a Woodbury correction. The gradient
+solves the same factorization for d z_d / d beta.
+"""
+
+import csv
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.linalg import splu
+from scipy.optimize import minimize
+from path_registry import PathRegistry
+from recursive_logit import RecursiveLogitModel
+
+
+def load_observed_paths(agent_result_file, net, column='link_sequence'):
+    """
+    Read observed link paths from an agent result CSV.
+
+    Accepts the '->' separated sequences written by the python/ examples and the
+    space separated sequences written by python_3. Paths with fewer than two links
+    carry no route choice and are skipped.
+    """
+    paths = []
+    with open(agent_result_file, 'r') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            seq = (row.get(column) or '').strip()
+            if not seq:
+                continue
+            tokens = seq.split('->') if '->' in seq else seq.split()
+            path = [_match_link_id(tok.strip(), net) for tok in tokens]
+            if len(path) >= 2:
+                paths.append(path)
+    return paths
+
+
+def _match_link_id(token, net):
+    if token in net.links:
+        return token
+    for candidate in (str(int(float(token))), int(float(token))):
+        if candidate in net.links:
+            return candidate
+    raise KeyError(f"Observed link {token} is not in the network.")
+
+
+class RecursiveLogitEstimator:
+    """
+    Batched maximum-likelihood estimation of UtilityFunction.beta for a RecursiveLogitModel.
+    """
+    def __init__(self, rl_model: RecursiveLogitModel, cache_size=8):
+        self.rl_model = rl_model
+        self.net = rl_model.net
+        self.utility_func = rl_model.utility_func
+        self.mu = rl_model.mu
+
+        # theta.tobytes() -> (loglik, gradient); reused between line-search steps
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.n_factorizations = 0
+        self.n_cache_hits = 0
+
+    def set_observations(self, paths):
+        """
+        Register the observed paths (sequences of link IDs, last link = destination).
+        Identical paths are evaluated once and weighted by their count.
+        """
+        uf = self.utility_func
+        self.pair_x = uf.pair_features(self.net)  # (n_pairs x n_features)
+        n_links = len(uf.link_ids)
+        n_pairs = len(uf.pair_to)
+
+        registry = PathRegistry(self.net)
+        path_ids = np.array([registry.intern(p) for p in paths], dtype=np.int64)
+        self.path_counts = np.bincount(path_ids, minlength=len(registry)).astype(float)
+
+        rows, cols = [], []
+        origins, dests = [], []
+        for pid, path in enumerate(registry.paths):
+            for k, a in zip(path[:-1], path[1:]):
+                p = uf.pair_index.get((k, a))
+                if p is None:
+                    raise ValueError(f"Observed path uses links {k} -> {a}, which are not connected.")
+                rows.append(pid)
+                cols.append(p)
+            origins.append(uf.link_index[path[0]])
+            dests.append(uf.link_index[path[-1]])
+
+        # path x pair incidence; the feature sums along each path do not depend on beta
+        path_pairs = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(registry), n_pairs))
+        self.path_feature_sums = path_pairs @ self.pair_x
+
+        self.origins = np.array(origins, dtype=np.int64)
+        self.dest_links, self.path_dest = np.unique(np.array(dests, dtype=np.int64), return_inverse=True)
+        self.n_observations = len(paths)
+
+        # sums the pair terms of each link k: (n_links x n_pairs)
+        self._pair_to_link = csr_matrix((np.ones(n_pairs), (uf.pair_from, np.arange(n_pairs))),
+                                        shape=(n_links, n_pairs))
+        self._cache.clear()
+
+    # ------------------------------------------------------------------
+    # likelihood
+    # ------------------------------------------------------------------
+    def _evaluate(self, theta):
+        key = np.asarray(theta, dtype=float).tobytes()
+        if key in self._cache:
+            self.n_cache_hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        uf = self.utility_func
+        n_links = len(uf.link_ids)
+        D = len(self.dest_links)
+        n_feat = self.pair_x.shape[1]
+
+        m_pair = np.exp((self.pair_x @ theta) / self.mu)
+        dest_rows = np.zeros(n_links, dtype=bool)
+        dest_rows[self.dest_links] = True
+        m0 = np.where(dest_rows[uf.pair_from], 0.0, m_pair)
+        M0 = csr_matrix((m0, (uf.pair_from, uf.pair_to)), shape=(n_links, n_links))
+
+        lu = splu((identity(n_links, format='csc') - M0).tocsc())
+        self.n_factorizations += 1
+
+        # W = A0^-1 [e_d1 ... e_dD]; S[i, j] = m_di^T W[:, j]
+        E = np.zeros((n_links, D))
+        E[self.dest_links, np.arange(D)] = 1.0
+        W = lu.solve(E)
+        dest_pairs = [np.flatnonzero(uf.pair_from == d) for d in self.dest_links]
+        S = np.array([[m_pair[p] @ W[uf.pair_to[p], j] for j in range(D)] for p in dest_pairs]).reshape(D, D)
+
+        def woodbury(d, y):
+            # solve (A0 - sum_{d' != d} e_d' m_d'^T) x = b, given y = A0^-1 b (one or more columns)
+            others = [i for i in range(D) if i != d]
+            if not others:
+                return y
+            y2 = y.reshape(n_links, -1)
+            my = np.array([m_pair[dest_pairs[i]] @ y2[uf.pair_to[dest_pairs[i]]] for i in others])
+            corr = np.linalg.solve(np.eye(len(others)) - S[np.ix_(others, others)], my)
+            return (y2 + W[:, others] @ corr).reshape(y.shape)
+
+        Z = np.column_stack([woodbury(d, W[:, d]) for d in range(D)])
+
+        # d z_d / d theta_q = A_d^-1 ((M_d o X_q) z_d) / mu, all destinations and features in one solve
+        R = np.empty((n_links, D * n_feat))
+        for d in range(D):
+            m_d = np.where(dest_rows[uf.pair_from] & (uf.pair_from != self.dest_links[d]), m_pair, m0)
+            contrib = (m_d * Z[uf.pair_to, d])[:, None] * self.pair_x
+            R[:, d * n_feat:(d + 1) * n_feat] = self._pair_to_link @ contrib / self.mu
+        Y = lu.solve(R)
+        dZ = np.stack([woodbury(d, Y[:, d * n_feat:(d + 1) * n_feat]) for d in range(D)], axis=1)
+
+        z_o = Z[self.origins, self.path_dest]
+        if np.any(~np.isfinite(z_o)) or np.any(z_o <= 0.0):
+            result = (-np.inf, np.zeros(n_feat))
+        else:
+            dz_o = dZ[self.origins, self.path_dest, :]
+            ll_paths = self.path_feature_sums @ theta / self.mu - np.log(z_o)
+            grad_paths = self.path_feature_sums / self.mu - dz_o / z_o[:, None]
+            result = (float(self.path_counts @ ll_paths), self.path_counts @ grad_paths)
+
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def loglikelihood(self, theta):
+        return self._evaluate(theta)[0]
+
+    def gradient(self, theta):
+        return self._evaluate(theta)[1]
+
+    def _objective(self, theta):
+        ll, grad = self._evaluate(theta)
+        if not np.isfinite(ll):
+            return 1e300, np.zeros_like(theta)
+        # minimize the average negative log-likelihood
+        return -ll / self.n_observations, -grad / self.n_observations
+
+    def estimate(self, paths=None, beta0=None, method='BFGS', gtol=1e-6, maxiter=200):
+        """
+        Fit beta with a quasi-Newton method and store it in the model's utility function.
+
+        paths: observed link paths (see set_observations); optional if already registered.
+        beta0: starting dict of parameters; defaults to the current utility_func.beta.
+
+        Returns a dict with 'beta', 'loglik', 'std_err' (from the inverse Hessian
+        approximation), 'n_iterations', 'n_factorizations' and 'success'.
+        """
+        uf = self.utility_func
+        if beta0 is not None:
+            uf.beta.update(beta0)
+        if paths is not None:
+            self.set_observations(paths)
+
+        theta0 = uf.beta_vector()
+        res = minimize(self._objective, theta0, jac=True, method=method,
+                       options={'gtol': gtol, 'maxiter': maxiter})
+
+        uf.set_beta_vector(res.x)
+        self.rl_model.value_cache.clear()
+        self.rl_model.prob_cache.clear()
+
+        std_err = None
+        if hasattr(res, 'hess_inv'):
+            hess_inv = res.hess_inv.todense() if hasattr(res.hess_inv, 'todense') else res.hess_inv
+            std_err = np.sqrt(np.abs(np.diag(hess_inv)) / self.n_observations)
+
+        return {
+            'beta': dict(zip(uf.feature_names, res.x.tolist())),
+            'loglik': self.loglikelihood(res.x),
+            'std_err': None if std_err is None else dict(zip(uf.feature_names, std_err.tolist())),
+            'n_iterations': res.nit,
+            'n_factorizations': self.n_factorizations,
+            'success': bool(res.success),
+        }
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from network_classes import Network
+
+
+class ShortestPathService:
+    """
+    Shortest link paths over the link successor graph of a Network, cached per
+    (origin link, cost version).
+
+    Moving from link a to a successor link b costs the 'travel_time' of b, as in the
+    base policy search. update_costs() bumps the cost version only when the travel
+    times changed, which drops the cached trees. Trees are evicted least recently used
+    first beyond max_trees or memory_limit_mb.
+    """
+    def __init__(self, net: Network, max_trees=4096, memory_limit_mb=256):
+        self.net = net
+        self.link_ids = list(net.links)
+        self.link_index = {lid: i for i, lid in enumerate(self.link_ids)}
+        tails, heads = [], []
+        for lid in self.link_ids:
+            for succ_id in net.get_successor_links(lid):
+                tails.append(self.link_index[lid])
+                heads.append(self.link_index[succ_id])
+        self.tails = np.array(tails, dtype=np.int64)
+        self.heads = np.array(heads, dtype=np.int64)
+        self.max_trees = max_trees
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+
+        self.cost = None
+        self.version = 0
+        self.graph = None
+        self.trees = OrderedDict()  # (origin index, version) -> (distances, predecessors)
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def update_costs(self):
+        cost = np.array([self.net.links[lid].attributes.get('travel_time', 1.0) for lid in self.link_ids],
+                        dtype=float)
+        if self.cost is not None and np.array_equal(cost, self.cost):
+            return self.version
+        self.cost = cost
+        self.version += 1
+        n = len(self.link_ids)
+        self.graph = csr_matrix((cost[self.heads], (self.tails, self.heads)), shape=(n, n))
+        self.trees.clear()
+        self.memory = 0
+        return self.version
+
+    def tree(self, origin):
+        if self.cost is None:
+            self.update_costs()
+        key = (self.link_index[origin], self.version)
+        entry = self.trees.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.trees.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        distances, predecessors = dijkstra(self.graph, indices=key[0], return_predecessors=True)
+        entry = (distances, predecessors.astype(np.int32))
+        self.trees[key] = entry
+        self.memory += distances.nbytes + entry[1].nbytes
+        while len(self.trees) > 1 and (len(self.trees) > self.max_trees or self.memory > self.memory_limit):
+            _, (old_distances, old_predecessors) = self.trees.popitem(last=False)
+            self.memory -= old_distances.nbytes + old_predecessors.nbytes
+            self.evictions += 1
+        return entry
+
+    def path(self, origin, destination):
+        """Link IDs from origin to destination (both included); [] if there is no path."""
+        distances, predecessors = self.tree(origin)
+        i, start = self.link_index[destination], self.link_index[origin]
+        if i == start or not np.isfinite(distances[i]):
+            return []
+        path = [i]
+        while i != start:
+            i = int(predecessors[i])
+            path.append(i)
+        return [self.link_ids[i] for i in reversed(path)]
+
+    def hit_ratio(self):
+        queries = self.hits + self.misses
+        return self.hits / queries if queries else 0.0
@@ -4,18 +4,158 @@
 @author: mabbas10
 """
 
+import numpy as np
+from scipy.sparse import csr_matrix
 from network_classes import Network
+
+# beta key -> link attribute it multiplies (other keys use the attribute of the same name)
+LINK_FEATURE_ATTRIBUTES = {'time': 'travel_time', 'distance': 'length'}
+
+# Mean Field: BPR-like flow adjustment of travel time, t * (1 + 0.15 * flow / 100)
+FLOW_TIME_FACTOR = 0.15 / 100.0
+
+
 class UtilityFunction:
     """
     Encapsulates how to compute the deterministic part of utility for choosing link a
     from the current link k.
+
+    The utility is linear in the parameters: v(a|k) = x(a|k) . beta. On first use with a
+    network the link attributes are compiled into a feature matrix (links x features) and
+    every link pair (k, a) with a starting where k ends gets an index, so the utilities of
+    all pairs are a single matrix-vector product. Turn-dependent features are given as
+    sparse link-pair values.
     """
-    def __init__(self, beta):
+    def __init__(self, beta, turn_features=None):
         """
-        beta: a dict or list of parameters, e.g. { 'time': -0.01, 'distance': -0.05, ... }
-        or a direct numpy array.
+        beta: a dict of parameters, e.g. { 'time': -0.01, 'distance': -0.05, 'left_turn': -0.3 }.
+        turn_features: optional dict { feature_name: {(k_id, a_id): value} } for features that
+                       depend on the link pair rather than on the next link alone.
         """
         self.beta = beta
+        self.turn_features = turn_features if turn_features else {}
+
+        self._net = None
+        self._n_links = 0
+        self._beta_snapshot = None
+
+    # ------------------------------------------------------------------
+    # compilation
+    # ------------------------------------------------------------------
+    def compile(self, net: Network):
+        """
+        Build the link feature matrix and the link-pair (k, a) index for 'net'.
+        """
+        self.link_ids = list(net.links)
+        self.link_index = {lid: i for i, lid in enumerate(self.link_ids)}
+        self.link_feature_names = [name for name in self.beta if name not in self.turn_features]
+        self.turn_feature_names = [name for name in self.beta if name in self.turn_features]
+
+        n_links = len(self.link_ids)
+        self.link_features = np.zeros((n_links, len(self.link_feature_names)))
+        for j, name in enumerate(self.link_feature_names):
+            attr = LINK_FEATURE_ATTRIBUTES.get(name, name)
+            self.link_features[:, j] = [net.links[lid].attributes.get(attr, 0.0) for lid in self.link_ids]
+        self.base_time = np.array([net.links[lid].attributes.get('travel_time', 0.0) for lid in self.link_ids])
+
+        # link pairs in CSR order: successors of link k are pair_to[pair_ptr[k]:pair_ptr[k+1]]
+        pair_ptr = [0]
+        pair_to = []
+        for lid in self.link_ids:
+            pair_to.extend(self.link_index[a] for a in net.get_successor_links(lid))
+            pair_ptr.append(len(pair_to))
+        self.pair_ptr = np.array(pair_ptr, dtype=np.int64)
+        self.pair_to = np.array(pair_to, dtype=np.int64)
+        self.pair_from = np.repeat(np.arange(n_links), np.diff(self.pair_ptr))
+        self.pair_index = {(self.link_ids[k], self.link_ids[a]): p
+                           for p, (k, a) in enumerate(zip(self.pair_from, self.pair_to))}
+
+        rows, cols, vals = [], [], []
+        for j, name in enumerate(self.turn_feature_names):
+            for (k_id, a_id), value in self.turn_features[name].items():
+                p = self.pair_index.get((k_id, a_id))
+                if p is not None:
+                    rows.append(p)
+                    cols.append(j)
+                    vals.append(value)
+        self.turn_matrix = csr_matrix((vals, (rows, cols)),
+                                      shape=(len(self.pair_to), len(self.turn_feature_names)))
+
+        self._net = net
+        self._n_links = len(net.links)
+        self._beta_snapshot = None
+        self._refresh_utilities()
+
+    def _refresh_utilities(self):
+        self._beta_snapshot = dict(self.beta)
+        self.beta_link = np.array([self.beta[name] for name in self.link_feature_names], dtype=float)
+        self.beta_turn = np.array([self.beta[name] for name in self.turn_feature_names], dtype=float)
+        self.link_utility = self.link_features @ self.beta_link
+        self.turn_utility = self.turn_matrix @ self.beta_turn
+        self.flow_coefficient = self.beta.get('time', 0.0) * self.base_time * FLOW_TIME_FACTOR
+
+    def _ensure_compiled(self, net: Network):
+        if net is not self._net or len(net.links) != self._n_links:
+            self.compile(net)
+        elif self._beta_snapshot != self.beta:
+            self._refresh_utilities()
+
+    @property
+    def feature_names(self):
+        return self.link_feature_names + self.turn_feature_names
+
+    def beta_vector(self):
+        return np.array([self.beta[name] for name in self.feature_names], dtype=float)
+
+    def set_beta_vector(self, theta):
+        for name, value in zip(self.feature_names, theta):
+            self.beta[name] = float(value)
+
+    def pair_features(self, net: Network):
+        """
+        Dense (n_pairs x n_features) matrix x(a|k), columns ordered as self.feature_names.
+        """
+        self._ensure_compiled(net)
+        return np.hstack([self.link_features[self.pair_to], self.turn_matrix.toarray()])
+
+    # ------------------------------------------------------------------
+    # evaluation
+    # ------------------------------------------------------------------
+    def _flow_vector(self, link_flows):
+        return np.array([link_flows.get(lid, 0.0) for lid in self.link_ids], dtype=float)
+
+    def link_utilities(self, net: Network, link_flows=None):
+        """
+        Array of the link-only part of v(a|.) for every link a, ordered as self.link_ids.
+        """
+        self._ensure_compiled(net)
+        if link_flows is None:
+            return self.link_utility
+        return self.link_utility + self.flow_coefficient * self._flow_vector(link_flows)
+
+    def pair_utilities(self, net: Network, link_flows=None):
+        """
+        Array of v(a|k) for every link pair, in the order of self.pair_from / self.pair_to.
+        """
+        return self.link_utilities(net, link_flows)[self.pair_to] + self.turn_utility
+
+    def batch_utility(self, net: Network, k_ids, a_ids, link_flows=None):
+        """
+        Vectorized v(a|k) for sequences of (k, a); a scalar k_id is broadcast over a_ids.
+        """
+        self._ensure_compiled(net)
+        a_idx = np.array([self.link_index[a] for a in a_ids], dtype=np.int64)
+        v = self.link_utility[a_idx]
+        if link_flows is not None:
+            flows = np.array([link_flows.get(a, 0.0) for a in a_ids], dtype=float)
+            v = v + self.flow_coefficient[a_idx] * flows
+        if self.turn_feature_names:
+            if np.isscalar(k_ids):
+                k_ids = [k_ids] * len(a_idx)
+            turn = [self.turn_utility[self.pair_index[(k, a)]] if (k, a) in self.pair_index else 0.0
+                    for k, a in zip(k_ids, a_ids)]
+            v = v + np.array(turn)
+        return v
 
     def compute_utility(self, net: Network, k_id, a_id, link_flows=None):
         """
@@ -23,29 +163,15 @@ class UtilityFunction:
         k_id: ID of current link (the 'state')
         a_id: ID of next link (the 'action')
 
-        Return the deterministic portion of utility v(a|k).
-        This is typically sum of (beta_i * attribute_i).
+        Return the deterministic portion of utility v(a|k) from the compiled arrays.
         """
-        link_obj = net.links[a_id]
-        # example: link travel time
-        base_time = link_obj.attributes.get('travel_time', 0.0)
-        distance_ = link_obj.attributes.get('length', 0.0)
-
-        # Mean Field: adjust travel time based on flow
+        self._ensure_compiled(net)
+        a = self.link_index[a_id]
+        v = self.link_utility[a]
         if link_flows is not None:
-            flow = link_flows.get(a_id, 0.0)
-            time_ = base_time * (1 + 0.15 * (flow / 100.0))  # BPR-like adjustment
-        else:
-            time_ = base_time
-        
-        # Suppose we do a simple linear combination:
-        # v(a|k) = beta_time * time + beta_dist * distance
-        v = 0.0
-        if 'time' in self.beta:
-            v += self.beta['time'] * time_
-        if 'distance' in self.beta:
-            v += self.beta['distance'] * distance_
-        
-        # If we needed turn-based attributes, we would also look up net.links[k_id].
-        
-        return v
+            v += self.flow_coefficient[a] * link_flows.get(a_id, 0.0)
+        if self.turn_feature_names:
+            p = self.pair_index.get((k_id, a_id))
+            if p is not None:
+                v += self.turn_utility[p]
+        return float(v)
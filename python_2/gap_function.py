@@ -1,41 +1,36 @@
 import networkx as nx
+from python_3.shortest_path_cache import ShortestPathService
 
-def compute_max_path_gap(G, agents):
+def compute_max_path_gap(G, agents, paths=None):
     """
     Compute the maximum path gap across all agents.
 
     Args:
         G (nx.DiGraph): Network graph (with current travel times).
         agents (list): List of agent path dictionaries from rollout.
+        paths (ShortestPathService, optional): Shared tree cache; reused across calls
+            while the travel times are unchanged.
 
     Returns:
         max_gap (float): Maximum gap (assigned - shortest path cost).
-        avg_gap (float): Average gap across all agents.
+        avg_gap (float): Average gap across all agents, weighted by their volume (vehicles).
     """
     max_gap = 0.0
     total_gap = 0.0
-    valid_agents = 0
+    total_volume = 0.0
 
-    # Use current travel time
-    travel_time_attr = {
-        (u, v): attr.get('current_travel_time', attr['free_flow_travel_time'])
-        for u, v, attr in G.edges(data=True)
-    }
+    # Use current travel time; one shortest path tree per origin
+    if paths is None:
+        paths = ShortestPathService(G)
+    paths.update_costs()
 
     for agent in agents:
         origin = agent['o_zone_id']
         destination = agent['d_zone_id']
         assigned_cost = agent['path_travel_time']
 
-        try:
-            # Compute shortest path cost using current travel times
-            shortest_path_length = nx.shortest_path_length(
-                G,
-                source=origin,
-                target=destination,
-                weight=lambda u, v, d: d.get('current_travel_time', d['free_flow_travel_time'])
-            )
-        except nx.NetworkXNoPath:
+        shortest_path_length = paths.distance(origin, destination)
+        if shortest_path_length == float('inf'):
             print(f"Warning: No path found for agent {agent['agent_id']} from {origin} to {destination}")
             continue
 
@@ -43,11 +38,48 @@ def compute_max_path_gap(G, agents):
         if gap < 0:
             gap = 0  # Numerical tolerance: assigned might be slightly better due to rounding
 
-        total_gap += gap
+        volume = agent.get('volume', 1)
+        total_gap += gap * volume
         if gap > max_gap:
             max_gap = gap
-        valid_agents += 1
+        total_volume += volume
 
-    avg_gap = total_gap / valid_agents if valid_agents > 0 else 0.0
+    avg_gap = total_gap / total_volume if total_volume > 0 else 0.0
 
     return max_gap, avg_gap
+
+
+def compute_expected_od_gap(G, od_table, od_travel_times, paths=None):
+    """
+    Path gap of an expected-flow loading: expected OD travel time minus shortest path cost.
+
+    Args:
+        G (nx.DiGraph): Network graph (with current travel times).
+        od_table (dict): {(origin, destination): volume}.
+        od_travel_times (dict): {(origin, destination): expected travel time} from the loading.
+        paths (ShortestPathService, optional): Shared tree cache (see compute_max_path_gap).
+
+    Returns:
+        max_gap (float): Maximum gap over the OD pairs.
+        avg_gap (float): Volume-weighted average gap.
+    """
+    max_gap = 0.0
+    total_gap = 0.0
+    total_volume = 0.0
+
+    if paths is None:
+        paths = ShortestPathService(G)
+    paths.update_costs()
+    for (origin, destination), volume in od_table.items():
+        shortest = paths.distance(origin, destination)
+        if shortest == float('inf'):
+            print(f"Warning: No path found from {origin} to {destination}")
+            continue
+
+        gap = max(od_travel_times[(origin, destination)] - shortest, 0)
+        max_gap = max(max_gap, gap)
+        total_gap += gap * volume
+        total_volume += volume
+
+    avg_gap = total_gap / total_volume if total_volume > 0 else 0.0
+    return max_gap, avg_gap
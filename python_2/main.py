@@ -6,6 +6,8 @@ from python_3.demand_loader import load_demand
 from python_3.value_function_solver import solve_value_function
 from path_assignment import assign_initial_paths
 from one_step_rollout import run_one_step_multiagent_rollout
+from python_3.active_agents import ActiveAgents
+from python_3.rng_streams import RolloutStreams
 from python_3.results_exporter import export_agent_results, export_link_performance
 
 
@@ -22,7 +24,7 @@ def main():
 
     G = load_network(node_file, link_file)
 
-    agents, destination_zones = load_demand(demand_file)
+    agents, destination_zones = load_demand(demand_file, packet_size=packet_size)
 
     # === Step 1: Initialize Costs ===
     initialize_link_travel_times(G)
@@ -38,6 +40,8 @@ def main():
 
     link_flows = {attr['link_id']: 0 for _, _, attr in G.edges(data=True)}
     system_travel_time_history = []
+    active_agents = ActiveAgents(agents)
+    streams = RolloutStreams(random_seed)
     outer_iter = 0
 
     # === Step 4: Outer Rollout Iterations ===
@@ -47,7 +51,8 @@ def main():
         print(f"\n=== Rollout Iteration {outer_iter + 1} ===")
 
         # One-step rollout per agent
-        completed_count = run_one_step_multiagent_rollout(G, agents, link_flows, value_function_dict, greedy=False, mu=mu, random_seed=random_seed)
+        completed_count = run_one_step_multiagent_rollout(G, agents, link_flows, value_function_dict, greedy=False, mu=mu, active=active_agents,
+                                                           streams=streams)
 
         if completed_count == len(agents):
             print(f"\n All agents completed their trips by iteration {outer_iter + 1}.")
@@ -2,18 +2,27 @@ import os
 import numpy as np
 from python_3.config import *
 from python_3.network_loader import load_network
-from python_3.demand_loader import load_demand
+from python_3.demand_loader import load_demand, load_od_table
 from python_3.value_function_solver import solve_value_function
 from stochastic_multi_agent_rollout import multi_agent_rollout
-from python_3.helper_functions import update_link_travel_times, aggregate_agent_link_flows
+from python_3.utils import update_link_travel_times, aggregate_agent_link_flows
 from python_3.results_exporter import export_agent_results, export_link_performance
-from gap_function import compute_max_path_gap
+from gap_function import compute_max_path_gap, compute_expected_od_gap
+from python_3.expected_flow_loading import expected_network_loading
+from python_3.cohort_rollout import cohort_multi_agent_rollout
+from python_3.rng_streams import RolloutStreams
+from python_3.shortest_path_cache import ShortestPathService
+from python_3.contraction_hierarchy import ContractionHierarchy
+from python_3.path_set_choice import PathSet
 
 
 def main():
     # Load network and demand
     G = load_network(node_file, link_file)
-    agents, destination_zones = load_demand(demand_file)
+    if loading_method == 'expected':
+        od_table, destination_zones = load_od_table(demand_file)
+    else:
+        agents, destination_zones = load_demand(demand_file, packet_size=packet_size)
 
     # Initialize free-flow travel times as current travel times
     for u, v, attr in G.edges(data=True):
@@ -21,19 +30,37 @@ def main():
 
     system_travel_time_history = []
     last_link_flows = None
+    streams = RolloutStreams(random_seed)
+    cohort_rng = np.random.default_rng(random_seed)
+    paths = ShortestPathService(G, hierarchy=ContractionHierarchy(G) if shortest_path_backend == 'cch' else None)
+    if loading_method == 'path_set':
+        od_pairs = dict.fromkeys((agent['origin_node'], agent['destination_node']) for agent in agents)
+        path_set = PathSet(G, od_pairs, method=path_set_method, k=path_set_size)
+        print(f"Path set: {len(path_set.path_links)} paths for {len(path_set.od_pairs)} OD pairs")
 
     for outer_iter in range(max_outer_iterations):
         print(f"=== Outer Iteration {outer_iter+1} ====================================================")
 
-        # Step 1: Solve value functions for each destination
+        # Step 1: Solve value functions for each destination (not used by the path set choice)
         value_function_dict = {}
-        for dest_zone in destination_zones:
+        for dest_zone in destination_zones if loading_method != 'path_set' else []:
             value_function = solve_value_function(G, dest_zone)
             value_function_dict[dest_zone] = value_function
 
-        # Step 2: Multi-agent rollout based on current value functions
-        # agent_paths, new_link_flows = multi_agent_rollout(G, agents, value_function_dict)
-        agent_paths, new_link_flows = multi_agent_rollout(G, agents, value_function_dict, mu=0.1, random_seed=42)
+        # Step 2: Network loading based on current value functions
+        if loading_method == 'expected':
+            # expected flows of the same logit choices, no sampling
+            loading = expected_network_loading(G, od_table, value_function_dict, mu=0.1)
+            new_link_flows = loading['link_flows']
+        elif loading_method == 'cohort':
+            # same sampling distribution, one multinomial draw per cohort
+            agent_paths, new_link_flows = cohort_multi_agent_rollout(G, agents, value_function_dict, mu=0.1, rng=cohort_rng)
+        elif loading_method == 'path_set':
+            # path-size logit over the fixed path set, no value functions needed
+            agent_paths, new_link_flows = path_set.sample_agent_paths(agents, cohort_rng, mu=mu, beta=path_size_beta)
+        else:
+            # agent_paths, new_link_flows = multi_agent_rollout(G, agents, value_function_dict)
+            agent_paths, new_link_flows = multi_agent_rollout(G, agents, value_function_dict, mu=0.1, streams=streams)
 
         # Step 3: Relaxation (flow averaging)
         if last_link_flows is None:
@@ -75,13 +102,20 @@ def main():
         # Update last_link_flows for next iteration
         last_link_flows = relaxed_link_flows.copy()
         # Compute UE condition
-        max_gap, avg_gap = compute_max_path_gap(G, agent_paths)
+        if loading_method == 'expected':
+            max_gap, avg_gap = compute_expected_od_gap(G, od_table, loading['od_travel_times'], paths=paths)
+        else:
+            max_gap, avg_gap = compute_max_path_gap(G, agent_paths, paths=paths)
         print(f"Max Path Gap: {max_gap:.6f} minutes, Avg Path Gap: {avg_gap:.6f} minutes")
 
     # Final step: Export final results
-    export_agent_results(agent_paths, agent_result_file)
-    export_link_performance(G, new_link_flows, link_performance_file)
-    aggregate_agent_link_flows(agent_result_file, agent_link_flow_output)
+    if loading_method != 'expected':
+        export_agent_results(agent_paths, agent_result_file)
+    for _, _, attr in G.edges(data=True):
+        attr['flow'] = new_link_flows.get(attr['link_id'], 0)
+    export_link_performance(G, link_performance_file)
+    if loading_method != 'expected':
+        aggregate_agent_link_flows(agent_result_file, agent_link_flow_output)
 
     np.savetxt(os.path.join(data_path, "multiagent_system_travel_time.csv"), system_travel_time_history, delimiter=",")
 
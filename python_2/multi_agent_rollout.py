@@ -70,7 +70,7 @@ def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict):
             total_free_flow_time += best_edge_attr['free_flow_travel_time']
 
             # Update flow
-            link_flows[best_edge_attr['link_id']] += 1
+            link_flows[best_edge_attr['link_id']] += agent.get('volume', 1)
 
             # Move forward
             current_node = best_successor
@@ -81,6 +81,7 @@ def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict):
             'agent_id': agent['agent_id'],
             'o_zone_id': agent['origin_node'],
             'd_zone_id': agent['destination_node'],
+            'volume': agent.get('volume', 1),
             'path_length': len(path_links),
             'path_travel_time': total_travel_time,
             'path_free_flow_travel_time': total_free_flow_time,
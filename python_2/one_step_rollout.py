@@ -1,7 +1,10 @@
 import numpy as np
-from python_3.helper_functions import softmax, update_link_cost_bpr  # assumes you have a softmax utility
+from python_3.utils import softmax, update_link_cost_bpr  # assumes you have a softmax utility
+from python_3.active_agents import ActiveAgents
+from python_3.rng_streams import sample_index
 
-def run_one_step_multiagent_rollout(G, agents, link_flows, value_function_dict, greedy=False, mu=0.1, random_seed=None):
+def run_one_step_multiagent_rollout(G, agents, link_flows, value_function_dict, greedy=False, mu=0.1, random_seed=None,
+                                    active=None, streams=None):
     """
     Performs one-step rollout per agent in random order, allowing agents to deviate from assigned path.
 
@@ -10,24 +13,35 @@ def run_one_step_multiagent_rollout(G, agents, link_flows, value_function_dict,
     - agents: List of agent dicts with path, position, etc.
     - value_function_dict: Map from destination to node-wise value function.
     - mu: Softmax temperature.
+    - active: ActiveAgents for agents, kept across calls so that only unfinished agents are swept.
+    - streams: RolloutStreams; when given, the sweep order and each agent's draw come from per-step
+      streams (reproducible for any agent order or split) instead of the global numpy RNG.
 
     Returns:
-    - None (agents and G are modified in-place).
+    - completed_count: Number of agents that reached their destination (agents and G are modified in-place).
     """
 
     if random_seed is not None:
         np.random.seed(random_seed)
 
-    agent_indices = np.random.permutation(len(agents))
-    completed_count = 0
-    for idx in agent_indices:
+    if active is None:
+        active = ActiveAgents(agents)
+
+    if streams is None:
+        agent_indices = active.order()
+        uniforms = None
+    else:
+        step = streams.next_step()
+        # draws only for the active agents; positions keep them aligned with the visiting order
+        order = streams.permutation(step, len(active.indices))
+        agent_indices = active.indices[order]
+        uniforms = streams.uniforms_at(step, active.indices)[order]
+
+    for k, idx in enumerate(agent_indices):
         agent = agents[idx]
         aid = agent['agent_id']
         curr = agent['current_position']
         dest = agent['destination_node']
-        if curr == dest:
-            completed_count += 1
-            continue
 
         V = value_function_dict[dest]
         candidates = []
@@ -50,7 +64,10 @@ def run_one_step_multiagent_rollout(G, agents, link_flows, value_function_dict,
         else:
             # Softmax sampling
             probs = softmax(np.array(scores) / mu)
-            selected_idx = np.random.choice(len(candidates), p=probs)
+            if uniforms is None:
+                selected_idx = np.random.choice(len(candidates), p=probs)
+            else:
+                selected_idx = sample_index(probs, uniforms[k])
 
 
         from_node, to_node = candidates[selected_idx]
@@ -60,15 +77,20 @@ def run_one_step_multiagent_rollout(G, agents, link_flows, value_function_dict,
         agent['traveled_path'].append(link_id)
         agent['current_position'] = to_node
 
-        # Update flows
-        G[from_node][to_node]['flow'] += 1
-        link_flows[link_id] += 1
+        # Update flows (by the vehicles the agent carries)
+        volume = agent.get('volume', 1)
+        G[from_node][to_node]['flow'] += volume
+        link_flows[link_id] += volume
         if agent['previous_link_id'] is not None:
             prev_from, prev_to = agent['previous_link_id']
-            G[prev_from][prev_to]['flow'] -= 1
+            G[prev_from][prev_to]['flow'] -= volume
         agent['previous_link_id'] = (from_node, to_node)
 
         # Update travel time using BPR
         update_link_cost_bpr(G, from_node, to_node)
 
-    return completed_count
\ No newline at end of file
+        if to_node == dest:
+            active.finish(idx)
+
+    active.compact()
+    return active.completed
\ No newline at end of file
@@ -1,5 +1,6 @@
 import networkx as nx
 import heapq
+from python_3.next_hop import NextHopTable
 
 def assign_initial_paths(G, agents, value_function_dict, method='shortest_path'):
     """
@@ -15,37 +16,21 @@ def assign_initial_paths(G, agents, value_function_dict, method='shortest_path')
     Returns:
     - agents: Modified with assigned 'path' (link sequence), 'current_position', and path memory.
     """
+    if method == 'shortest_path':
+        # Greedy forward assignment using V; next hops are computed once per destination
+        next_hops = NextHopTable(G).update_all(value_function_dict)
+    else:
+        raise NotImplementedError(f"Assignment method '{method}' not implemented yet.")
+
     for agent in agents:
         origin = agent['origin_node']
         dest = agent['destination_node']
-        V = value_function_dict[dest]
-
-        if method == 'shortest_path':
-            # Dijkstra-like greedy forward assignment using V
-            current = origin
-            path_links = []
-            while current != dest:
-                successors = list(G.successors(current))
-                if not successors:
-                    break
-                best_next = None
-                best_score = float('-inf')
-                for succ in successors:
-                    score = -G[current][succ]['current_travel_time'] + V.get(succ, float('-inf'))
-                    if score > best_score:
-                        best_score = score
-                        best_next = succ
-                if best_next is None:
-                    break
-                path_links.append(G[current][best_next]['link_id'])
-                current = best_next
 
-            agent['path'] = path_links
-            agent['traveled_path'] = []
-            agent['current_position'] = origin
-            agent['previous_link_id'] = None
+        path_links = [G[u][v]['link_id'] for u, v in next_hops.path(origin, dest)]
 
-        else:
-            raise NotImplementedError(f"Assignment method '{method}' not implemented yet.")
+        agent['path'] = path_links
+        agent['traveled_path'] = []
+        agent['current_position'] = origin
+        agent['previous_link_id'] = None
 
     return agents
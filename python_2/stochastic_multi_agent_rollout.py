@@ -1,16 +1,19 @@
 import networkx as nx
 import numpy as np
 
-def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict, mu=0.1, random_seed=None):
+def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict, mu=0.1, random_seed=None,
+                        streams=None):
     """
     Perform stochastic multi-agent rollout based on destination-specific value functions.
 
     Args:
         G (nx.DiGraph): Network graph.
-        agents (list): List of agent dictionaries.
+        agents (list): List of agent dictionaries (optional 'volume': vehicles carried, default 1).
         value_function_dict (dict): {destination_zone: value_function dictionary}.
         mu (float): Softmax temperature parameter (smaller = more greedy).
         random_seed (int, optional): Random seed for reproducibility.
+        streams (RolloutStreams, optional): Gives every agent its own generator for this call,
+            so paths do not depend on the order (or split) in which agents are processed.
 
     Returns:
         agent_paths (list): List of agent path dictionaries.
@@ -19,10 +22,12 @@ def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict,
     if random_seed is not None:
         np.random.seed(random_seed)
 
+    step = streams.next_step() if streams is not None else None
+
     agent_paths = []
     link_flows = {attr['link_id']: 0 for _, _, attr in G.edges(data=True)}
 
-    for agent in agents:
+    for agent_index, agent in enumerate(agents):
         origin = agent['origin_node']
         destination_zone = agent['destination_node']
 
@@ -37,6 +42,8 @@ def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict,
         total_free_flow_time = 0.0
 
         current_node = origin
+        volume = agent.get('volume', 1)
+        rng = streams.agent_generator(agent_index, step) if streams is not None else np.random
 
         while current_node != destination_zone:
             successors = list(G.successors(current_node))
@@ -66,7 +73,7 @@ def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict,
             probs = exp_scores / np.sum(exp_scores)
 
             # Randomly sample next move
-            idx = np.random.choice(len(candidates), p=probs)
+            idx = rng.choice(len(candidates), p=probs)
             next_node, next_edge_data = candidates[idx]
 
             # Record path
@@ -76,7 +83,7 @@ def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict,
             total_travel_time += next_edge_data.get('current_travel_time', next_edge_data['free_flow_travel_time'])
             total_free_flow_time += next_edge_data['free_flow_travel_time']
 
-            link_flows[next_edge_data['link_id']] += 1
+            link_flows[next_edge_data['link_id']] += volume
 
             current_node = next_node
 
@@ -86,6 +93,7 @@ def multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict,
             'agent_id': agent['agent_id'],
             'o_zone_id': agent['origin_node'],
             'd_zone_id': agent['destination_node'],
+            'volume': volume,
             'path_length': len(path_links),
             'path_travel_time': total_travel_time,
             'path_free_flow_travel_time': total_free_flow_time,
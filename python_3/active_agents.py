@@ -0,0 +1,36 @@
+import numpy as np
+
+
+class ActiveAgents:
+    """
+    Indices of the agents that have not reached their destination yet.
+
+    The rollout sweeps only over these; agents that arrive during a sweep are reported
+    with finish() and dropped from the index set by compact() at the end of the sweep,
+    so later sweeps cost O(unfinished agents). completed is a running count of arrivals.
+    """
+
+    def __init__(self, agents):
+        self.agents = agents
+        self.indices = np.array(
+            [i for i, agent in enumerate(agents) if agent['current_position'] != agent['destination_node']],
+            dtype=np.int64,
+        )
+        self.completed = len(agents) - len(self.indices)
+        self._finished = []
+
+    def __len__(self):
+        return len(self.indices)
+
+    def order(self):
+        """Active indices in a random order (uses the global numpy RNG)."""
+        return np.random.permutation(self.indices)
+
+    def finish(self, idx):
+        self._finished.append(idx)
+        self.completed += 1
+
+    def compact(self):
+        if self._finished:
+            self.indices = np.setdiff1d(self.indices, self._finished, assume_unique=True)
+            self._finished = []
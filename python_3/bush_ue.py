@@ -0,0 +1,344 @@
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+FLOW_EPS = 1e-12
+USED_SHARE = 1e-9  # origin flows below this share of the origin's demand do not count as used
+
+
+class BushUE:
+    """
+    Origin-based user equilibrium (Algorithm B, Dial 2006).
+
+    Every origin r keeps a bush: an acyclic set of links carrying all of r's flow,
+    stored as rows of two origins x links arrays (bush mask and origin link flows), plus
+    a topological order of the nodes. One pass over an origin
+
+      1. computes, in topological order, the shortest path label L and the longest path
+         label U of every node over the bush (and the longest path over links with flow);
+      2. drops unused bush links that are not on the shortest path tree and adds links
+         (i, j) with U_i + t_ij < U_j. Such links go from lower to higher U, so the nodes
+         sorted by U stay a topological order and the bush stays acyclic;
+      3. in reverse topological order, moves flow at every node from the longest used
+         path to the shortest path, over the segments where the two differ, by the
+         Newton step (cost difference / sum of the BPR derivatives), limited by the
+         smallest flow on the longer segment.
+
+    Origins are processed one after another with the link costs updated after every
+    shift. save() and warm_start() keep the bushes between runs.
+    """
+
+    def __init__(self, G: nx.DiGraph, od_table: dict, alpha=0.15, beta=4):
+        self.G = G
+        self.alpha = alpha
+        self.beta = beta
+
+        self.nodes = list(G.nodes())
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.edges = list(G.edges())
+        edge_attrs = [attr for _, _, attr in G.edges(data=True)]
+        self.link_ids = [attr['link_id'] for attr in edge_attrs]
+        self.free_flow_time = np.array([attr['free_flow_travel_time'] for attr in edge_attrs], dtype=float)
+        self.capacity = np.array([attr['capacity'] for attr in edge_attrs], dtype=float)
+        self.edge_tail = np.array([self.node_index[u] for u, _ in self.edges], dtype=np.int64)
+        self.edge_head = np.array([self.node_index[v] for _, v in self.edges], dtype=np.int64)
+        self.edge_index = {(u, v): e for e, (u, v) in enumerate(zip(self.edge_tail.tolist(), self.edge_head.tolist()))}
+        n_nodes, n_links = len(self.nodes), len(self.edges)
+        self.in_links = [[] for _ in range(n_nodes)]
+        for e, v in enumerate(self.edge_head.tolist()):
+            self.in_links[v].append(e)
+
+        # demand grouped by origin
+        zone_nodes = {attr['zone_id']: node for node, attr in G.nodes(data=True) if attr.get('zone_id') is not None}
+        demand = {}
+        for (origin, destination), volume in od_table.items():
+            dest_node = zone_nodes.get(destination, destination)
+            if origin not in self.node_index or dest_node not in self.node_index:
+                print(f"Warning: OD pair ({origin}, {destination}) is not on the network. Skipping.")
+                continue
+            o, d = self.node_index[origin], self.node_index[dest_node]
+            if o != d:
+                demand.setdefault(o, {}).setdefault(d, 0.0)
+                demand[o][d] += volume
+        self.origins = np.array(sorted(demand), dtype=np.int64)
+        self.destinations = [np.array(sorted(demand[o]), dtype=np.int64) for o in self.origins.tolist()]
+        self.volumes = [np.array([demand[o][d] for d in sorted(demand[o])], dtype=float) for o in self.origins.tolist()]
+
+        # O(origins x links) storage
+        self.bush = np.zeros((len(self.origins), n_links), dtype=bool)
+        self.origin_flow = np.zeros((len(self.origins), n_links))
+        self.order = np.zeros((len(self.origins), n_nodes), dtype=np.int64)
+        self.flow = np.zeros(n_links)
+        self.gap_history = []
+        self.system_travel_time_history = []
+
+    def link_costs(self, flow):
+        return self.free_flow_time * (1 + self.alpha * (flow / self.capacity) ** self.beta)
+
+    def link_cost_derivatives(self, flow):
+        return self.free_flow_time * self.alpha * self.beta * flow ** (self.beta - 1) / self.capacity ** self.beta
+
+    def _shortest_distances(self, cost):
+        n_nodes = len(self.nodes)
+        graph = csr_matrix((cost, (self.edge_tail, self.edge_head)), shape=(n_nodes, n_nodes))
+        return dijkstra(graph, indices=self.origins, return_predecessors=True)
+
+    def _order_by(self, labels):
+        """Nodes sorted by a label; unreachable nodes (non-finite label) last."""
+        return np.argsort(np.where(np.isfinite(labels), labels, np.inf), kind='stable')
+
+    def initialize(self):
+        """Bushes of the links leading away from each origin at free flow, loaded all-or-nothing."""
+        distances, predecessors = self._shortest_distances(self.free_flow_time)
+        for r in range(len(self.origins)):
+            dist = distances[r]
+            self.bush[r] = np.isfinite(dist[self.edge_tail]) & (dist[self.edge_tail] < dist[self.edge_head])
+            self.order[r] = self._order_by(dist)
+            for d, volume in zip(self.destinations[r].tolist(), self.volumes[r].tolist()):
+                if not np.isfinite(dist[d]):
+                    print(f"Warning: No path from {self.nodes[self.origins[r]]} to {self.nodes[d]}.")
+                    continue
+                node = d
+                while node != self.origins[r]:
+                    prev = int(predecessors[r, node])
+                    self.origin_flow[r, self.edge_index[(prev, node)]] += volume
+                    node = prev
+        self.flow = self.origin_flow.sum(axis=0)
+        return self
+
+    def _labels(self, r, cost, origin_flow):
+        """
+        Shortest (L), longest (U) and longest-used (used only) path labels over bush r, with
+        the bush link reaching every node on the shortest and on the longest used path.
+        cost and origin_flow are lists (scalar access in the loop is much faster).
+        """
+        n_nodes = len(self.nodes)
+        L, U, used = [np.inf] * n_nodes, [-np.inf] * n_nodes, [-np.inf] * n_nodes
+        min_pred, used_pred = [-1] * n_nodes, [-1] * n_nodes
+        origin = int(self.origins[r])
+        L[origin] = U[origin] = used[origin] = 0.0
+        bush, tails, in_links = self.bush[r], self.edge_tail, self.in_links
+        bush_in = [[e for e in in_links[j] if bush[e]] for j in range(n_nodes)]
+        tail = tails.tolist()
+        # a residue of flow on a link must not limit the shifts of the whole longest path
+        used_flow = USED_SHARE * float(self.volumes[r].sum())
+
+        for j in self.order[r].tolist():
+            if j == origin:
+                continue
+            for e in bush_in[j]:
+                i = tail[e]
+                via = L[i] + cost[e]
+                if via < L[j]:
+                    L[j], min_pred[j] = via, e
+                via = U[i] + cost[e]
+                if via > U[j]:
+                    U[j] = via
+                if origin_flow[e] > used_flow:
+                    via = used[i] + cost[e]
+                    if via > used[j]:
+                        used[j], used_pred[j] = via, e
+        return np.array(L), np.array(U), min_pred, used_pred
+
+    def _update_bush(self, r):
+        """
+        Drop unused links off the shortest path tree, then add the links that shorten a
+        longest path of the remaining bush.
+        """
+        bush = self.bush[r]
+        cost = self.link_costs(self.flow)
+        origin_flow = self.origin_flow[r].tolist()
+        _, _, min_pred, _ = self._labels(r, cost.tolist(), origin_flow)
+        on_tree = np.zeros(len(self.edges), dtype=bool)
+        on_tree[[e for e in min_pred if e >= 0]] = True
+        bush &= (self.origin_flow[r] > FLOW_EPS) | on_tree
+
+        # the old order is still topological for the smaller bush
+        _, U, _, _ = self._labels(r, cost.tolist(), origin_flow)
+        reachable = np.isfinite(U)
+        add = (~bush & reachable[self.edge_tail] & reachable[self.edge_head]
+               & (U[self.edge_tail] + cost < U[self.edge_head]))
+        bush |= add
+        # links go from lower to higher U: sorting by U is a topological order of the new bush
+        self.order[r] = self._order_by(U)
+        return int(add.sum())
+
+    def _shift_flows(self, r):
+        """One Algorithm B flow shift pass over bush r, from the farthest nodes back."""
+        t0, cap = self.free_flow_time.tolist(), self.capacity.tolist()
+        alpha, beta = self.alpha, self.beta
+        flow = self.flow.tolist()
+        cost = self.link_costs(self.flow).tolist()
+        origin_flow = self.origin_flow[r].tolist()
+        L, U, min_pred, used_pred = self._labels(r, cost, origin_flow)
+
+        position = np.empty(len(self.nodes), dtype=np.int64)
+        position[self.order[r]] = np.arange(len(self.nodes))
+        position = position.tolist()
+        tail = self.edge_tail.tolist()
+        origin = int(self.origins[r])
+
+        for j in reversed(self.order[r].tolist()):
+            if used_pred[j] < 0 or used_pred[j] == min_pred[j]:
+                continue
+            # walk both paths back to the node where they split
+            short_segment, long_segment = [], []
+            a = b = j
+            while True:
+                if position[a] >= position[b]:
+                    e = min_pred[a]
+                    if e < 0:
+                        break
+                    short_segment.append(e)
+                    a = tail[e]
+                else:
+                    e = used_pred[b]
+                    if e < 0:
+                        break
+                    long_segment.append(e)
+                    b = tail[e]
+                if a == b and short_segment and long_segment:
+                    break
+            if a != b or not long_segment:
+                continue
+
+            difference = sum(cost[e] for e in long_segment) - sum(cost[e] for e in short_segment)
+            if difference < 0:
+                # labels are from the start of the pass: earlier shifts may have reversed the order
+                short_segment, long_segment, difference = long_segment, short_segment, -difference
+            if difference <= 0:
+                continue
+            derivative = sum(t0[e] * alpha * beta * flow[e] ** (beta - 1) / cap[e] ** beta
+                             for e in short_segment + long_segment)
+            shift = min(origin_flow[e] for e in long_segment)
+            if derivative > 0:
+                shift = min(shift, difference / derivative)
+            if shift <= FLOW_EPS:
+                continue
+
+            for e, sign in [(e, -1.0) for e in long_segment] + [(e, 1.0) for e in short_segment]:
+                origin_flow[e] = max(origin_flow[e] + sign * shift, 0.0)
+                flow[e] = max(flow[e] + sign * shift, 0.0)
+                cost[e] = t0[e] * (1 + alpha * (flow[e] / cap[e]) ** beta)
+
+        self.origin_flow[r] = origin_flow
+        self.flow = np.array(flow)
+
+    def relative_gap(self):
+        """(total system travel time - total shortest path travel time) / total system travel time."""
+        cost = self.link_costs(self.flow)
+        distances, _ = self._shortest_distances(cost)
+        shortest_total = sum(float(volumes @ distances[r, dests])
+                             for r, (dests, volumes) in enumerate(zip(self.destinations, self.volumes))
+                             if np.isfinite(distances[r, dests]).all())
+        total = float(self.flow @ cost)
+        return (total - shortest_total) / total if total > 0 else 0.0, total
+
+    def iterate(self, inner_passes=2):
+        """
+        Update every origin's bush and shift its flows (inner_passes passes per origin).
+        Returns the relative gap after the iteration.
+        """
+        for r in range(len(self.origins)):
+            self._update_bush(r)
+            for _ in range(inner_passes):
+                self._shift_flows(r)
+        gap, total = self.relative_gap()
+        self.gap_history.append(gap)
+        self.system_travel_time_history.append(total)
+        return gap
+
+    def solve(self, max_iterations=100, gap_tolerance=1e-8, inner_passes=2, verbose=True):
+        """
+        Run Algorithm B until the relative gap falls below gap_tolerance.
+
+        Returns:
+            gap_history (list): Relative gap after every iteration.
+        """
+        if not self.flow.any():
+            self.initialize()
+        for iteration in range(max_iterations):
+            gap = self.iterate(inner_passes=inner_passes)
+            if verbose:
+                print(f"Bush iteration {iteration + 1}: relative gap {gap:.3e}")
+            if gap < gap_tolerance:
+                if verbose:
+                    print(f"Converged after {iteration + 1} iterations (relative gap).")
+                break
+        return self.gap_history
+
+    def _rescale_on_bush(self, r):
+        """
+        Redistribute origin r's current bush flows to its demand: in reverse topological
+        order, the flow through every node (its demand plus what leaves it) is split over
+        the node's incoming bush links in proportion to their current flows, or put on the
+        shortest incoming link where no flow arrives yet.
+        """
+        origin_flow = self.origin_flow[r].tolist()
+        _, _, min_pred, _ = self._labels(r, self.link_costs(self.flow).tolist(), origin_flow)
+        bush, tail = self.bush[r], self.edge_tail.tolist()
+        through = np.zeros(len(self.nodes))
+        through[self.destinations[r]] = self.volumes[r]
+        through = through.tolist()
+        new_flow = [0.0] * len(self.edges)
+        origin = int(self.origins[r])
+
+        for j in reversed(self.order[r].tolist()):
+            if j == origin or through[j] <= 0:
+                continue
+            links = [e for e in self.in_links[j] if bush[e] and origin_flow[e] > FLOW_EPS]
+            inflow = sum(origin_flow[e] for e in links)
+            if inflow <= 0:
+                if min_pred[j] < 0:
+                    print(f"Warning: No path from {self.nodes[origin]} to {self.nodes[j]} in its bush.")
+                    continue
+                links, inflow = [min_pred[j]], 1.0
+                origin_flow[min_pred[j]] = 1.0
+            for e in links:
+                share = through[j] * origin_flow[e] / inflow
+                new_flow[e] += share
+                through[tail[e]] += share
+        self.origin_flow[r] = new_flow
+
+    def save(self, path):
+        """Write the bushes, origin flows and orders (np.savez) for a later warm start."""
+        np.savez_compressed(
+            path,
+            link_ids=np.array(self.link_ids),
+            origins=np.array([self.nodes[o] for o in self.origins.tolist()]),
+            bush=self.bush, origin_flow=self.origin_flow, order=self.order,
+        )
+
+    def warm_start(self, path):
+        """
+        Start from bushes saved by save(). The saved flows of every origin are rescaled to
+        the current demand (see _rescale_on_bush), so an unchanged demand starts from the
+        saved equilibrium and a changed one from the saved route shares. New origins start
+        from a free-flow bush. The network must have the same links.
+        """
+        saved = np.load(path)
+        if saved['link_ids'].tolist() != np.array(self.link_ids).tolist():
+            raise ValueError(f"Saved bushes in {path} belong to a different network.")
+        self.initialize()
+        saved_row = {origin: k for k, origin in enumerate(saved['origins'].tolist())}
+        warm = []
+        for r, o in enumerate(self.origins.tolist()):
+            k = saved_row.get(self.nodes[o])
+            if k is not None:
+                self.bush[r] = saved['bush'][k]
+                self.order[r] = saved['order'][k]
+                self.origin_flow[r] = saved['origin_flow'][k]
+                warm.append(r)
+        self.flow = self.origin_flow.sum(axis=0)
+        for r in warm:
+            self._rescale_on_bush(r)
+        self.flow = self.origin_flow.sum(axis=0)
+        return self
+
+    def write_to_graph(self):
+        """Store the equilibrium flows and travel times on G."""
+        cost = self.link_costs(self.flow)
+        for (u, v), f, t in zip(self.edges, self.flow.tolist(), cost.tolist()):
+            self.G[u][v]['flow'] = f
+            self.G[u][v]['current_travel_time'] = t
@@ -0,0 +1,173 @@
+from collections import defaultdict
+
+import networkx as nx
+import numpy as np
+
+
+class CohortRollout:
+    """
+    Stochastic multi-agent rollout on cohorts instead of individual agents.
+
+    Agents with the same origin, destination and volume (vehicles per agent) start as one
+    cohort. At every step a
+    cohort at node i is split over the successors of i with a single multinomial draw of
+    its size, using the same logit probabilities as the per-agent rollout
+    (stochastic_multi_agent_rollout), so the distribution of link choices is unchanged.
+    A cohort is only split where its members' paths diverge: every cohort holds one
+    history (the path so far, shared through a parent-pointer tree) and a member count.
+    The cost therefore grows with the number of distinct paths, not with the number of
+    agents.
+
+    Agent identities are assigned to the finished cohorts only when agent_paths() is
+    called; members of a cohort are interchangeable.
+    """
+
+    def __init__(self, G: nx.DiGraph, mu=0.1):
+        self.G = G
+        self.mu = mu
+
+        # history tree: node 0 is the empty path
+        self.hist_parent = [-1]
+        self.hist_link = [None]
+        self.hist_tail = [None]
+        self.hist_travel_time = [0.0]
+        self.hist_free_flow_time = [0.0]
+
+        self.finished = []  # (origin, destination, volume, history, size)
+        self.link_flows = {}
+
+    def _choices(self, node, value_function):
+        """Successor nodes, edge data and probabilities at node, as in the per-agent rollout."""
+        scores = []
+        candidates = []
+        for successor in self.G.successors(node):
+            edge_data = self.G.get_edge_data(node, successor)
+            link_cost = edge_data.get('current_travel_time', edge_data['free_flow_travel_time'])
+            utility = -link_cost + value_function.get(successor, -np.inf)
+            if np.isfinite(utility):
+                scores.append(utility / self.mu)
+                candidates.append((successor, edge_data))
+        if not scores:
+            return candidates, None
+        exp_scores = np.exp(scores - np.max(scores))
+        return candidates, exp_scores / np.sum(exp_scores)
+
+    def _extend(self, history, node, edge_data):
+        self.hist_parent.append(history)
+        self.hist_link.append(edge_data['link_id'])
+        self.hist_tail.append(node)
+        self.hist_travel_time.append(self.hist_travel_time[history]
+                                     + edge_data.get('current_travel_time', edge_data['free_flow_travel_time']))
+        self.hist_free_flow_time.append(self.hist_free_flow_time[history] + edge_data['free_flow_travel_time'])
+        return len(self.hist_parent) - 1
+
+    def run(self, od_volumes, value_function_dict, rng, max_steps=None):
+        """
+        Roll out all cohorts to their destinations.
+
+        Args:
+            od_volumes (dict): {(origin, destination, vehicles per agent): number of agents}.
+            value_function_dict (dict): {destination_zone: value function}.
+            rng (np.random.Generator): Source of the multinomial draws.
+            max_steps (int, optional): Stop cohorts that have not arrived after this many links.
+        """
+        self.link_flows = {attr['link_id']: 0 for _, _, attr in self.G.edges(data=True)}
+        active = []
+        for (origin, destination, volume), size in od_volumes.items():
+            if destination not in value_function_dict:
+                print(f"Warning: No value function for destination {destination}. Skipping {size} agents.")
+                continue
+            active.append((origin, destination, volume, origin, 0, size))
+
+        step = 0
+        while active:
+            if max_steps is not None and step >= max_steps:
+                self.finished.extend((o, d, vol, h, size) for o, d, vol, _, h, size in active)
+                break
+            choice_cache = {}
+            next_active = []
+            for origin, destination, volume, node, history, size in active:
+                if node == destination:
+                    self.finished.append((origin, destination, volume, history, size))
+                    continue
+
+                key = (node, destination)
+                if key not in choice_cache:
+                    choice_cache[key] = self._choices(node, value_function_dict[destination])
+                candidates, probs = choice_cache[key]
+                if probs is None:
+                    print(f"Warning: No feasible moves for {size} agents at node {node}.")
+                    self.finished.append((origin, destination, volume, history, size))
+                    continue
+
+                counts = rng.multinomial(size, probs)
+                for k in np.flatnonzero(counts):
+                    successor, edge_data = candidates[k]
+                    count = int(counts[k])
+                    self.link_flows[edge_data['link_id']] += count * volume
+                    next_active.append((origin, destination, volume, successor,
+                                        self._extend(history, node, edge_data), count))
+            active = next_active
+            step += 1
+        return self
+
+    def _path(self, history):
+        links, nodes = [], []
+        while history > 0:
+            links.append(self.hist_link[history])
+            nodes.append(self.hist_tail[history])
+            history = self.hist_parent[history]
+        links.reverse()
+        nodes.reverse()
+        return links, nodes
+
+    def agent_paths(self, agents):
+        """
+        Agent path records (same fields as stochastic_multi_agent_rollout), assigning the
+        agents of each cohort key to its finished cohorts in order.
+        """
+        members = defaultdict(list)
+        for agent in agents:
+            members[(agent['origin_node'], agent['destination_node'], agent.get('volume', 1))].append(agent)
+        taken = defaultdict(int)
+
+        agent_paths = []
+        for origin, destination, volume, history, size in self.finished:
+            links, nodes = self._path(history)
+            nodes.append(destination)
+            key = (origin, destination, volume)
+            start = taken[key]
+            taken[key] = start + size
+            for agent in members[key][start:start + size]:
+                agent_paths.append({
+                    'agent_id': agent['agent_id'],
+                    'o_zone_id': origin,
+                    'd_zone_id': destination,
+                    'volume': volume,
+                    'path_length': len(links),
+                    'path_travel_time': self.hist_travel_time[history],
+                    'path_free_flow_travel_time': self.hist_free_flow_time[history],
+                    'link_sequence': links,
+                    'node_sequence': nodes,
+                })
+        return agent_paths
+
+
+def cohort_multi_agent_rollout(G: nx.DiGraph, agents: list, value_function_dict: dict, mu=0.1, random_seed=None,
+                               rng=None, max_steps=None):
+    """
+    Drop-in replacement of stochastic_multi_agent_rollout.multi_agent_rollout that samples
+    cohorts with multinomial splits (see CohortRollout).
+
+    Returns:
+        agent_paths (list): List of agent path dictionaries.
+        link_flows (dict): Dictionary {link_id: total flow assigned}.
+    """
+    if rng is None:
+        rng = np.random.default_rng(random_seed)
+    od_volumes = defaultdict(int)
+    for agent in agents:
+        od_volumes[(agent['origin_node'], agent['destination_node'], agent.get('volume', 1))] += 1
+
+    engine = CohortRollout(G, mu).run(od_volumes, value_function_dict, rng, max_steps=max_steps)
+    return engine.agent_paths(agents), engine.link_flows
@@ -1,3 +1,5 @@
+from dataclasses import dataclass, asdict
+import os
 
 # ==== Simulation Control Parameters ====
 max_outer_iterations = 20
@@ -11,19 +13,110 @@ mu_decay_iter = 100    # Over how many iterations to decay μ
 random_seed = 42
 mu = 0.3
 greedy = False
+rollout_update_cadence = 'agent'  # 'agent' (Gauss-Seidel), 'chunk' or 'sweep': when flows/BPR are applied
+rollout_chunk_size = 500
+rollout_mode = 'sequential'  # 'sequential' (agents one by one), 'synchronous' (Jacobi, vectorized) or 'parallel'
+rollout_damping = 1.0        # synchronous mode: fraction of the step towards the new flows
+rollout_workers = None       # parallel mode: worker processes (None = one per core)
+rollout_sync_points = 4      # parallel mode: flow merges + BPR refreshes per sweep
+point_to_point_router = None  # 'astar' or 'bidirectional': search single OD paths (replans, static UE) for few-OD studies
+shortest_path_backend = 'dijkstra'  # OD shortest paths (static UE, gaps): 'dijkstra' (trees) or 'cch' (contraction hierarchy)
 
 # ==== Flow Relaxation Settings (MSA) ====
 use_msa = True
+ue_method = 'msa'            # main_static_ue: 'msa' (link-based), 'gradient_projection' (path-based) or 'bush' (origin-based)
+ue_max_iterations = 100
+ue_gap_tolerance = 1e-6      # relative gap
+ue_inner_sweeps = 5          # gradient projection sweeps over the path sets per column generation / bush flow shift passes per origin
+ue_warm_start = False        # bush: start from the bushes saved in ue_bush_file
+loading_method = 'sampling'  # python_2/main_old: 'sampling' (agent paths), 'cohort' (multinomial cohorts), 'expected' (mean-field flows) or 'path_set' (path-size logit over fixed routes)
+choice_model = 'value_function'  # main_replanned / scenarios: 'value_function' (rollout) or 'path_set' (path-size logit plans)
+path_set_method = 'link_penalty'  # path_set loading: 'link_penalty' or 'k_shortest'
+path_set_size = 5                 # routes per OD pair
+path_size_beta = 1.0              # weight of the path-size correction
 
 # ==== File Paths ====
 data_path = "../data_sets/toy"
 node_file = f"{data_path}/node.csv"
 link_file = f"{data_path}/link.csv"
 demand_file = f"{data_path}/demand.csv"
+ue_bush_file = f"{data_path}/ue_bushes.npz"
+demand_chunk_size = 100000  # agents built at a time where demand is streamed (main_static_ue)
+packet_size = 1             # vehicles per agent; larger packets trade resolution for speed
 agent_result_file = f"{data_path}/agent_result.csv"
 link_performance_file = f"{data_path}/link_performance.csv"
 agent_link_flow_output = f"{data_path}/agent_implied_link_flow.csv"
 
+# ==== Instrumentation Settings ====
+instrumentation_enabled = False   # per-stage timings, counters and peak memory as JSON lines
+instrumentation_file = f"{data_path}/instrumentation.jsonl"
+
+# ==== Agent Tracing (debugging) ====
+trace_agent_ids = []      # e.g. [226]
+trace_nodes = []
+trace_destinations = []
+trace_output_file = f"{data_path}/agent_trace.jsonl"
+
+# ==== Route Guidance Service ====
+guidance_export = False          # main_replanned: save the value functions of every iteration for guidance_service.py
+guidance_dir = f"{data_path}/guidance"
+guidance_host = '127.0.0.1'
+guidance_port = 8765
+guidance_poll_seconds = 2.0      # how often the service looks for a newer iteration
+
 # ==== Plotting Settings ====
 save_plots = True
 plot_output_folder = "../data_sets/3-corridor-acyclic/plots"
+
+# ==== Scenario Sweep Settings ====
+sweep_mu_values = [0.1, 0.3, 0.5]
+sweep_random_seeds = [42, 43, 44]
+sweep_processes = None  # None = one worker per core
+scenario_results_file = f"{data_path}/scenario_results.csv"
+
+
+@dataclass(frozen=True)
+class ScenarioConfig:
+    """
+    One run of the replanned rollout pipeline. Replaces the module globals above when
+    several scenarios are run side by side (see scenario_runner.py).
+
+    use_msa turns on an MSA relaxation of the link flows that main_replanned does not
+    apply; it is off by default so that a scenario reproduces main_replanned's run.
+    """
+    name: str
+    data_path: str = data_path
+    mu: float = mu
+    random_seed: int = random_seed
+    max_outer_iterations: int = max_outer_iterations
+    use_msa: bool = False
+    greedy: bool = greedy
+    update_cadence: str = rollout_update_cadence
+    chunk_size: int = rollout_chunk_size
+    rollout_mode: str = rollout_mode
+    damping: float = rollout_damping
+    packet_size: float = packet_size
+    choice_model: str = choice_model
+    path_set_method: str = path_set_method
+    path_set_size: int = path_set_size
+    path_size_beta: float = path_size_beta
+
+    @property
+    def node_file(self):
+        return os.path.join(self.data_path, "node.csv")
+
+    @property
+    def link_file(self):
+        return os.path.join(self.data_path, "link.csv")
+
+    @property
+    def demand_file(self):
+        return os.path.join(self.data_path, "demand.csv")
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def default_scenario(name="default", **overrides):
+    """ScenarioConfig built from the module-level settings, with optional overrides."""
+    return ScenarioConfig(name=name, **overrides)
@@ -0,0 +1,365 @@
+import math
+
+import networkx as nx
+import numpy as np
+
+NO_PREDECESSOR = -9999  # as scipy.sparse.csgraph
+
+
+class ContractionHierarchy:
+    """
+    Customizable contraction hierarchy (CCH) over the topology of G.
+
+    Preprocessing only uses the topology: nodes are ranked by nested dissection on their
+    coordinates (separators last; min-degree order without coordinates) and contracted in
+    rank order, connecting the higher ranked neighbors of every contracted node. Every
+    resulting undirected edge {u, v} (rank u < rank v) carries two weights, up (u -> v)
+    and down (v -> u).
+
+    customize() loads a metric: the original link costs, then for every lower triangle
+    u < v < w, in increasing level of u,
+
+        up[v, w]   = min(up[v, w],   down[u, v] + up[u, w])
+        down[v, w] = min(down[v, w], down[u, w] + up[u, v])
+
+    vectorized per level. Only this step is repeated when the link costs change.
+
+    Queries search upward from the source (up weights) and from the target (down weights)
+    along their ancestors in the elimination tree and meet at the best common node;
+    shortcuts are unpacked through the middle node of their triangle. one_to_all() adds a
+    top-down sweep over all nodes (one vectorized step per level).
+    """
+
+    def __init__(self, G: nx.DiGraph, leaf_size=16, max_spaces=65536):
+        self.G = G
+        self.nodes = list(G.nodes())
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        self.arc_tail = np.array([self.node_index[u] for u, _ in G.edges()], dtype=np.int64)
+        self.arc_head = np.array([self.node_index[v] for _, v in G.edges()], dtype=np.int64)
+
+        neighbors = [set() for _ in range(n)]
+        for u, v in zip(self.arc_tail.tolist(), self.arc_head.tolist()):
+            if u != v:
+                neighbors[u].add(v)
+                neighbors[v].add(u)
+
+        order = self._nested_dissection(neighbors, leaf_size)
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[order] = np.arange(n)
+        self._contract(neighbors, order)
+        self._build_triangles()
+
+        # hierarchy edge of every link, and whether the link runs up (to the higher rank)
+        self.arc_upward = self.rank[self.arc_tail] < self.rank[self.arc_head]
+        lower = np.where(self.arc_upward, self.arc_tail, self.arc_head)
+        higher = np.where(self.arc_upward, self.arc_head, self.arc_tail)
+        self.arc_edge = self.edge_order[np.searchsorted(self.edge_key, lower * n + higher, sorter=self.edge_order)]
+        self.arc_runs = {}  # direction -> links sorted by the node they reach, their ends, run starts and run ids
+        for direction, near, far in (('forward', self.arc_tail, self.arc_head),
+                                     ('backward', self.arc_head, self.arc_tail)):
+            arcs = np.argsort(far, kind='stable')
+            new_run = np.r_[True, np.diff(far[arcs]) != 0] if len(arcs) else np.zeros(0, dtype=bool)
+            self.arc_runs[direction] = (arcs, near[arcs], far[arcs], np.flatnonzero(new_run), np.cumsum(new_run) - 1)
+
+        self.max_spaces = max_spaces
+        self.spaces = {}  # (node index, direction) -> upward search space under the current costs
+
+        self.cost = None
+        self.up = None
+        self.down = None
+
+    # ---- preprocessing ----
+
+    def _nested_dissection(self, neighbors, leaf_size):
+        """Node order with the separators of a recursive coordinate bisection last."""
+        coords = []
+        for node in self.nodes:
+            attr = self.G.nodes[node]
+            x, y = attr.get('x_coord'), attr.get('y_coord')
+            if x is None or y is None or not (math.isfinite(x) and math.isfinite(y)):
+                return self._min_degree_order(neighbors)
+            coords.append((x, y))
+        coords = np.array(coords, dtype=float)
+        side = np.zeros(len(self.nodes), dtype=bool)
+
+        def boundary(cell, other):
+            """Nodes of cell with a neighbor in other."""
+            side[other] = True
+            nodes = [v for v in cell.tolist() if any(side[w] for w in neighbors[v])]
+            side[other] = False
+            return nodes
+
+        def dissect(cell):
+            if len(cell) <= leaf_size:
+                return cell.tolist()
+            xy = coords[cell]
+            axis = int(np.argmax(xy.max(axis=0) - xy.min(axis=0)))
+            sorted_cell = cell[np.argsort(xy[:, axis], kind='stable')]
+            a, b = sorted_cell[:len(cell) // 2], sorted_cell[len(cell) // 2:]
+            boundary_a, boundary_b = boundary(a, b), boundary(b, a)
+            if len(boundary_a) <= len(boundary_b):
+                separator, a = boundary_a, np.setdiff1d(a, boundary_a, assume_unique=True)
+            else:
+                separator, b = boundary_b, np.setdiff1d(b, boundary_b, assume_unique=True)
+            if not len(a) or not len(b):  # no progress: keep the cell as it is
+                return cell.tolist()
+            return dissect(a) + dissect(b) + separator
+
+        return dissect(np.arange(len(self.nodes)))
+
+    @staticmethod
+    def _min_degree_order(neighbors):
+        degree = {v: len(adj) for v, adj in enumerate(neighbors)}
+        adjacency = [set(adj) for adj in neighbors]
+        order = []
+        while degree:
+            v = min(degree, key=degree.get)
+            order.append(v)
+            del degree[v]
+            for w in adjacency[v]:
+                adjacency[w].discard(v)
+                adjacency[w] |= adjacency[v] - {w}
+                degree[w] = len(adjacency[w])
+        return order
+
+    def _contract(self, neighbors, order):
+        """Symbolic contraction: upper neighbors of every node, edge ids, elimination tree."""
+        rank = self.rank.tolist()
+        adjacency = [set(adj) for adj in neighbors]
+        n = len(self.nodes)
+        self.upper = [None] * n  # upper neighbors sorted by rank
+        for u in order:
+            upper = sorted((w for w in adjacency[u] if rank[w] > rank[u]), key=rank.__getitem__)
+            self.upper[u] = upper
+            upper_set = set(upper)
+            for w in upper:
+                adjacency[w] |= upper_set
+                adjacency[w].discard(w)
+
+        lower_end, upper_end = [], []
+        self.edge_ids = []  # per node, the ids of its upper edges (aligned with self.upper)
+        for u in range(n):
+            ids = list(range(len(lower_end), len(lower_end) + len(self.upper[u])))
+            self.edge_ids.append(ids)
+            lower_end.extend([u] * len(ids))
+            upper_end.extend(self.upper[u])
+        self.lower_end = np.array(lower_end, dtype=np.int64)
+        self.upper_end = np.array(upper_end, dtype=np.int64)
+        self.edge_key = self.lower_end * n + self.upper_end  # looked up through edge_order (sorted keys)
+        self.edge_order = np.argsort(self.edge_key, kind='stable')
+        self.edge_lookup = {(u, w): e for e, (u, w) in enumerate(zip(lower_end, upper_end))}
+        self.parent = [upper[0] if upper else -1 for upper in self.upper]
+
+        # bottom-up level (customization) and top-down depth (one-to-all sweep)
+        self.level = np.zeros(n, dtype=np.int64)
+        for u in order:
+            for w in self.upper[u]:
+                self.level[w] = max(self.level[w], self.level[u] + 1)
+        self.depth = np.zeros(n, dtype=np.int64)
+        for u in reversed(order):
+            if self.upper[u]:
+                self.depth[u] = 1 + max(self.depth[w] for w in self.upper[u])
+        self.upper_arrays = [np.array(upper, dtype=np.int64) for upper in self.upper]
+        self.edge_arrays = [np.array(ids, dtype=np.int64) for ids in self.edge_ids]
+
+        # top-down sweep: edges grouped by the depth of their lower end, in runs per lower end
+        sweep = np.lexsort((self.lower_end, self.depth[self.lower_end]))
+        self.sweep_groups = []
+        for group in np.split(sweep, np.flatnonzero(np.diff(self.depth[self.lower_end[sweep]])) + 1):
+            if not len(group):
+                continue
+            starts = np.flatnonzero(np.r_[True, np.diff(self.lower_end[group]) != 0])
+            self.sweep_groups.append((group, self.lower_end[group[starts]], starts))
+
+    def edge_id(self, u, v):
+        """Id of the hierarchy edge {u, v} (node indices), -1 if there is none."""
+        if self.rank[u] > self.rank[v]:
+            u, v = v, u
+        return self.edge_lookup.get((u, v), -1)
+
+    def _build_triangles(self):
+        """Lower triangles (u, {u,v}, {u,w}, {v,w}) grouped by the level of u."""
+        n = len(self.nodes)
+        tri_u, tri_uv, tri_uw, tri_vw = [], [], [], []
+        for u in range(n):
+            upper = self.upper[u]
+            if len(upper) < 2:
+                continue
+            i, j = np.triu_indices(len(upper), k=1)
+            upper_arr = np.array(upper, dtype=np.int64)
+            ids = np.array(self.edge_ids[u], dtype=np.int64)
+            keys = upper_arr[i] * n + upper_arr[j]  # rank v < rank w: v is the lower end
+            tri_u.append(np.full(len(i), u, dtype=np.int64))
+            tri_uv.append(ids[i])
+            tri_uw.append(ids[j])
+            tri_vw.append(self.edge_order[np.searchsorted(self.edge_key, keys, sorter=self.edge_order)])
+        if tri_u:
+            tri_u, tri_uv, tri_uw, tri_vw = (np.concatenate(t) for t in (tri_u, tri_uv, tri_uw, tri_vw))
+        else:
+            tri_u = tri_uv = tri_uw = tri_vw = np.zeros(0, dtype=np.int64)
+        by_level = np.argsort(self.level[tri_u], kind='stable')
+        self.tri_u, self.tri_uv, self.tri_uw, self.tri_vw = (t[by_level] for t in (tri_u, tri_uv, tri_uw, tri_vw))
+        levels = self.level[self.tri_u]
+        self.tri_groups = np.split(np.arange(len(levels)), np.flatnonzero(np.diff(levels)) + 1) if len(levels) else []
+
+    # ---- customization ----
+
+    def link_costs(self):
+        return np.array([attr.get('current_travel_time', attr['free_flow_travel_time'])
+                         for _, _, attr in self.G.edges(data=True)], dtype=float)
+
+    def customize(self, cost=None):
+        """Load the link costs (array in G.edges() order; default: read from G) into the hierarchy."""
+        cost = self.link_costs() if cost is None else np.asarray(cost, dtype=float)
+        self.cost = cost.copy()
+        direct_up = np.full(len(self.lower_end), np.inf)
+        direct_down = np.full(len(self.lower_end), np.inf)
+        upward, downward = self.arc_upward, ~self.arc_upward & (self.arc_tail != self.arc_head)
+        np.minimum.at(direct_up, self.arc_edge[upward], cost[upward])
+        np.minimum.at(direct_down, self.arc_edge[downward], cost[downward])
+        up, down = direct_up.copy(), direct_down.copy()
+
+        for group in self.tri_groups:
+            uv, uw, vw = self.tri_uv[group], self.tri_uw[group], self.tri_vw[group]
+            np.minimum.at(up, vw, down[uv] + up[uw])
+            np.minimum.at(down, vw, down[uw] + up[uv])
+
+        # middle node of every shortcut that is cheaper than the direct link
+        self.up_middle = np.full(len(up), -1, dtype=np.int64)
+        self.down_middle = np.full(len(down), -1, dtype=np.int64)
+        via = self.tri_u
+        for weights, direct, middle, first, second in ((up, direct_up, self.up_middle, self.tri_uv, self.tri_uw),
+                                                       (down, direct_down, self.down_middle, self.tri_uw, self.tri_uv)):
+            candidate = down[first] + up[second]
+            tight = (candidate == weights[self.tri_vw]) & (candidate < direct[self.tri_vw])
+            middle[self.tri_vw[tight]] = via[tight]
+        self.up, self.down = up, down
+        self.spaces = {}
+        return self
+
+    # ---- queries ----
+
+    def search_space(self, x, direction='forward'):
+        """
+        Upward search from node index x over its ancestors in the elimination tree: up
+        weights (forward, paths from x) or down weights (backward, paths to x). Returns
+        (ancestors, distances, previous node), cached until the next customize().
+        """
+        key = (x, direction)
+        space = self.spaces.get(key)
+        if space is not None:
+            return space
+        if direction == 'forward':
+            weights = self.up
+        elif direction == 'backward':
+            weights = self.down
+        else:
+            raise ValueError(f"Unknown direction '{direction}', expected 'forward' or 'backward'.")
+        dist = np.full(len(self.nodes), np.inf)
+        via = np.full(len(self.nodes), -1, dtype=np.int64)
+        dist[x] = 0.0
+        chain = []
+        while x != -1:
+            chain.append(x)
+            upper = self.upper_arrays[x]
+            if len(upper) and dist[x] < np.inf:
+                candidate = dist[x] + weights[self.edge_arrays[x]]
+                better = candidate < dist[upper]
+                dist[upper[better]] = candidate[better]
+                via[upper[better]] = x
+            x = self.parent[x]
+        chain = np.array(chain, dtype=np.int64)
+        space = (chain, dist[chain], via[chain])
+        if len(self.spaces) >= self.max_spaces:
+            self.spaces.clear()
+        self.spaces[key] = space
+        return space
+
+    def _unpack(self, u, v, path):
+        """Append the original nodes of the hierarchy edge u -> v (after u) to path."""
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            e = self.edge_id(a, b)
+            middle = self.up_middle[e] if self.rank[a] < self.rank[b] else self.down_middle[e]
+            if middle < 0:
+                path.append(b)
+            else:
+                stack.append((int(middle), b))
+                stack.append((a, int(middle)))
+
+    def _meet(self, forward, backward):
+        """(distance, meeting node) of a forward and a backward search space; node -1 if none."""
+        dist = np.full(len(self.nodes), np.inf)
+        dist[forward[0]] = forward[1]
+        total = dist[backward[0]] + backward[1]
+        k = int(np.argmin(total))
+        if not np.isfinite(total[k]):
+            return math.inf, -1
+        return float(total[k]), int(backward[0][k])
+
+    def query(self, source, target):
+        """(travel time, node path) from source to target (node ids); (inf, None) if unreachable."""
+        s, t = self.node_index[source], self.node_index[target]
+        forward, backward = self.search_space(s, 'forward'), self.search_space(t, 'backward')
+        best, meeting = self._meet(forward, backward)
+        if meeting < 0:
+            return math.inf, None
+
+        forward_via = dict(zip(forward[0].tolist(), forward[2].tolist()))
+        backward_via = dict(zip(backward[0].tolist(), backward[2].tolist()))
+        hops, x = [], meeting
+        while x != s:
+            hops.append((forward_via[x], x))
+            x = forward_via[x]
+        hops.reverse()
+        x = meeting
+        while x != t:
+            hops.append((x, backward_via[x]))
+            x = backward_via[x]
+        path = [s]
+        for a, b in hops:
+            self._unpack(a, b, path)
+        return best, [self.nodes[i] for i in path]
+
+    def distance(self, source, target):
+        """Shortest path cost from source to target (inf if there is no path)."""
+        s, t = self.node_index[source], self.node_index[target]
+        return self._meet(self.search_space(s, 'forward'), self.search_space(t, 'backward'))[0]
+
+    def one_to_many(self, source, targets):
+        """Shortest path costs from source to every target (array aligned with targets)."""
+        dist = np.full(len(self.nodes), np.inf)
+        chain, forward, _ = self.search_space(self.node_index[source], 'forward')
+        dist[chain] = forward
+        result = np.full(len(targets), np.inf)
+        for i, target in enumerate(targets):
+            ancestors, backward, _ = self.search_space(self.node_index[target], 'backward')
+            result[i] = np.min(dist[ancestors] + backward)
+        return result
+
+    def one_to_all(self, root, direction='forward'):
+        """
+        Distances from (forward) or to (backward) root for all nodes, with the predecessor
+        (forward) or successor (backward) node of every node on a shortest path, as arrays
+        over the node indices like scipy's dijkstra.
+        """
+        r = self.node_index[root]
+        chain, upward, _ = self.search_space(r, direction)
+        sweep = self.down if direction == 'forward' else self.up
+        dist = np.full(len(self.nodes), np.inf)
+        dist[chain] = upward
+        for edges, lower, starts in self.sweep_groups:
+            reached = np.minimum.reduceat(dist[self.upper_end[edges]] + sweep[edges], starts)
+            dist[lower] = np.minimum(dist[lower], reached)
+
+        # shortest path tree in G: the tightest link into (forward) / out of (backward) every node
+        arcs, near, far, starts, run = self.arc_runs[direction]
+        with np.errstate(invalid='ignore'):
+            slack = dist[near] + self.cost[arcs] - dist[far]
+        tight = np.flatnonzero(slack == np.fmin.reduceat(slack, starts)[run]) if len(arcs) else arcs
+        predecessors = np.full(len(self.nodes), NO_PREDECESSOR, dtype=np.int64)
+        predecessors[far[tight]] = near[tight]
+        predecessors[r] = NO_PREDECESSOR
+        return dist, predecessors
@@ -1,28 +1,114 @@
+import numpy as np
 import pandas as pd
 
 
-def load_demand(demand_file: str):
+class ODDemand:
+    """
+    Demand kept as its OD rows, with agents produced on demand.
+
+    Every agent is a packet of packet_size vehicles (its 'volume'); the last packet of
+    an OD row carries the remainder, so fractional volumes are kept. packet_size=1 gives
+    one agent per vehicle. Agents are numbered row after row: the agents of row r have
+    the IDs starts[r] .. starts[r+1]-1, so an agent ID maps back to its OD pair with one
+    binary search over the cumulative packet counts. Only the OD arrays are stored;
+    agent dicts are built for the requested IDs or chunks.
+    """
+
+    def __init__(self, origins, destinations, volumes, packet_size=1):
+        if packet_size <= 0:
+            raise ValueError(f"packet_size must be positive, got {packet_size}.")
+        volumes = np.asarray(volumes, dtype=float)
+        keep = volumes > 0
+        self.packet_size = packet_size
+        self.origins = np.asarray(origins)[keep]
+        self.destinations = np.asarray(destinations)[keep]
+        self.volumes = volumes[keep]
+        # tolerance keeps e.g. 0.3 / 0.1 from producing an empty extra packet
+        self.packets = np.ceil(self.volumes / packet_size - 1e-9).astype(np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(self.packets)))
+        # whole vehicles stay integers, so flows do too
+        self.integral = float(packet_size).is_integer() and bool(np.all(self.volumes % 1 == 0))
+        self.destination_zones = set(np.asarray(destinations).tolist())
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    @property
+    def total_volume(self):
+        return float(self.volumes.sum())
+
+    def od_rows(self, agent_ids):
+        """OD row index of every agent ID."""
+        return np.searchsorted(self.starts, agent_ids, side='right') - 1
+
+    def packet_volumes(self, agent_ids, rows):
+        """Vehicles carried by every agent: packet_size, or the remainder for a row's last packet."""
+        offset = np.asarray(agent_ids) - self.starts[rows]
+        volumes = np.minimum(self.packet_size, self.volumes[rows] - offset * self.packet_size)
+        return volumes.astype(np.int64) if self.integral else volumes
+
+    def agent(self, agent_id):
+        if not 0 <= agent_id < len(self):
+            raise IndexError(f"agent {agent_id} out of range")
+        row = int(self.od_rows(agent_id))
+        return {
+            'agent_id': int(agent_id),
+            'origin_node': self.origins[row].item(),
+            'destination_node': self.destinations[row].item(),
+            'volume': self.packet_volumes(agent_id, row).item()
+        }
+
+    def agents(self, start=0, stop=None):
+        """Agent dicts of the IDs start .. stop-1 (default: all agents)."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        agent_ids = np.arange(start, stop)
+        rows = self.od_rows(agent_ids)
+        return [
+            {'agent_id': agent_id, 'origin_node': origin, 'destination_node': destination, 'volume': volume}
+            for agent_id, origin, destination, volume in zip(
+                agent_ids.tolist(), self.origins[rows].tolist(), self.destinations[rows].tolist(),
+                self.packet_volumes(agent_ids, rows).tolist())
+        ]
+
+    def iter_chunks(self, chunk_size):
+        """Agent dicts in consecutive chunks of at most chunk_size agents."""
+        for start in range(0, len(self), chunk_size):
+            yield self.agents(start, start + chunk_size)
+
+
+def load_od_demand(demand_file: str, packet_size=1):
+    """
+    Load demand from CSV file as an ODDemand, without building the agents.
+    """
+    demand_df = pd.read_csv(demand_file, usecols=['o_zone_id', 'd_zone_id', 'volume'])
+    return ODDemand(demand_df['o_zone_id'].to_numpy(), demand_df['d_zone_id'].to_numpy(),
+                    demand_df['volume'].to_numpy(), packet_size=packet_size)
+
+
+def load_demand(demand_file: str, packet_size=1):
     """
     Load demand from CSV file and create a list of agent dictionaries.
+    Each agent carries 'volume' vehicles (packet_size, see ODDemand).
 
     Returns:
         agents (list): List of agent dictionaries.
         destination_zones (set): Set of unique destination zone IDs.
     """
+    demand = load_od_demand(demand_file, packet_size=packet_size)
+    return demand.agents(), demand.destination_zones
+
+
+def load_od_table(demand_file: str):
+    """
+    Load demand from CSV file as aggregated OD volumes (no agents), for expected-flow loading.
+
+    Returns:
+        od_table (dict): {(origin_node, destination_zone): volume}.
+        destination_zones (set): Set of unique destination zone IDs.
+    """
     demand_df = pd.read_csv(demand_file)
+    volumes = demand_df.groupby(['o_zone_id', 'd_zone_id'])['volume'].sum()
 
-    agents = []
+    od_table = {(o, d): float(volume) for (o, d), volume in volumes.items() if volume > 0}
     destination_zones = set(demand_df['d_zone_id'].unique())
-    agent_id_counter = 0
-
-    for _, row in demand_df.iterrows():
-        for _ in range(int(row['volume'])):
-            agent = {
-                'agent_id': agent_id_counter,
-                'origin_node': row['o_zone_id'],
-                'destination_node': row['d_zone_id']
-            }
-            agents.append(agent)
-            agent_id_counter += 1
-
-    return agents, destination_zones
+    return od_table, destination_zones
@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.linalg import splu
+
+
+def _link_shares(tail, head, cost, values, destination, n_nodes, mu):
+    """
+    Logit probability of every link at its tail node towards one destination, with the
+    same scores as the stochastic rollout: softmax of (-cost + V(head)) / mu over the
+    successors with a finite utility. Links leaving the destination get 0.
+    """
+    scores = (values[head] - cost) / mu
+    feasible = np.isfinite(scores) & (tail != destination)
+    node_max = np.full(n_nodes, -np.inf)
+    np.maximum.at(node_max, tail[feasible], scores[feasible])
+    weights = np.zeros(len(tail))
+    weights[feasible] = np.exp(scores[feasible] - node_max[tail[feasible]])
+    totals = np.bincount(tail, weights=weights, minlength=n_nodes)
+    shares = np.zeros(len(tail))
+    shares[feasible] = weights[feasible] / totals[tail[feasible]]
+    return shares
+
+
+def expected_network_loading(G: nx.DiGraph, od_table: dict, value_function_dict: dict, mu=0.1):
+    """
+    Expected (mean-field) link flows of the logit route choice, without sampling agents.
+
+    For every destination the OD volumes are propagated through the link choice shares:
+    the expected number of travelers x passing each node solves x = b + P^T x (b: volumes
+    leaving each origin, P: node-to-node choice probabilities), one sparse solve per
+    destination. On an acyclic network this is Dial's single topological pass; cycles
+    are handled by the same solve. The expected travel time to the destination, used for
+    the OD travel times, solves the matching system (I - P) y = expected link cost.
+
+    Args:
+        G (nx.DiGraph): Network graph with 'current_travel_time' (or 'free_flow_travel_time').
+        od_table (dict): {(origin_node, destination_zone): volume}.
+        value_function_dict (dict): {destination_zone: {node: V(node)}}.
+        mu (float): Softmax temperature, as in the stochastic rollout.
+
+    Returns:
+        dict with
+            link_flows (dict): {link_id: expected flow}.
+            link_shares (dict): {destination_zone: {link_id: choice probability at the tail node}}.
+            od_travel_times (dict): {(origin_node, destination_zone): expected travel time}.
+    """
+    nodes = list(G.nodes())
+    node_index = {node: i for i, node in enumerate(nodes)}
+    n_nodes = len(nodes)
+    tail = np.array([node_index[u] for u, _ in G.edges()], dtype=np.int64)
+    head = np.array([node_index[v] for _, v in G.edges()], dtype=np.int64)
+    cost = np.array([attr.get('current_travel_time', attr['free_flow_travel_time'])
+                     for _, _, attr in G.edges(data=True)], dtype=float)
+    link_ids = [attr['link_id'] for _, _, attr in G.edges(data=True)]
+
+    od_by_destination = defaultdict(list)
+    for (origin, destination), volume in od_table.items():
+        od_by_destination[destination].append((origin, volume))
+
+    flows = np.zeros(len(link_ids))
+    link_shares = {}
+    od_travel_times = {}
+    eye = identity(n_nodes, format='csc')
+
+    for destination, od_pairs in od_by_destination.items():
+        value_function = value_function_dict[destination]
+        values = np.array([value_function.get(node, -np.inf) for node in nodes], dtype=float)
+        dest = node_index[destination]
+        shares = _link_shares(tail, head, cost, values, dest, n_nodes, mu)
+
+        # P[i, j] = probability of moving from node i to node j
+        used = shares > 0
+        P = csr_matrix((shares[used], (tail[used], head[used])), shape=(n_nodes, n_nodes))
+        lu = splu((eye - P).tocsc())
+
+        origins = np.array([node_index[origin] for origin, _ in od_pairs], dtype=np.int64)
+        volumes = np.array([volume for _, volume in od_pairs], dtype=float)
+        b = np.bincount(origins, weights=volumes, minlength=n_nodes)
+        node_volume = lu.solve(b, trans='T')  # (I - P)^T x = b
+        flows += node_volume[tail] * shares
+
+        expected_cost = lu.solve(np.bincount(tail, weights=shares * cost, minlength=n_nodes))
+        for origin, _ in od_pairs:
+            od_travel_times[(origin, destination)] = float(expected_cost[node_index[origin]])
+        link_shares[destination] = {link_ids[e]: float(shares[e]) for e in np.flatnonzero(used)}
+
+    return {
+        'link_flows': dict(zip(link_ids, flows.tolist())),
+        'link_shares': link_shares,
+        'od_travel_times': od_travel_times,
+    }
@@ -0,0 +1,72 @@
+import numpy as np
+
+UPDATE_CADENCES = ('agent', 'chunk', 'sweep')
+
+
+class FlowDeltaAccumulator:
+    """
+    Collects link flow changes and applies them to the graph in one batch.
+
+    flush() adds the pending deltas to each edge's 'flow' and recomputes the BPR
+    'current_travel_time' only for the links that changed, vectorized over those links.
+    How often the rollout flushes sets the update cadence:
+        'agent' - after every agent (sequential Gauss-Seidel costs),
+        'chunk' - after every chunk_size agents,
+        'sweep' - once per rollout sweep.
+    """
+
+    def __init__(self, G, alpha=0.15, beta=4):
+        self.G = G
+        self.alpha = alpha
+        self.beta = beta
+
+        self.links = []
+        self.link_index = {}
+        self.edge_attrs = []
+        for i, (u, v, attr) in enumerate(G.edges(data=True)):
+            self.links.append((u, v))
+            self.link_index[(u, v)] = i
+            self.edge_attrs.append(attr)
+        self.free_flow_time = np.array([attr['free_flow_travel_time'] for attr in self.edge_attrs], dtype=float)
+        self.capacity = np.array([attr['capacity'] for attr in self.edge_attrs], dtype=float)
+
+        self.pending = {}  # link index -> flow delta
+        self.bpr_updates = 0
+
+    def add(self, link, amount=1):
+        """link: (u, v) edge tuple."""
+        i = self.link_index[link]
+        self.pending[i] = self.pending.get(i, 0) + amount
+
+    def add_path(self, links, amount=1):
+        pending = self.pending
+        for link in links:
+            i = self.link_index[link]
+            pending[i] = pending.get(i, 0) + amount
+
+    def flush(self):
+        """
+        Apply pending deltas and refresh BPR travel times of the affected links.
+
+        Returns:
+            touched (np.ndarray): Indices of the links whose flow was updated.
+        """
+        if not self.pending:
+            return np.empty(0, dtype=np.int64)
+
+        touched = np.fromiter(self.pending.keys(), dtype=np.int64, count=len(self.pending))
+        edge_attrs = self.edge_attrs
+        flows = []
+        for i, delta in self.pending.items():
+            attr = edge_attrs[i]
+            attr['flow'] += delta
+            flows.append(attr['flow'])
+        self.pending = {}
+
+        times = self.free_flow_time[touched] * (
+            1 + self.alpha * (np.array(flows, dtype=float) / self.capacity[touched]) ** self.beta)
+        for i, t in zip(touched.tolist(), times.tolist()):
+            edge_attrs[i]['current_travel_time'] = t
+
+        self.bpr_updates += len(touched)
+        return touched
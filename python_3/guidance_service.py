@@ -0,0 +1,350 @@
+"""
+Route guidance from the value functions of a replanned rollout run, served locally.
+
+main_replanned writes one snapshot per iteration (guidance_export) with the value
+arrays of all destinations and the link travel times they were solved on. The service
+loads the latest snapshot of guidance_dir, answers JSON-lines requests over TCP and
+switches to newer snapshots as they appear:
+
+    {"id": 1, "type": "next_hop", "node": 4, "destination": 6}
+    {"id": 2, "type": "expected_travel_time", "node": 1, "destination": 6}
+    {"id": 3, "type": "route_distribution", "origin": 1, "destination": 6, "k": 3}
+    {"id": 4, "type": "status"}
+
+Every answer is one line {"id", "ok", "iteration", "result"} (or "error"). Destinations
+are destination zones, as the keys of value_function_dict.
+
+    python guidance_service.py [--dir DIR] [--host HOST] [--port PORT] [--poll SECONDS]
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import math
+import os
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.linalg import spsolve
+
+GUIDANCE_QUERIES = ('next_hop', 'route_distribution', 'expected_travel_time', 'status')
+SNAPSHOT_PREFIX = 'iter_'
+
+
+def clear_guidance(directory):
+    """Remove the snapshots of an earlier run from directory."""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith('.npz'):
+            os.remove(os.path.join(directory, name))
+
+
+def save_guidance(directory, iteration, G, value_function_dict, mu, run_id=''):
+    """
+    Write the value functions of one iteration (and the travel times they were solved
+    on) as {directory}/iter_{iteration}.npz. The file is written under a temporary name
+    and renamed, so a running service never loads half a snapshot. Iteration 0 starts a
+    new run: the snapshots of the previous run are removed first, so a service never
+    serves a stale final iteration of an earlier run.
+    """
+    if iteration == 0:
+        clear_guidance(directory)
+    os.makedirs(directory, exist_ok=True)
+    nodes = list(G.nodes())
+    destinations = list(value_function_dict)
+    zone_node = {attr.get('zone_id'): node for node, attr in G.nodes(data=True)}
+    path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{iteration:04d}.npz")
+    temporary = path + '.tmp.npz'
+    np.savez_compressed(
+        temporary,
+        iteration=iteration,
+        run_id=run_id,
+        mu=mu,
+        nodes=np.array(nodes),
+        edge_tail=np.array([u for u, _ in G.edges()]),
+        edge_head=np.array([v for _, v in G.edges()]),
+        link_ids=np.array([attr['link_id'] for _, _, attr in G.edges(data=True)]),
+        cost=np.array([attr.get('current_travel_time', attr['free_flow_travel_time'])
+                       for _, _, attr in G.edges(data=True)], dtype=float),
+        destinations=np.array(destinations),
+        destination_nodes=np.array([zone_node[d] for d in destinations]),
+        values=np.array([[value_function_dict[d].get(node, -np.inf) for node in nodes] for d in destinations],
+                        dtype=float).reshape(len(destinations), len(nodes)),
+    )
+    os.replace(temporary, path)
+    return path
+
+
+def latest_snapshot(directory):
+    """Path of the snapshot with the highest iteration in directory, None if there is none."""
+    if not os.path.isdir(directory):
+        return None
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(SNAPSHOT_PREFIX) and name.endswith('.npz') and '.tmp' not in name)
+    return os.path.join(directory, names[-1]) if names else None
+
+
+class GuidanceModel:
+    """
+    Route choice of one snapshot. With V_d the value function of destination d, a
+    traveller at node i takes link (i, j) with the logit probability of the rollout,
+
+        P_d(i, j) = exp((V_d(j) - t_ij) / mu) / sum over successors k of i (same)
+
+    which is precomputed for all destinations and links. Expected travel times solve the
+    absorbing chain T_d = P_d (t + T_d), T_d(d) = 0, per destination (cached); nodes that
+    cannot reach d get None. Routes are enumerated best-first on -log P, so the k routes
+    returned are the k most likely ones.
+    """
+
+    def __init__(self, path):
+        self.mtime = os.stat(path).st_mtime_ns
+        with np.load(path, allow_pickle=False) as data:
+            self.iteration = int(data['iteration'])
+            self.run_id = str(data['run_id'])
+            self.mu = float(data['mu'])
+            self.nodes = data['nodes'].tolist()
+            edge_tail, edge_head = data['edge_tail'].tolist(), data['edge_head'].tolist()
+            self.link_ids = data['link_ids'].tolist()
+            self.cost = data['cost']
+            self.destinations = data['destinations'].tolist()
+            self.destination_nodes = data['destination_nodes'].tolist()
+            self.values = data['values']
+        self.path = path
+        self.loaded_at = time.time()
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.destination_index = {d: k for k, d in enumerate(self.destinations)}
+        self.edge_tail = np.array([self.node_index[u] for u in edge_tail], dtype=np.int64)
+        self.edge_head = np.array([self.node_index[v] for v in edge_head], dtype=np.int64)
+
+        # links grouped by tail: the out-links of node i are order[start[i]:start[i + 1]]
+        n, m = len(self.nodes), len(self.link_ids)
+        self.order = np.argsort(self.edge_tail, kind='stable')
+        self.start = np.searchsorted(self.edge_tail[self.order], np.arange(n + 1))
+        self.probabilities = np.zeros((len(self.destinations), m))
+        if m:
+            tails = self.edge_tail[self.order]
+            new_run = np.r_[True, tails[1:] != tails[:-1]]
+            runs, run = np.flatnonzero(new_run), np.cumsum(new_run) - 1
+            scores = (self.values[:, self.edge_head[self.order]] - self.cost[self.order]) / self.mu
+            with np.errstate(invalid='ignore'):
+                weights = np.exp(scores - np.maximum.reduceat(scores, runs, axis=1)[:, run])
+            weights[~np.isfinite(weights)] = 0.0
+            totals = np.add.reduceat(weights, runs, axis=1)[:, run]
+            with np.errstate(invalid='ignore'):
+                self.probabilities[:, self.order] = np.where(totals > 0, weights / totals, 0.0)
+        self._expected = {}  # destination index -> expected travel times
+        self._out_links = {}  # destination index -> per node [(head, edge, probability)]
+
+    def _destination(self, destination):
+        k = self.destination_index.get(destination)
+        if k is None:
+            raise KeyError(f"No value function for destination {destination}.")
+        return k
+
+    def _node(self, node):
+        i = self.node_index.get(node)
+        if i is None:
+            raise KeyError(f"Unknown node {node}.")
+        return i
+
+    def next_hop(self, node, destination):
+        """Successor links of node with their choice probabilities, most likely first."""
+        k, i = self._destination(destination), self._node(node)
+        edges = self.order[self.start[i]:self.start[i + 1]]
+        probabilities = self.probabilities[k, edges]
+        choices = [{'next_node': self.nodes[self.edge_head[e]], 'link_id': self.link_ids[e],
+                    'probability': p, 'travel_time': float(self.cost[e])}
+                   for e, p in zip(edges.tolist(), probabilities.tolist()) if p > 0]
+        choices.sort(key=lambda choice: -choice['probability'])
+        value = float(self.values[k, i])
+        return {'node': node, 'destination': destination, 'value': value if np.isfinite(value) else None,
+                'choices': choices}
+
+    def expected_times(self, k):
+        """Expected travel time of every node to destination index k (inf if it cannot arrive)."""
+        times = self._expected.get(k)
+        if times is not None:
+            return times
+        n = len(self.nodes)
+        dest = self.node_index[self.destination_nodes[k]]
+        transient = np.isfinite(self.values[k]) & (np.arange(n) != dest)
+        times = np.full(n, np.inf)
+        times[dest] = 0.0
+        if transient.any():
+            index = np.cumsum(transient) - 1
+            p = self.probabilities[k]
+            inner = transient[self.edge_tail] & transient[self.edge_head] & (p > 0)
+            size = int(transient.sum())
+            chain = csr_matrix((p[inner], (index[self.edge_tail[inner]], index[self.edge_head[inner]])),
+                               shape=(size, size))
+            immediate = np.bincount(self.edge_tail, weights=p * self.cost, minlength=n)[transient]
+            times[transient] = np.atleast_1d(spsolve((identity(size, format='csr') - chain).tocsc(), immediate))
+        self._expected[k] = times
+        return times
+
+    def precompute(self):
+        """Solve the expected travel times of all destinations (done before a snapshot goes live)."""
+        for k in range(len(self.destinations)):
+            self.expected_times(k)
+        return self
+
+    def expected_travel_time(self, node, destination):
+        time_to_go = float(self.expected_times(self._destination(destination))[self._node(node)])
+        return {'node': node, 'destination': destination,
+                'expected_travel_time': time_to_go if math.isfinite(time_to_go) else None}
+
+    def _links_by_node(self, k):
+        out_links = self._out_links.get(k)
+        if out_links is None:
+            probabilities = self.probabilities[k].tolist()
+            heads = self.edge_head.tolist()
+            order = self.order.tolist()
+            start = self.start.tolist()
+            out_links = [[(heads[e], e, probabilities[e]) for e in order[start[i]:start[i + 1]] if probabilities[e] > 0]
+                         for i in range(len(self.nodes))]
+            self._out_links[k] = out_links
+        return out_links
+
+    def route_distribution(self, origin, destination, k=5, max_expansions=100000):
+        """The k most likely routes from origin to destination with their probabilities."""
+        d, o = self._destination(destination), self._node(origin)
+        dest = self.node_index[self.destination_nodes[d]]
+        out_links = self._links_by_node(d)
+        cost = self.cost
+        routes = []
+        counter = 0
+        heap = [(0.0, counter, o, ())]
+        expansions = 0
+        while heap and len(routes) < k and expansions < max_expansions:
+            log_probability, _, i, edges = heapq.heappop(heap)
+            if i == dest:
+                routes.append({
+                    'nodes': [origin] + [self.nodes[self.edge_head[e]] for e in edges],
+                    'link_ids': [self.link_ids[e] for e in edges],
+                    'probability': math.exp(-log_probability),
+                    'travel_time': float(sum(cost[e] for e in edges)),
+                })
+                continue
+            expansions += 1
+            for head, e, p in out_links[i]:
+                counter += 1
+                heapq.heappush(heap, (log_probability - math.log(p), counter, head, edges + (e,)))
+        return {'origin': origin, 'destination': destination, 'routes': routes,
+                'coverage': sum(route['probability'] for route in routes)}
+
+    def answer(self, request):
+        kind = request.get('type')
+        if kind == 'next_hop':
+            return self.next_hop(request['node'], request['destination'])
+        if kind == 'expected_travel_time':
+            return self.expected_travel_time(request['node'], request['destination'])
+        if kind == 'route_distribution':
+            return self.route_distribution(request['origin'], request['destination'], k=int(request.get('k', 5)))
+        if kind == 'status':
+            return {'snapshot': self.path, 'run_id': self.run_id, 'iteration': self.iteration, 'mu': self.mu,
+                    'nodes': len(self.nodes), 'links': len(self.link_ids), 'destinations': len(self.destinations),
+                    'loaded_at': self.loaded_at}
+        raise ValueError(f"Unknown query type '{kind}', expected one of {GUIDANCE_QUERIES}.")
+
+
+class GuidanceService:
+    """
+    Asyncio JSON-lines server over the latest GuidanceModel of a snapshot directory.
+
+    Queries are answered on the event loop from the precomputed arrays; many clients can
+    be connected at once, and requests of one connection are answered in order. A watcher
+    polls the directory every poll_seconds and loads a newer snapshot in a worker thread
+    (including the expected travel times) before swapping it in, so requests are never
+    blocked by a reload and each one is answered from a single snapshot.
+    """
+
+    def __init__(self, directory, poll_seconds=2.0):
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self.model = None
+        self.requests = 0
+        self.reloads = 0
+
+    async def reload(self):
+        """
+        Load the latest snapshot unless it is the current one: same path and unchanged
+        modification time (a rerun rewrites the same names). Returns True on a swap.
+        """
+        path = latest_snapshot(self.directory)
+        if path is None:
+            return False
+        if self.model is not None and path == self.model.path and os.stat(path).st_mtime_ns == self.model.mtime:
+            return False
+        loop = asyncio.get_running_loop()
+        model = await loop.run_in_executor(None, lambda: GuidanceModel(path).precompute())
+        self.model = model
+        self.reloads += 1
+        print(f"Guidance: iteration {model.iteration} of run {model.run_id} loaded from {path}")
+        return True
+
+    async def watch(self):
+        while True:
+            try:
+                await self.reload()
+            except (OSError, ValueError, KeyError) as error:  # keep serving the previous snapshot
+                print(f"Warning: Guidance snapshot not loaded: {error}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def handle(self, line):
+        """Answer one request line; returns the response dict."""
+        self.requests += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            model = self.model
+            if model is None:
+                raise ValueError(f"No guidance snapshot in {self.directory} yet.")
+            return {'id': request_id, 'ok': True, 'iteration': model.iteration, 'result': model.answer(request)}
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            message = error.args[0] if isinstance(error, KeyError) and error.args else str(error)
+            return {'id': request_id, 'ok': False, 'error': message}
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                writer.write((json.dumps(self.handle(line)) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        await self.reload()
+        watcher = asyncio.create_task(self.watch())
+        server = await asyncio.start_server(self._client, host, port)
+        print(f"Guidance service on {host}:{port} ({self.directory})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+def main():
+    import config
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dir', default=config.guidance_dir)
+    parser.add_argument('--host', default=config.guidance_host)
+    parser.add_argument('--port', type=int, default=config.guidance_port)
+    parser.add_argument('--poll', type=float, default=config.guidance_poll_seconds, help="seconds between reload checks")
+    args = parser.parse_args()
+    asyncio.run(GuidanceService(args.dir, poll_seconds=args.poll).serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import json
+import sys
+import time
+from collections import defaultdict
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+
+class _StageTimer:
+    __slots__ = ('instrumentation', 'name', 'start')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.instrumentation.stage_seconds[self.name] += time.perf_counter() - self.start
+        return False
+
+
+class Instrumentation:
+    """
+    Per-iteration stage timings, counters and peak memory for the rollout pipelines.
+
+    Usage:
+        instr = Instrumentation("instrumentation.jsonl")
+        with instr.stage('value_solve'):
+            ...
+        instr.count('replans', n)
+        instr.end_iteration(outer_iter, system_travel_time=tt)
+
+    Every end_iteration() writes one JSON line with the stage seconds and counters
+    accumulated since the previous one; close() writes the run totals.
+    """
+    enabled = True
+
+    def __init__(self, output_file=None, run_id=None):
+        self.output_file = output_file
+        self.run_id = run_id
+        self._stream = open(output_file, 'w') if output_file else sys.stdout
+        self.stage_seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.total_stage_seconds = defaultdict(float)
+        self.total_counters = defaultdict(int)
+        self.start_time = time.perf_counter()
+
+    def stage(self, name):
+        return _StageTimer(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    @staticmethod
+    def peak_memory_mb():
+        """Peak resident set size of this process in MB (None where unsupported)."""
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+    def _emit(self, record):
+        if self.run_id is not None:
+            record = {'run_id': self.run_id, **record}
+        self._stream.write(json.dumps(record, default=float) + "\n")
+        self._stream.flush()
+
+    def end_iteration(self, iteration, **fields):
+        self._emit({
+            'event': 'iteration',
+            'iteration': iteration,
+            'elapsed_seconds': time.perf_counter() - self.start_time,
+            'stage_seconds': dict(self.stage_seconds),
+            'counters': dict(self.counters),
+            'peak_memory_mb': self.peak_memory_mb(),
+            **fields,
+        })
+        for name, seconds in self.stage_seconds.items():
+            self.total_stage_seconds[name] += seconds
+        for name, n in self.counters.items():
+            self.total_counters[name] += n
+        self.stage_seconds.clear()
+        self.counters.clear()
+
+    def close(self, **fields):
+        if self.stage_seconds or self.counters:
+            self.end_iteration('final')
+        self._emit({
+            'event': 'summary',
+            'elapsed_seconds': time.perf_counter() - self.start_time,
+            'stage_seconds': dict(self.total_stage_seconds),
+            'counters': dict(self.total_counters),
+            'peak_memory_mb': self.peak_memory_mb(),
+            **fields,
+        })
+        if self._stream is not sys.stdout:
+            self._stream.close()
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullInstrumentation:
+    """Disabled instrumentation: every call is a no-op on shared objects."""
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def count(self, name, n=1):
+        pass
+
+    def end_iteration(self, iteration, **fields):
+        pass
+
+    def close(self, **fields):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+def make_instrumentation(enabled, output_file=None, run_id=None):
+    return Instrumentation(output_file, run_id) if enabled else NULL_INSTRUMENTATION
@@ -3,10 +3,11 @@ import numpy as np
 from network_loader import load_network
 from demand_loader import load_demand
 from value_function_solver import solve_value_function
-from path_assignment import assign_paths_from_value_function
-from one_step_rollout_replanned import run_one_step_multiagent_rollout
+from path_assignment import CHOICE_MODELS, assign_paths_from_value_function, assign_paths_from_path_set
+from path_set_choice import PathSet
+from one_step_rollout_replanned import ROLLOUT_MODES, run_one_step_multiagent_rollout
 from results_exporter import export_agent_results, export_link_performance
-from utils import update_link_cost_bpr, make_rollout_update_function
+from utils import update_link_cost_bpr, make_rollout_update_function, initialize_travel_times
 from config import *
 import copy
 import pickle
@@ -21,93 +22,176 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from utils import make_rollout_update_function
+from instrumentation import make_instrumentation
+from tracing import make_tracer
+from flow_accumulator import FlowDeltaAccumulator
+from active_agents import ActiveAgents
+from rng_streams import RolloutStreams
+from synchronous_rollout import SynchronousRollout, run_synchronous_rollout
+from parallel_rollout import ParallelRollout, run_parallel_rollout
+from point_to_point import PointToPointRouter
+from guidance_service import save_guidance
 import time
 
 
-def initialize_travel_times(G):
-    for u, v, attr in G.edges(data=True):
-        attr['flow'] = 0
-        attr['current_travel_time'] = attr['free_flow_travel_time']
-
 def main():
     # Load data
     start_time = time.time()
-
-    G = load_network(node_file, link_file)
-    agents, destination_zones = load_demand(demand_file)
-    initialize_travel_times(G)
+    if rollout_mode not in ROLLOUT_MODES:
+        raise ValueError(f"Unknown rollout mode '{rollout_mode}', expected one of {ROLLOUT_MODES}.")
+    if choice_model not in CHOICE_MODELS:
+        raise ValueError(f"Unknown choice model '{choice_model}', expected one of {CHOICE_MODELS}.")
+    use_path_set = choice_model == 'path_set'
+    run_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"  # tags the guidance snapshots of this run
+    instr = make_instrumentation(instrumentation_enabled, instrumentation_file)
+    tracer = make_tracer(trace_agent_ids, trace_nodes, trace_destinations)
+
+    with instr.stage('load'):
+        G = load_network(node_file, link_file)
+        agents, destination_zones = load_demand(demand_file, packet_size=packet_size)
+        initialize_travel_times(G)
 
     # Initial value function & path assignment
     value_function_dict = {}
-    for dest_zone in destination_zones:
-        value_function = solve_value_function(G, dest_zone)
-        value_function_dict[dest_zone] = value_function
-
-    assign_paths_from_value_function(G, agents, value_function_dict)
-    export_link_performance(G, os.path.join(data_path, "initial_link_performance.csv"))
-
-    for dest_zone in destination_zones:
-        value_function = solve_value_function(G, dest_zone)
-        value_function_dict[dest_zone] = value_function
+    if use_path_set:
+        # plans are drawn from a fixed route set per OD pair; no value functions are needed
+        with instr.stage('initial_assignment'):
+            od_pairs = dict.fromkeys((agent['origin_node'], agent['destination_node']) for agent in agents)
+            path_set = PathSet(G, od_pairs, method=path_set_method, k=path_set_size)
+            path_rng = np.random.default_rng(random_seed)
+            assign_paths_from_path_set(G, agents, path_set, path_rng, mu=mu, beta=path_size_beta)
+            for u, v in G.edges():
+                update_link_cost_bpr(G, u, v)
+        print(f"Path set: {len(path_set.path_links)} paths for {len(path_set.od_pairs)} OD pairs")
+    else:
+        with instr.stage('value_solve'):
+            for dest_zone in destination_zones:
+                value_function = solve_value_function(G, dest_zone, instrumentation=instr, tracer=tracer)
+                value_function_dict[dest_zone] = value_function
+
+        with instr.stage('initial_assignment'):
+            assign_paths_from_value_function(G, agents, value_function_dict)
+    with instr.stage('export'):
+        export_link_performance(G, os.path.join(data_path, "initial_link_performance.csv"))
+
+    if not use_path_set:
+        with instr.stage('value_solve'):
+            for dest_zone in destination_zones:
+                value_function = solve_value_function(G, dest_zone, instrumentation=instr, tracer=tracer)
+                value_function_dict[dest_zone] = value_function
+        if guidance_export:
+            with instr.stage('export'):
+                save_guidance(guidance_dir, 0, G, value_function_dict, mu, run_id=run_id)
+    instr.end_iteration('initial')
 
     system_travel_time_history = []  # Track system travel time
+    flow_deltas = FlowDeltaAccumulator(G)
+    active_agents = ActiveAgents(agents)
+    streams = RolloutStreams(random_seed)
+    router = PointToPointRouter(G, point_to_point_router) if point_to_point_router else None
+    sync_engine = parallel_engine = None
+    if not use_path_set and rollout_mode == 'synchronous':
+        sync_engine = SynchronousRollout(G, agents, streams=streams)
+    elif not use_path_set and rollout_mode == 'parallel':
+        parallel_engine = ParallelRollout(G, agents, n_workers=rollout_workers, sync_points=rollout_sync_points,
+                                          streams=streams)
 
     # Outer iteration loop
     outer_iter = 0
     best_tt = 0
-    while outer_iter < max_outer_iterations:
-        print(f"\n=== Rollout Iteration {outer_iter + 1} ===")
-
-        # ✅ Add this block
-        total_tt = sum(
-            attr['current_travel_time'] * attr.get('flow', 0)
-            for _, _, attr in G.edges(data=True)
-        )
-
-        if total_tt < best_tt or not best_tt:
-            best_tt = total_tt
-
-        system_travel_time_history.append(best_tt)
-
-        completed_count = run_one_step_multiagent_rollout(
-            G, agents, value_function_dict, mu=mu, greedy=False
-        )
-
-        # Create an output folder once
-        os.makedirs(os.path.join(data_path, "snapshots"), exist_ok=True)
-
-        # Save a deep copy of G and agents
-        snapshot = {
-            'G': copy.deepcopy(G),
-            'agents': copy.deepcopy(agents)
-        }
-        with open(os.path.join(data_path, f"snapshots/iter_{outer_iter}.pkl"), 'wb') as f:
-            pickle.dump(snapshot, f)
-
-        for u, v in G.edges():
-            update_link_cost_bpr(G, u, v)
-
-
-
-        export_link_performance(G, os.path.join(data_path, f"link_performance_iter{outer_iter}.csv"))
-        # if completed_count == len(agents):
-        #     print(f"\n All agents completed by iteration {outer_iter + 1}")
-        #     break
-
-        # Update value function for all destinations
-        for dest_zone in destination_zones:
-            value_function = solve_value_function(G, dest_zone)
-            value_function_dict[dest_zone] = value_function
-
-        outer_iter += 1
+    try:
+        while outer_iter < max_outer_iterations:
+            print(f"\n=== Rollout Iteration {outer_iter + 1} ===")
+            if tracer is not None:
+                tracer.iteration = outer_iter
+
+            # ✅ Add this block
+            total_tt = sum(
+                attr['current_travel_time'] * attr.get('flow', 0)
+                for _, _, attr in G.edges(data=True)
+            )
+
+            if total_tt < best_tt or not best_tt:
+                best_tt = total_tt
+
+            system_travel_time_history.append(best_tt)
+
+            with instr.stage('rollout'):
+                if use_path_set:
+                    # every agent draws a new full path under the current travel times
+                    completed_count = assign_paths_from_path_set(G, agents, path_set, path_rng, mu=mu,
+                                                                 beta=path_size_beta)
+                elif rollout_mode == 'synchronous':
+                    completed_count = run_synchronous_rollout(
+                        sync_engine, value_function_dict, mu=mu, greedy=False, damping=rollout_damping,
+                        instrumentation=instr
+                    )
+                elif rollout_mode == 'parallel':
+                    completed_count = run_parallel_rollout(
+                        parallel_engine, value_function_dict, mu=mu, greedy=False, instrumentation=instr
+                    )
+                else:
+                    completed_count = run_one_step_multiagent_rollout(
+                        G, agents, value_function_dict, mu=mu, greedy=False, instrumentation=instr, tracer=tracer,
+                        update_cadence=rollout_update_cadence, chunk_size=rollout_chunk_size, flow_deltas=flow_deltas,
+                        active=active_agents, streams=streams, router=router
+                    )
+
+            with instr.stage('snapshot'):
+                if sync_engine is not None:
+                    sync_engine.sync_agents()  # the agent dicts are read from here on
+
+                # Create an output folder once
+                os.makedirs(os.path.join(data_path, "snapshots"), exist_ok=True)
+
+                # Save a deep copy of G and agents
+                snapshot = {
+                    'G': copy.deepcopy(G),
+                    'agents': copy.deepcopy(agents)
+                }
+                with open(os.path.join(data_path, f"snapshots/iter_{outer_iter}.pkl"), 'wb') as f:
+                    pickle.dump(snapshot, f)
+
+            with instr.stage('bpr_update'):
+                for u, v in G.edges():
+                    update_link_cost_bpr(G, u, v)
+                instr.count('bpr_updates', G.number_of_edges())
+
+            with instr.stage('export'):
+                export_link_performance(G, os.path.join(data_path, f"link_performance_iter{outer_iter}.csv"))
+            # if completed_count == len(agents):
+            #     print(f"\n All agents completed by iteration {outer_iter + 1}")
+            #     break
+
+            # Update value function for all destinations
+            if not use_path_set:
+                with instr.stage('value_solve'):
+                    for dest_zone in destination_zones:
+                        value_function = solve_value_function(G, dest_zone, instrumentation=instr, tracer=tracer)
+                        value_function_dict[dest_zone] = value_function
+                if guidance_export:
+                    with instr.stage('export'):
+                        # picked up by a running guidance_service.py
+                        save_guidance(guidance_dir, outer_iter + 1, G, value_function_dict, mu, run_id=run_id)
+
+            instr.end_iteration(outer_iter, system_travel_time=total_tt, completed_agents=completed_count)
+            outer_iter += 1
+    finally:
+        # stop the workers and release the shared memory even if an iteration fails
+        if parallel_engine is not None:
+            parallel_engine.close()
 
     end_time = time.time()
     print(f"Computation time: {end_time - start_time:.4f} seconds")
     # Export results
-    export_agent_results(agents, agent_result_file)
-    export_link_performance(G, link_performance_file)
-    np.savetxt(os.path.join(data_path, "multiagent_system_travel_time.csv"),
-               system_travel_time_history, delimiter=",")
+    with instr.stage('export'):
+        export_agent_results(agents, agent_result_file)
+        export_link_performance(G, link_performance_file)
+        np.savetxt(os.path.join(data_path, "multiagent_system_travel_time.csv"),
+                   system_travel_time_history, delimiter=",")
+    instr.close(computation_seconds=end_time - start_time)
+    if tracer is not None:
+        tracer.dump(trace_output_file)
 
     print("\n Export complete.")
 
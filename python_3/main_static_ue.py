@@ -4,21 +4,62 @@ import pandas as pd
 import networkx as nx
 from config import *
 from network_loader import load_network
-from demand_loader import load_demand
+from demand_loader import load_od_demand, load_od_table
 from utils import update_link_travel_times
+from instrumentation import make_instrumentation
+from path_based_ue import PathBasedUE
+from bush_ue import BushUE
+from shortest_path_cache import ShortestPathService
+from contraction_hierarchy import ContractionHierarchy
+from point_to_point import PointToPointRouter
 import time
 
+
 def main():
     # Load network and demand
     start_time = time.time()
+    instr = make_instrumentation(instrumentation_enabled, instrumentation_file)
 
-    G = load_network(node_file, link_file)
-    agents, destination_zones = load_demand(demand_file)
+    with instr.stage('load'):
+        G = load_network(node_file, link_file)
 
     # Initialize free-flow travel times
     for u, v, attr in G.edges(data=True):
         attr['current_travel_time'] = attr['free_flow_travel_time']
 
+    if ue_method == 'gradient_projection':
+        last_link_flows, system_travel_time_history = solve_gradient_projection(G, instr)
+    elif ue_method == 'bush':
+        last_link_flows, system_travel_time_history = solve_bush(G, instr)
+    elif ue_method == 'msa':
+        last_link_flows, system_travel_time_history = solve_msa(G, instr)
+    else:
+        raise ValueError(f"Unknown ue_method '{ue_method}', expected 'msa', 'gradient_projection' or 'bush'.")
+
+    end_time = time.time()
+    print(f"Computation time: {end_time - start_time:.4f} seconds")
+
+    export_results(G, last_link_flows, system_travel_time_history, instr)
+    instr.close(computation_seconds=end_time - start_time)
+
+
+def solve_msa(G, instr):
+    """
+    Link-based UE: all-or-nothing loading per agent with MSA averaging. Leaves the
+    travel times on G.
+
+    Returns:
+        link_flows (dict): {link_id: flow}.
+        system_travel_time_history (list): Total system travel time per iteration.
+    """
+    with instr.stage('load'):
+        demand = load_od_demand(demand_file, packet_size=packet_size)
+
+    # the hierarchy is built once for the topology and re-customized whenever the costs change
+    hierarchy = ContractionHierarchy(G) if shortest_path_backend == 'cch' else None
+    paths = ShortestPathService(G, hierarchy=hierarchy)
+    # with few OD pairs, point-to-point searches cover the corridors instead of whole trees
+    router = PointToPointRouter(G, point_to_point_router) if point_to_point_router else None
     flow_change_history = []
     system_travel_time_history = []
     last_link_flows = None
@@ -29,38 +70,50 @@ def main():
         # Step 1: All-Or-Nothing assignment
         new_link_flows = {attr['link_id']: 0 for _, _, attr in G.edges(data=True)}
 
-        for agent in agents:
-            try:
-                shortest_path = nx.shortest_path(
-                    G,
-                    source=agent['origin_node'],
-                    target=agent['destination_node'],
-                    weight=lambda u, v, d: d.get('current_travel_time', d['free_flow_travel_time'])
-                )
-            except nx.NetworkXNoPath:
-                continue
-
-            # Increment flows along the path
-            for i in range(len(shortest_path) - 1):
-                u = shortest_path[i]
-                v = shortest_path[i+1]
-                link_id = G[u][v]['link_id']
-                new_link_flows[link_id] += 1  # 1 trip per agent
+        with instr.stage('shortest_paths'):
+            # one tree per origin and cost version, shared by all agents of the origin
+            paths.update_costs()
+            misses = paths.misses
+            od_paths = {}
+            # agents are streamed from the OD table, one chunk in memory at a time
+            for agents in demand.iter_chunks(demand_chunk_size):
+                for agent in agents:
+                    if router is None:
+                        shortest_path = paths.path(agent['origin_node'], agent['destination_node'])
+                    else:
+                        od = (agent['origin_node'], agent['destination_node'])
+                        if od not in od_paths:
+                            od_paths[od] = router.path(*od)
+                        shortest_path = od_paths[od]
+                    if shortest_path is None:
+                        continue
+
+                    # Increment flows along the path
+                    for i in range(len(shortest_path) - 1):
+                        u = shortest_path[i]
+                        v = shortest_path[i+1]
+                        link_id = G[u][v]['link_id']
+                        new_link_flows[link_id] += agent['volume']  # vehicles carried by the agent
+            instr.count('shortest_path_trees', paths.misses - misses)
+            instr.count('shortest_path_queries', len(demand))
 
         # Step 2: MSA Flow Update
-        if last_link_flows is None:
-            relaxed_link_flows = new_link_flows.copy()
-        else:
-            lambda_relax = 1.0 / (outer_iter + 1)
-            relaxed_link_flows = {}
-            for link_id in new_link_flows.keys():
-                old_flow = last_link_flows.get(link_id, 0)
-                new_flow = new_link_flows[link_id]
-                relaxed_flow = (1 - lambda_relax) * old_flow + lambda_relax * new_flow
-                relaxed_link_flows[link_id] = relaxed_flow
+        with instr.stage('msa_update'):
+            if last_link_flows is None:
+                relaxed_link_flows = new_link_flows.copy()
+            else:
+                lambda_relax = 1.0 / (outer_iter + 1)
+                relaxed_link_flows = {}
+                for link_id in new_link_flows.keys():
+                    old_flow = last_link_flows.get(link_id, 0)
+                    new_flow = new_link_flows[link_id]
+                    relaxed_flow = (1 - lambda_relax) * old_flow + lambda_relax * new_flow
+                    relaxed_link_flows[link_id] = relaxed_flow
 
         # Step 3: Update travel times
-        update_link_travel_times(G, relaxed_link_flows)
+        with instr.stage('bpr_update'):
+            update_link_travel_times(G, relaxed_link_flows)
+            instr.count('bpr_updates', G.number_of_edges())
 
         # Step 4: Log system travel time
         total_system_tt = sum(
@@ -68,7 +121,7 @@ def main():
             for _, _, attr in G.edges(data=True)
         )
         system_travel_time_history.append(total_system_tt)
-
+        instr.end_iteration(outer_iter, system_travel_time=total_system_tt)
 
 
         last_link_flows = relaxed_link_flows.copy()
@@ -93,32 +146,104 @@ def main():
                 print(f"Converged after {outer_iter + 1} iterations (relative gap)")
                 break
 
-    end_time = time.time()
-    print(f"Computation time: {end_time - start_time:.4f} seconds")
+    print(f"Shortest path trees: {paths.misses} solved, hit ratio {paths.hit_ratio():.3f}")
+    return last_link_flows, system_travel_time_history
+
+
+def solve_gradient_projection(G, instr):
+    """
+    Path-based UE (PathBasedUE) on the OD table. Leaves flows and travel times on G and
+    writes the path flows next to the other results.
+
+    Returns:
+        link_flows (dict): {link_id: flow}.
+        system_travel_time_history (list): Total system travel time per iteration.
+    """
+    with instr.stage('load'):
+        od_table, _ = load_od_table(demand_file)
+    ue = PathBasedUE(G, od_table).initialize()
+
+    for outer_iter in range(ue_max_iterations):
+        print(f"=== Gradient Projection Iteration {outer_iter+1} ===")
+        with instr.stage('gradient_projection'):
+            rel_gap = ue.iterate(inner_sweeps=ue_inner_sweeps)
+        print(f"Relative gap: {rel_gap:.3e} ({len(ue.path_links)} paths)")
+        instr.end_iteration(outer_iter, system_travel_time=ue.system_travel_time_history[-1], relative_gap=rel_gap)
+        if rel_gap < ue_gap_tolerance:
+            print(f"Converged after {outer_iter + 1} iterations (relative gap)")
+            break
+
+    ue.write_to_graph()
+    with instr.stage('export'):
+        pd.DataFrame(ue.path_records()).to_csv(os.path.join(data_path, "ue_path_flows.csv"), index=False)
+        np.savetxt(os.path.join(data_path, "static_ue_relative_gap.csv"), ue.gap_history, delimiter=",")
+    link_flows = {attr['link_id']: attr['flow'] for _, _, attr in G.edges(data=True)}
+    return link_flows, ue.system_travel_time_history
+
+
+def solve_bush(G, instr):
+    """
+    Origin-based UE (BushUE, Algorithm B) on the OD table. Starts from the bushes in
+    ue_bush_file when ue_warm_start is set and saves the final bushes there. Leaves
+    flows and travel times on G.
+
+    Returns:
+        link_flows (dict): {link_id: flow}.
+        system_travel_time_history (list): Total system travel time per iteration.
+    """
+    with instr.stage('load'):
+        od_table, _ = load_od_table(demand_file)
+    ue = BushUE(G, od_table)
+    if ue_warm_start and os.path.exists(ue_bush_file):
+        print(f"Warm start from {ue_bush_file}")
+        ue.warm_start(ue_bush_file)
+    else:
+        ue.initialize()
+
+    for outer_iter in range(ue_max_iterations):
+        print(f"=== Bush Iteration {outer_iter+1} ===")
+        with instr.stage('bush'):
+            rel_gap = ue.iterate(inner_passes=ue_inner_sweeps)
+        print(f"Relative gap: {rel_gap:.3e} ({int(ue.bush.sum())} bush links)")
+        instr.end_iteration(outer_iter, system_travel_time=ue.system_travel_time_history[-1], relative_gap=rel_gap)
+        if rel_gap < ue_gap_tolerance:
+            print(f"Converged after {outer_iter + 1} iterations (relative gap)")
+            break
+
+    ue.write_to_graph()
+    with instr.stage('export'):
+        ue.save(ue_bush_file)
+        np.savetxt(os.path.join(data_path, "static_ue_relative_gap.csv"), ue.gap_history, delimiter=",")
+    link_flows = {attr['link_id']: attr['flow'] for _, _, attr in G.edges(data=True)}
+    return link_flows, ue.system_travel_time_history
+
+
+def export_results(G, last_link_flows, system_travel_time_history, instr):
+    with instr.stage('export'):
+        records = []
+        for u, v, attr in G.edges(data=True):
+            link_id = attr['link_id']
+            flow = last_link_flows.get(link_id, 0)
+            # travel_time = attr['free_flow_travel_time']  # still using free flow for now
+            travel_time = attr.get('current_travel_time', attr['free_flow_travel_time'])
+
+            records.append({
+                'link_id': link_id,
+                'from_node_id': u,
+                'to_node_id': v,
+                'flow': flow,
+                'travel_time': travel_time,
+                'free_flow_travel_time': attr['free_flow_travel_time']
+            })
+
+        df_link_performance = pd.DataFrame(records)
+        # df_link_performance.sort_values(by='link_id', ascending=True)
+
+        df_link_performance.to_csv(os.path.join(data_path, "UE_linkperformance.csv"), index=False)
+
+        # Save static assignment history
+        np.savetxt(os.path.join(data_path, "static_ue_system_travel_time.csv"), system_travel_time_history, delimiter=",")
 
-    records = []
-    for u, v, attr in G.edges(data=True):
-        link_id = attr['link_id']
-        flow = last_link_flows.get(link_id, 0)
-        # travel_time = attr['free_flow_travel_time']  # still using free flow for now
-        travel_time = attr.get('current_travel_time', attr['free_flow_travel_time'])
-
-        records.append({
-            'link_id': link_id,
-            'from_node_id': u,
-            'to_node_id': v,
-            'flow': flow,
-            'travel_time': travel_time,
-            'free_flow_travel_time': attr['free_flow_travel_time']
-        })
-
-    df_link_performance = pd.DataFrame(records)
-    # df_link_performance.sort_values(by='link_id', ascending=True)
-
-    df_link_performance.to_csv(os.path.join(data_path, "UE_linkperformance.csv"), index=False)
-
-    # Save static assignment history
-    np.savetxt(os.path.join(data_path, "static_ue_system_travel_time.csv"), system_travel_time_history, delimiter=",")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,71 @@
+# network_cache.py
+
+"""
+Binary cache of parsed network files, shared by python/network_loader.py and
+python_3/network_loader.py so that both keep one key scheme and one on-disk layout.
+
+An entry is a folder cache_dir/<key> of <name>.npy files, one per parsed array. The key
+hashes the contents of the node and link files together with the loader's namespace
+(its name and cache format), so the loaders can share a cache folder without reading
+each other's entries.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+CACHE_DIR_NAME = '.network_cache'
+
+
+def _file_digest(path, digest):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+
+def network_cache_key(node_file: str, link_file: str, namespace: str):
+    """Hash of the loader namespace and the contents of both input files."""
+    digest = hashlib.sha1(namespace.encode())
+    _file_digest(node_file, digest)
+    _file_digest(link_file, digest)
+    return digest.hexdigest()
+
+
+def default_cache_dir(link_file: str):
+    """The .network_cache folder next to the link file."""
+    return os.path.join(os.path.dirname(os.path.abspath(link_file)), CACHE_DIR_NAME)
+
+
+def load_cached_arrays(node_file: str, link_file: str, parse, namespace: str, cache_dir=None, use_cache=True):
+    """
+    Arrays returned by parse(node_file, link_file), cached under the namespace.
+
+    A cached entry is memory-mapped instead of parsing again. A new entry is written to a
+    staging folder and renamed into place, so readers only ever see complete entries.
+    """
+    if not use_cache:
+        return parse(node_file, link_file)
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir(link_file)
+    entry = os.path.join(cache_dir, network_cache_key(node_file, link_file, namespace))
+    if os.path.isdir(entry):
+        return {name[:-4]: np.load(os.path.join(entry, name), mmap_mode='r')
+                for name in os.listdir(entry) if name.endswith('.npy')}
+
+    arrays = parse(node_file, link_file)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=cache_dir)
+        for name, values in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), values)
+        try:
+            os.rename(staging, entry)  # complete entries only
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)  # written by another run meanwhile
+    except OSError as e:
+        print(f"Warning: Could not write network cache in {cache_dir}: {e}")
+    return arrays
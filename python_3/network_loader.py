@@ -1,46 +1,84 @@
 # network_loader.py
 
+import numpy as np
 import pandas as pd
 import networkx as nx
 
+try:
+    from network_cache import load_cached_arrays, network_cache_key as _cache_key
+except ImportError:  # imported as python_3.network_loader by the python_2 scripts
+    from python_3.network_cache import load_cached_arrays, network_cache_key as _cache_key
 
-def load_network(node_file: str, link_file: str):
+# bump when the cached arrays change, so old caches are not picked up
+CACHE_FORMAT = 1
+CACHE_NAMESPACE = f"network-v{CACHE_FORMAT}"  # keeps this loader's entries apart in a shared cache folder
+
+NODE_COLUMNS = {'node_id': np.int64, 'zone_id': np.float64, 'x_coord': np.float64, 'y_coord': np.float64}
+LINK_COLUMNS = {'link_id': np.int64, 'from_node_id': np.int64, 'to_node_id': np.int64, 'length': np.float64,
+                'lanes': np.float64, 'free_speed': np.float64, 'capacity': np.float64}
+
+
+def network_cache_key(node_file: str, link_file: str):
+    """Key of this loader's cache entry for the two input files (see network_cache.py)."""
+    return _cache_key(node_file, link_file, CACHE_NAMESPACE)
+
+
+def _parse_network_arrays(node_file, link_file):
+    """Read only the needed columns with fixed dtypes and derive the link arrays."""
+    node_df = pd.read_csv(node_file, usecols=list(NODE_COLUMNS), dtype=NODE_COLUMNS)
+    link_df = pd.read_csv(link_file, usecols=list(LINK_COLUMNS), dtype=LINK_COLUMNS)
+
+    arrays = {f"node_{name}": node_df[name].to_numpy() for name in NODE_COLUMNS}
+    arrays.update({f"link_{name}": link_df[name].to_numpy() for name in LINK_COLUMNS})
+    arrays['link_capacity'] = arrays['link_lanes'] * arrays['link_capacity']  # total capacity
+    arrays['link_free_flow_travel_time'] = (arrays['link_length'] / arrays['link_free_speed']) * 60 / 1000  # minutes
+    return arrays
+
+
+def load_network_arrays(node_file: str, link_file: str, cache_dir=None, use_cache=True):
+    """
+    Network as flat numpy arrays (node_* and link_* columns), parsed once per input.
+
+    The parsed arrays are cached as .npy files in cache_dir/<hash of the inputs>
+    (default: a .network_cache folder next to the link file). Later calls with the same
+    file contents memory-map the cache instead of parsing the CSV files again.
+    """
+    return load_cached_arrays(node_file, link_file, _parse_network_arrays, CACHE_NAMESPACE,
+                              cache_dir=cache_dir, use_cache=use_cache)
+
+
+def load_network(node_file: str, link_file: str, cache_dir=None, use_cache=True):
     """
     Load nodes and links from CSV files and create a directed graph.
 
     Args:
         node_file (str): Path to the node CSV file.
         link_file (str): Path to the link CSV file.
+        cache_dir (str, optional): Folder of the binary network cache (see load_network_arrays).
+        use_cache (bool): Read and write the binary network cache.
 
     Returns:
         G (nx.DiGraph): Directed networkx graph with node and link attributes.
     """
-    # Load node and link data
-    node_df = pd.read_csv(node_file)
-    link_df = pd.read_csv(link_file)
+    arrays = load_network_arrays(node_file, link_file, cache_dir=cache_dir, use_cache=use_cache)
 
     # Initialize directed graph
     G = nx.DiGraph()
 
     # Add nodes
-    for _, row in node_df.iterrows():
-        zone_id = row['zone_id'] if pd.notna(row['zone_id']) and row['zone_id'] != 0 else None
-        G.add_node(row['node_id'],
-                   x_coord=row['x_coord'],
-                   y_coord=row['y_coord'],
-                   zone_id=zone_id)
+    zone_ids = [int(zone) if zone == zone and zone != 0 else None for zone in arrays['node_zone_id'].tolist()]
+    G.add_nodes_from(
+        (node_id, {'x_coord': x, 'y_coord': y, 'zone_id': zone_id})
+        for node_id, x, y, zone_id in zip(arrays['node_node_id'].tolist(), arrays['node_x_coord'].tolist(),
+                                          arrays['node_y_coord'].tolist(), zone_ids)
+    )
 
     # Add links
-    for _, row in link_df.iterrows():
-        total_capacity = row['lanes'] * row['capacity']
-        free_flow_travel_time = (row['length'] / row['free_speed']) * 60 / 1000  # minutes
-
-        G.add_edge(row['from_node_id'], row['to_node_id'],
-                   link_id=row['link_id'],
-                   length=row['length'],
-                   lanes=row['lanes'],
-                   free_speed=row['free_speed'],
-                   capacity=total_capacity,
-                   free_flow_travel_time=free_flow_travel_time)
+    columns = ['link_id', 'length', 'lanes', 'free_speed', 'capacity', 'free_flow_travel_time']
+    values = [arrays[f"link_{name}"].tolist() for name in columns]
+    G.add_edges_from(
+        (u, v, dict(zip(columns, row)))
+        for u, v, *row in zip(arrays['link_from_node_id'].tolist(), arrays['link_to_node_id'].tolist(), *values)
+    )
 
     return G
@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class NextHopTable:
+    """
+    Greedy next hop of every node, per destination, under the current value functions.
+
+    The greedy successor of a node only depends on the node, the destination, the value
+    function and the outgoing travel times, so it is computed once for all nodes when a
+    value function is loaded (update) instead of for every agent that traces a path.
+    path() then follows the pointers in O(path length) and reuses the cached paths of
+    nodes visited before.
+
+    Travel times may change between value-function updates (flows are loaded during the
+    rollout): invalidate_nodes() marks the tails of re-costed links and their next hops
+    are recomputed lazily, for one destination at a time, the next time a path passes them.
+    """
+
+    def __init__(self, G):
+        self.G = G
+        self.nodes = list(G.nodes())
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+
+        # edges in G.edges() order, i.e. successors of a node in G.successors() order
+        self.edge_tail = np.array([self.node_index[u] for u, _ in G.edges()], dtype=np.int64)
+        self.edge_head = np.array([self.node_index[v] for _, v in G.edges()], dtype=np.int64)
+
+        self.version = 0  # bumped by every invalidate_nodes() call
+        self.node_version = [0] * len(self.nodes)  # version at which a node's outgoing costs last changed
+        self.tables = {}  # destination -> {'next_hop', 'next', 'stamp', 'values', 'paths'}
+
+    def update(self, destination, value_function):
+        """Recompute the next hop of every node for one destination."""
+        values = np.array([value_function.get(node, -np.inf) for node in self.nodes], dtype=float)
+        costs = np.array([attr['current_travel_time'] for _, _, attr in self.G.edges(data=True)], dtype=float)
+
+        next_hop = np.full(len(self.nodes), -1, dtype=np.int64)
+        if len(costs):
+            scores = values[self.edge_head] - costs
+            # per tail, the best score first and the first successor among ties (as max() would)
+            order = np.lexsort((np.arange(len(scores)), -scores, self.edge_tail))
+            tails = self.edge_tail[order]
+            first = order[np.r_[True, tails[1:] != tails[:-1]]]
+            first = first[scores[first] > -np.inf]
+            next_hop[self.edge_tail[first]] = self.edge_head[first]
+
+        self.tables[destination] = {
+            'next_hop': next_hop,
+            'next': next_hop.tolist(),
+            'stamp': [self.version] * len(self.nodes),
+            'values': values.tolist(),
+            'paths': {},  # start node index -> (version, tuple of links)
+        }
+        return self
+
+    def update_all(self, value_function_dict):
+        for destination, value_function in value_function_dict.items():
+            self.update(destination, value_function)
+        return self
+
+    def invalidate_nodes(self, nodes):
+        """Mark nodes whose outgoing travel times changed since the tables were built."""
+        self.version += 1
+        for node in nodes:
+            self.node_version[self.node_index[node]] = self.version
+
+    def _recompute(self, table, i):
+        G = self.G
+        node = self.nodes[i]
+        values = table['values']
+        best, best_score = -1, -np.inf
+        for succ, attr in G[node].items():
+            j = self.node_index[succ]
+            score = values[j] - attr['current_travel_time']
+            if score > best_score:
+                best, best_score = j, score
+        table['next'][i] = best
+        table['next_hop'][i] = best
+        table['stamp'][i] = self.version
+        return best
+
+    def next_hop(self, node, destination):
+        """Greedy successor of node towards destination, or None if there is none."""
+        table = self.tables[destination]
+        i = self.node_index[node]
+        j = table['next'][i]
+        if table['stamp'][i] < self.node_version[i]:
+            j = self._recompute(table, i)
+        return None if j < 0 else self.nodes[j]
+
+    def path(self, start_node, destination):
+        """
+        Greedy path from start_node to destination as a list of (u, v) links.
+
+        The path stops early at a node without a reachable successor (or if the pointers
+        run into a cycle).
+        """
+        table = self.tables[destination]
+        paths = table['paths']
+        version = self.version
+        start = self.node_index[start_node]
+
+        cached = paths.get(start)
+        if cached is not None and cached[0] == version:
+            return list(cached[1])
+
+        nodes, nxt, stamp, node_version = self.nodes, table['next'], table['stamp'], self.node_version
+        dest = self.node_index[destination]
+        links = []
+        curr = start
+        max_links = len(nodes)
+        while curr != dest and len(links) < max_links:
+            cached = paths.get(curr)
+            if cached is not None and cached[0] == version:
+                links.extend(cached[1])
+                break
+            j = nxt[curr]
+            if stamp[curr] < node_version[curr]:
+                j = self._recompute(table, curr)
+            if j < 0:
+                break
+            links.append((nodes[curr], nodes[j]))
+            curr = j
+
+        paths[start] = (version, tuple(links))
+        return links
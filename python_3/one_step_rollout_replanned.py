@@ -1,93 +1,172 @@
 import numpy as np
-from utils import softmax, trace_greedy_path_from_value_function, update_link_cost_bpr
+from utils import softmax, trace_greedy_path_from_value_function
+from instrumentation import NULL_INSTRUMENTATION
+from flow_accumulator import FlowDeltaAccumulator, UPDATE_CADENCES
+from next_hop import NextHopTable
+from active_agents import ActiveAgents
+from rng_streams import sample_index
 
+ROLLOUT_MODES = ('sequential', 'synchronous', 'parallel')
 
-def run_one_step_multiagent_rollout(G, agents, value_function_dict, mu=0.1, greedy=False, random_seed=None):
+
+def _step_agent(G, agent, V, mu, greedy, flow_deltas, next_hops, u=None, router=None):
     """
-    Perform one-step rollout per agent. If agent deviates from current plan, replan from current node.
-    - Updates flows accordingly.
-    - Updates BPR travel times.
-    - Returns number of agents that completed their trip.
+    Move one agent a single link and replan if it left its planned path.
+    Flow changes of the agent's volume (vehicles per packet, default 1) are queued in
+    flow_deltas (FlowDeltaAccumulator) for the caller to flush;
+    replanning follows next_hops (NextHopTable), or searches router (PointToPointRouter)
+    when given. u is the agent's uniform for this step
+    (RolloutStreams); without it the successor is drawn from the global numpy RNG.
+
+    Returns:
+        (successors, scores, probs, next_node, new_plan), with new_plan None when the agent
+        followed its plan, or None if the agent is stuck.
     """
-
-    if random_seed is not None:
-        np.random.seed(random_seed)
-
-    completed_count = 0
-    agent_indices = np.random.permutation(len(agents))
-
-    for idx in agent_indices:
-        agent = agents[idx]
-        curr = agent['current_position']
-        dest = agent['destination_node']
-
-
-        V = value_function_dict[dest]
-
-        if curr == dest:
-            completed_count += 1
-            continue
-
-        successors = list(G.successors(curr))
-        if not successors:
-            print(f"Warning: Agent {agent['agent_id']} stuck at node {curr}. No successors.")
-            break
-
-        # Compute scores for each successor
-        scores = [-G[curr][s]['current_travel_time'] + V.get(s, float('-inf')) for s in successors]
-
-        if greedy:
-            selected_idx = int(np.argmax(scores))
-        else:
-            probs = softmax(np.array(scores) / mu)
+    curr = agent['current_position']
+    dest = agent['destination_node']
+
+    successors = list(G.successors(curr))
+    if not successors:
+        print(f"Warning: Agent {agent['agent_id']} stuck at node {curr}. No successors.")
+        return None
+
+    # Compute scores for each successor
+    scores = [-G[curr][s]['current_travel_time'] + V.get(s, float('-inf')) for s in successors]
+
+    if greedy:
+        probs = None
+        selected_idx = int(np.argmax(scores))
+    else:
+        probs = softmax(np.array(scores) / mu)
+        if u is None:
             selected_idx = np.random.choice(len(successors), p=probs)
+        else:
+            selected_idx = sample_index(probs, u)
 
-        next_node = successors[selected_idx]
-        next_link = (curr, next_node)
-
-        # Move the agent
-        agent['traveled_path'].append(G[curr][next_node]['link_id'])
-        agent['current_position'] = next_node
-
-        if idx == 226:
-            print(f"agent {idx} planned links {agent['planned_links']}")
-
-
-        # Replanning check: is this the same as planned?
-        if not agent['planned_links'] or agent['planned_links'][0] != next_link:
-            G[next_link[0]][next_link[1]]['flow'] += 1
-            update_link_cost_bpr(G, next_link[0], next_link[1])
+    next_node = successors[selected_idx]
+    next_link = (curr, next_node)
 
-            if idx == 226:
-                print(f"agent {idx} needs replan since next planned link {agent['planned_links'][0]} is not the same as the next selected link {next_link}")
+    # Move the agent
+    agent['traveled_path'].append(G[curr][next_node]['link_id'])
+    agent['current_position'] = next_node
 
-            # Remove flow along old remaining path
-            for link in agent['planned_links']:
-                G[link[0]][link[1]]['flow'] -= 1
-                # update_link_cost_bpr(G, link[0], link[1])
-                # G[link[0]][link[1]]['flow'] = max(G[link[0]][link[1]]['flow'] - 1, 0)
+    # Replanning check: is this the same as planned?
+    if not agent['planned_links'] or agent['planned_links'][0] != next_link:
+        volume = agent.get('volume', 1)
+        flow_deltas.add(next_link, volume)
 
+        # Remove flow along old remaining path
+        flow_deltas.add_path(agent['planned_links'], -volume)
 
-            # Recompute new path from current node using V
-            new_path = trace_greedy_path_from_value_function(G, next_node, dest, V)
-            # print(f"agent {idx} needed replan and the new plan is {[next_link] + new_path}")
+        # Recompute new path from current node using V
+        new_plan = trace_greedy_path_from_value_function(G, next_node, dest, V, next_hops, router=router)
+        agent['planned_links'] = new_plan
+        flow_deltas.add_path(new_plan, volume)
+    else:
+        # Continue down planned path, just remove used link
+        agent['planned_links'] = agent['planned_links'][1:]
+        new_plan = None
 
-            agent['planned_links'] = new_path
+    return successors, scores, probs, next_node, new_plan
 
-            if idx == 226:
-                print(f"agent {idx} new planned links {agent['planned_links']}")
-                print(f"agent {idx} travelled links {agent['traveled_path']}")
 
+def _flush(flow_deltas, next_hops):
+    touched = flow_deltas.flush()
+    if len(touched):
+        links = flow_deltas.links
+        next_hops.invalidate_nodes({links[i][0] for i in touched.tolist()})
 
-            for link in agent['planned_links']:
-                G[link[0]][link[1]]['flow'] += 1
-                update_link_cost_bpr(G, link[0], link[1])
-        else:
-            # Continue down planned path, just remove used link
-            agent['planned_links'] = agent['planned_links'][1:]
 
+def run_one_step_multiagent_rollout(G, agents, value_function_dict, mu=0.1, greedy=False, random_seed=None,
+                                    instrumentation=NULL_INSTRUMENTATION, tracer=None,
+                                    update_cadence='agent', chunk_size=500, flow_deltas=None,
+                                    next_hops=None, active=None, streams=None, router=None):
+    """
+    Perform one-step rollout per agent. If agent deviates from current plan, replan from current node.
+    - Updates flows accordingly.
+    - Updates BPR travel times of the affected links after every agent ('agent', the sequential
+      Gauss-Seidel behavior), every chunk_size moved agents ('chunk') or once per sweep ('sweep').
+    - flow_deltas: optional FlowDeltaAccumulator for G, reused across calls to skip re-indexing.
+    - next_hops: optional NextHopTable for G, reloaded from value_function_dict at the start of the call.
+    - Reports 'agents_moved', 'replans' and 'bpr_updates' to the instrumentation.
+    - Records the decisions of agents registered with the tracer (AgentTracer, optional).
+    - active: optional ActiveAgents for agents, kept across calls so that only unfinished agents are swept.
+    - streams: optional RolloutStreams; the visiting order and every agent's draw then come from
+      per-step streams (reproducible for any agent order or split) instead of the global numpy RNG.
+    - router: optional PointToPointRouter; replans search the current travel times from the
+      agent's node to its destination instead of following the value function.
+    - Returns number of agents that completed their trip (including arrivals during this step).
+    """
 
-        # Update travel time via BPR
-        # update_link_cost_bpr(G, curr, next_node)
+    if random_seed is not None:
+        np.random.seed(random_seed)
 
-    return completed_count
+    if update_cadence not in UPDATE_CADENCES:
+        raise ValueError(f"Unknown update cadence '{update_cadence}', expected one of {UPDATE_CADENCES}.")
+    flush_every = {'agent': 1, 'chunk': chunk_size, 'sweep': 0}[update_cadence]
+    if flow_deltas is None:
+        flow_deltas = FlowDeltaAccumulator(G)
+    bpr_start = flow_deltas.bpr_updates
+    if next_hops is None:
+        next_hops = NextHopTable(G)
+    next_hops.update_all(value_function_dict)
+
+    if active is None:
+        active = ActiveAgents(agents)
+
+    moved_count = 0
+    replan_count = 0
+    if streams is None:
+        agent_indices = active.order()
+        uniforms = None
+    else:
+        step = streams.next_step()
+        # draws only for the active agents; positions keep them aligned with the visiting order
+        order = streams.permutation(step, len(active.indices))
+        agent_indices = active.indices[order]
+        uniforms = streams.uniforms_at(step, active.indices)[order]
+
+    if tracer is None or not tracer.active:
+        for k, idx in enumerate(agent_indices):
+            agent = agents[idx]
+            dest = agent['destination_node']
+
+            outcome = _step_agent(G, agent, value_function_dict[dest], mu, greedy, flow_deltas, next_hops,
+                                  None if uniforms is None else uniforms[k], router=router)
+            if outcome is None:
+                break
+            moved_count += 1
+            if outcome[4] is not None:
+                replan_count += 1
+            if outcome[3] == dest:
+                active.finish(idx)
+            if flush_every and moved_count % flush_every == 0:
+                _flush(flow_deltas, next_hops)
+    else:
+        for k, idx in enumerate(agent_indices):
+            agent = agents[idx]
+            curr = agent['current_position']
+            dest = agent['destination_node']
+
+            outcome = _step_agent(G, agent, value_function_dict[dest], mu, greedy, flow_deltas, next_hops,
+                                  None if uniforms is None else uniforms[k], router=router)
+            if outcome is None:
+                break
+            moved_count += 1
+            successors, scores, probs, next_node, new_plan = outcome
+            if new_plan is not None:
+                replan_count += 1
+            if next_node == dest:
+                active.finish(idx)
+            if flush_every and moved_count % flush_every == 0:
+                _flush(flow_deltas, next_hops)
+            if tracer.matches(agent, curr):
+                tracer.record_decision(agent, curr, successors, scores, probs, next_node, new_plan)
+
+    _flush(flow_deltas, next_hops)
+    active.compact()
+
+    instrumentation.count('agents_moved', moved_count)
+    instrumentation.count('replans', replan_count)
+    instrumentation.count('bpr_updates', flow_deltas.bpr_updates - bpr_start)
+    return active.completed
@@ -0,0 +1,350 @@
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from rng_streams import RolloutStreams, sample_index
+from instrumentation import NULL_INSTRUMENTATION
+from active_agents import ActiveAgents
+from utils import softmax
+
+
+class _SharedArray:
+    """numpy array backed by a named shared memory block."""
+
+    def __init__(self, shape, name=None):
+        size = max(int(np.prod(shape)) * 8, 8)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.array = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self, unlink=False):
+        del self.array
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class _ShardWorker:
+    """Rollout state of one contiguous range of agents, living in a worker process."""
+
+    def __init__(self, spec):
+        self.worker_id = spec['worker_id']
+        self.lo, self.hi = spec['lo'], spec['hi']
+        self.indptr = spec['indptr']
+        self.edge_tail = spec['edge_tail']
+        self.edge_head = spec['edge_head']
+        self.link_ids = spec['link_ids']
+        self.position = spec['position']
+        self.dest_node = spec['dest_node']
+        self.dest_row = spec['dest_row']
+        self.volume = spec['volume']  # vehicles per agent
+        self.plans = spec['plans']  # remaining planned edges per agent, reversed (next edge last)
+        self.streams = RolloutStreams(spec['seed'])
+
+        n_edges, n_nodes, n_dest, n_workers = spec['shapes']
+        self.cost_shm = _SharedArray((n_edges,), spec['cost_name'])
+        self.values_shm = _SharedArray((n_dest, n_nodes), spec['values_name'])
+        self.deltas_shm = _SharedArray((n_workers, n_edges), spec['deltas_name'])
+        self.cost = self.cost_shm.array
+        self.values = self.values_shm.array
+        self.delta = self.deltas_shm.array[self.worker_id]
+
+        self.next_edge = {}
+        self.moved = {}  # agent index -> link ids traveled during this step
+
+    def begin(self, step, mu, greedy):
+        self.step, self.mu, self.greedy = step, mu, greedy
+        self.moved = {}
+
+    def _greedy_edges(self, row):
+        """Best outgoing edge of every node towards destination row under the cost snapshot."""
+        next_edge = self.next_edge.get(row)
+        if next_edge is None:
+            scores = self.values[row, self.edge_head] - self.cost
+            order = np.lexsort((np.arange(len(scores)), -scores, self.edge_tail))
+            tails = self.edge_tail[order]
+            first = order[np.r_[True, tails[1:] != tails[:-1]]]
+            first = first[scores[first] > -np.inf]
+            next_edge = np.full(len(self.indptr) - 1, -1, dtype=np.int64)
+            next_edge[self.edge_tail[first]] = first
+            next_edge = next_edge.tolist()
+            self.next_edge[row] = next_edge
+        return next_edge
+
+    def _greedy_plan(self, node, dest, row):
+        next_edge = self._greedy_edges(row)
+        plan = []
+        while node != dest and len(plan) < len(next_edge):
+            e = next_edge[node]
+            if e < 0:
+                break
+            plan.append(e)
+            node = self.edge_head[e]
+        plan.reverse()
+        return plan
+
+    def run_block(self, indices):
+        """Move the given agents against the current snapshot; flow deltas go to shared memory."""
+        self.next_edge = {}
+        delta = np.zeros(len(self.delta))
+        cost, values, edge_head, indptr = self.cost, self.values, self.edge_head, self.indptr
+        arrived = []
+        # draws of this block's agents only, as they come up in the sweep
+        uniforms = None if self.greedy else self.streams.uniforms_at(self.step, indices).tolist()
+        for j, i in enumerate(indices.tolist()):
+            k = i - self.lo
+            node, dest, row = self.position[k], self.dest_node[k], self.dest_row[k]
+            start, stop = indptr[node], indptr[node + 1]
+            if start == stop:
+                continue  # stuck: no successors
+
+            scores = values[row, edge_head[start:stop]] - cost[start:stop]
+            if self.greedy:
+                e = start + int(np.argmax(scores))
+            else:
+                e = start + sample_index(softmax(scores / self.mu), uniforms[j])
+            next_node = int(edge_head[e])
+            self.position[k] = next_node
+            self.moved.setdefault(i, []).append(self.link_ids[e])
+
+            plan = self.plans[k]
+            if plan and plan[-1] == e:
+                plan.pop()
+            else:
+                volume = self.volume[k]
+                delta[e] += volume
+                if plan:
+                    np.subtract.at(delta, plan, volume)
+                plan = self._greedy_plan(next_node, dest, row)
+                if plan:
+                    np.add.at(delta, plan, volume)
+                self.plans[k] = plan
+            if next_node == dest:
+                arrived.append(i)
+        self.delta[:] = delta
+        return arrived
+
+    def end(self):
+        """Traveled links, positions and remaining plans of the agents that moved this step."""
+        return [(i, links, self.position[i - self.lo], self.plans[i - self.lo][::-1])
+                for i, links in self.moved.items()]
+
+    def close(self):
+        del self.cost, self.values, self.delta
+        for shared in (self.cost_shm, self.values_shm, self.deltas_shm):
+            shared.close()
+
+
+def _worker_main(conn, spec):
+    worker = _ShardWorker(spec)
+    try:
+        while True:
+            command, *args = conn.recv()
+            if command == 'begin':
+                worker.begin(*args)
+            elif command == 'block':
+                conn.send(worker.run_block(*args))
+            elif command == 'end':
+                conn.send(worker.end())
+            elif command == 'stop':
+                break
+    finally:
+        worker.close()
+        conn.close()
+
+
+class ParallelRollout:
+    """
+    One-step rollout sharded over persistent worker processes.
+
+    Agents are split into contiguous index ranges, one per worker; each worker keeps the
+    state of its agents (position, remaining plan) across outer iterations. Link costs,
+    value functions and the per-worker flow deltas live in shared memory.
+
+    A sweep visits the active agents in a random order split into sync_points blocks
+    (bulk-synchronous supersteps). Within a block every worker moves its agents against
+    the same cost snapshot and writes its flow deltas; the master then sums the deltas,
+    applies them to the link flows and refreshes the BPR times before the next block.
+    Draws come from RolloutStreams by agent index, so results do not depend on the number
+    of workers.
+
+    G stays the source of truth for the link flows and times: step() reads them from G and
+    writes them back when it finishes. The agents are not: the workers own every agent's
+    position and remaining plan from the moment the engine is built, and step() only
+    mirrors them (with the traveled paths) into the agent dicts. Edits to the agent dicts
+    between steps are not seen by the workers; build a new engine after changing them.
+    Call close() (or use as a context manager) to stop the workers and release the
+    shared memory.
+    """
+
+    def __init__(self, G, agents, n_workers=None, sync_points=4, streams=None, random_seed=None,
+                 alpha=0.15, beta=4):
+        self.G = G
+        self.agents = agents
+        self.sync_points = max(1, sync_points)
+        self.alpha = alpha
+        self.beta = beta
+        self.streams = streams if streams is not None else RolloutStreams(random_seed)
+        self.active = ActiveAgents(agents)
+        # flows are sums of agent volumes: integers for integral demand, as FlowDeltaAccumulator keeps them
+        self.integral = all(isinstance(agent.get('volume', 1), (int, np.integer)) for agent in agents)
+
+        self.nodes = list(G.nodes())
+        node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.edge_attrs = [attr for _, _, attr in G.edges(data=True)]
+        edge_tail = np.array([node_index[u] for u, _ in G.edges()], dtype=np.int64)
+        edge_head = np.array([node_index[v] for _, v in G.edges()], dtype=np.int64)
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(edge_tail, minlength=len(self.nodes)))))
+        edge_of = {(u, v): e for e, (u, v) in enumerate(G.edges())}
+        self.edge_tail, self.edge_head = edge_tail, edge_head
+        self.free_flow_time = np.array([attr['free_flow_travel_time'] for attr in self.edge_attrs], dtype=float)
+        self.capacity = np.array([attr['capacity'] for attr in self.edge_attrs], dtype=float)
+
+        self.destinations = sorted({agent['destination_node'] for agent in agents})
+        dest_row = {dest: d for d, dest in enumerate(self.destinations)}
+
+        n_agents = len(agents)
+        n_workers = n_workers or os.cpu_count() or 1
+        self.n_workers = max(1, min(n_workers, n_agents))
+        self.bounds = np.linspace(0, n_agents, self.n_workers + 1).astype(np.int64)
+
+        n_edges = len(self.edge_attrs)
+        self.cost_shm = _SharedArray((n_edges,))
+        self.values_shm = _SharedArray((len(self.destinations), len(self.nodes)))
+        self.deltas_shm = _SharedArray((self.n_workers, n_edges))
+        shapes = (n_edges, len(self.nodes), len(self.destinations), self.n_workers)
+
+        self.connections, self.processes = [], []
+        try:
+            self._start_workers(agents, indptr, node_index, edge_of, dest_row, shapes)
+        except BaseException:
+            self.close()
+            raise
+
+    def _start_workers(self, agents, indptr, node_index, edge_of, dest_row, shapes):
+        edge_tail, edge_head = self.edge_tail, self.edge_head
+        for w in range(self.n_workers):
+            lo, hi = int(self.bounds[w]), int(self.bounds[w + 1])
+            shard = agents[lo:hi]
+            spec = {
+                'worker_id': w, 'lo': lo, 'hi': hi, 'seed': self.streams.seed,
+                'indptr': indptr, 'edge_tail': edge_tail, 'edge_head': edge_head,
+                'link_ids': [attr['link_id'] for attr in self.edge_attrs],
+                'position': [node_index[a['current_position']] for a in shard],
+                'dest_node': [node_index[a['destination_node']] for a in shard],
+                'dest_row': [dest_row[a['destination_node']] for a in shard],
+                'volume': [a.get('volume', 1) for a in shard],
+                'plans': [[edge_of[link] for link in reversed(a['planned_links'])] for a in shard],
+                'shapes': shapes, 'cost_name': self.cost_shm.name,
+                'values_name': self.values_shm.name, 'deltas_name': self.deltas_shm.name,
+            }
+            parent_conn, child_conn = mp.Pipe()
+            process = mp.Process(target=_worker_main, args=(child_conn, spec), daemon=True)
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    def _write_values(self, value_function_dict):
+        values = self.values_shm.array
+        for d, dest in enumerate(self.destinations):
+            value_function = value_function_dict[dest]
+            values[d] = [value_function.get(node, -np.inf) for node in self.nodes]
+
+    def step(self, value_function_dict, mu=0.1, greedy=False):
+        """
+        Move every active agent one link.
+
+        Returns:
+            completed_count (int): Number of agents at their destination after the step.
+            moved_count (int): Number of agents that moved.
+            bpr_updates (int): Link travel times recomputed at the sync points.
+        """
+        self._write_values(value_function_dict)
+        flow = np.array([attr['flow'] for attr in self.edge_attrs], dtype=float)
+        cost = self.cost_shm.array
+        cost[:] = [attr['current_travel_time'] for attr in self.edge_attrs]
+
+        step = self.streams.next_step()
+        order = self.streams.permutation(step, self.active.indices)
+        owner = np.searchsorted(self.bounds, order, side='right') - 1
+        for conn in self.connections:
+            conn.send(('begin', step, mu, greedy))
+
+        bpr_updates = 0
+        for block in np.array_split(np.arange(len(order)), self.sync_points):
+            if not len(block):
+                continue
+            block_owner = owner[block]
+            busy = []
+            for w, conn in enumerate(self.connections):
+                indices = order[block][block_owner == w]
+                if len(indices):
+                    conn.send(('block', indices))
+                    busy.append(w)
+            for w in busy:
+                for i in self.connections[w].recv():
+                    self.active.finish(i)
+
+            # reduce the deltas and refresh the costs for the next superstep
+            delta = self.deltas_shm.array[busy].sum(axis=0)
+            touched = np.flatnonzero(delta)
+            flow[touched] += delta[touched]
+            cost[touched] = self.free_flow_time[touched] * (
+                1 + self.alpha * (flow[touched] / self.capacity[touched]) ** self.beta)
+            bpr_updates += len(touched)
+
+        for conn in self.connections:
+            conn.send(('end',))
+        nodes, edge_tail, edge_head = self.nodes, self.edge_tail, self.edge_head
+        for conn in self.connections:
+            for i, links, position, plan in conn.recv():
+                agent = self.agents[i]
+                agent['traveled_path'].extend(links)
+                agent['current_position'] = nodes[position]
+                agent['planned_links'] = [(nodes[edge_tail[e]], nodes[edge_head[e]]) for e in plan]
+
+        flows = flow.round().astype(np.int64) if self.integral else flow
+        for attr, f, t in zip(self.edge_attrs, flows.tolist(), cost.tolist()):
+            attr['flow'] = f
+            attr['current_travel_time'] = t
+
+        self.active.compact()
+        return self.active.completed, len(order), bpr_updates
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        for conn in self.connections:
+            conn.close()
+        self.connections, self.processes = [], []
+        for shared in (self.cost_shm, self.values_shm, self.deltas_shm):
+            shared.close(unlink=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def run_parallel_rollout(engine, value_function_dict, mu=0.1, greedy=False,
+                         instrumentation=NULL_INSTRUMENTATION):
+    """
+    One parallel rollout step. Returns number of agents that completed their trip.
+    """
+    completed_count, moved_count, bpr_updates = engine.step(value_function_dict, mu=mu, greedy=greedy)
+    instrumentation.count('agents_moved', moved_count)
+    instrumentation.count('bpr_updates', bpr_updates)
+    return completed_count
@@ -1,8 +1,10 @@
-from utils import update_link_cost_bpr
+from flow_accumulator import FlowDeltaAccumulator
+from next_hop import NextHopTable
 
+CHOICE_MODELS = ('value_function', 'path_set')
 
 
-def assign_paths_from_value_function(G, agents, value_function_dict):
+def assign_paths_from_value_function(G, agents, value_function_dict, next_hops=None):
     """
     Assign initial greedy path to each agent using the value function.
 
@@ -10,35 +12,53 @@ def assign_paths_from_value_function(G, agents, value_function_dict):
     - G: networkx DiGraph
     - agents: list of agent dicts
     - value_function_dict: {dest_zone: {node: value}}
+    - next_hops: optional NextHopTable for G, reloaded from value_function_dict
 
     Updates:
     - Sets each agent['planned_links'] with full greedy path
-    - Increments flow along those links
+    - Increments flow along those links and updates their BPR travel times
     """
+    if next_hops is None:
+        next_hops = NextHopTable(G)
+    next_hops.update_all(value_function_dict)
+    flow_deltas = FlowDeltaAccumulator(G)
 
     for agent in agents:
         origin = agent['origin_node']
         dest = agent['destination_node']
-        V = value_function_dict[dest]
 
-        path = []
-        curr = origin
-
-        while curr != dest:
-            successors = list(G.successors(curr))
-            if not successors:
-                break
-
-            best_succ = max(successors, key=lambda s: -G[curr][s]['current_travel_time'] + V.get(s, float('-inf')))
-            path.append((curr, best_succ))
-            G[curr][best_succ]['flow'] += 1  # Initial flow increment
-            curr = best_succ
+        path = next_hops.path(origin, dest)
+        flow_deltas.add_path(path, agent.get('volume', 1))  # Initial flow increment
+        flow_deltas.flush()
+        # later agents see the loaded travel times
+        next_hops.invalidate_nodes({u for u, _ in path})
 
         agent['current_position'] = origin
         agent['traveled_path'] = []
         agent['planned_links'] = path
 
-        for u, v, attr in G.edges(data=True):
-            update_link_cost_bpr(G, u, v)
 
+def assign_paths_from_path_set(G, agents, path_set, rng, mu=0.1, beta=1.0):
+    """
+    Draw every agent's full path from a PathSet (path-size logit under the current travel
+    times on G), the path_set choice model of the replanned pipeline.
+
+    Updates:
+    - Resets each agent to its origin with the drawn path as agent['planned_links']
+      (agents without a route keep an empty plan)
+    - Sets every edge's 'flow' to the flow of the drawn paths (the BPR travel times are
+      left to the caller, as after a rollout sweep)
 
+    Returns:
+    - Number of agents that got a path
+    """
+    agent_paths, link_flows = path_set.sample_agent_paths(agents, rng, mu=mu, beta=beta)
+    plans = {record['agent_id']: record['node_sequence'] for record in agent_paths}
+    for agent in agents:
+        nodes = plans.get(agent['agent_id'], [])
+        agent['current_position'] = agent['origin_node']
+        agent['traveled_path'] = []
+        agent['planned_links'] = list(zip(nodes[:-1], nodes[1:]))
+    for _, _, attr in G.edges(data=True):
+        attr['flow'] = link_flows.get(attr['link_id'], 0)
+    return len(plans)
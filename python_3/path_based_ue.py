@@ -0,0 +1,311 @@
+import networkx as nx
+import numpy as np
+from scipy.sparse import csc_matrix, csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+
+class PathBasedUE:
+    """
+    Path-based user equilibrium by gradient projection with column generation.
+
+    Every OD pair keeps a working set of paths; all paths are the columns of a sparse
+    link-path incidence matrix D (links x paths) with path flows h, so that
+
+        link flows   x = D h
+        path costs   c = D^T t(x)
+
+    Each iteration adds the current shortest path of every OD pair as a new column
+    (if it is not in the set yet) and moves flow from the other paths of the OD to it:
+
+        dh_p = min(h_p, step_size * (c_p - c_s) / d_p)
+
+    with s the shortest path and d_p the sum of the BPR derivatives t'(x) over the links
+    used by exactly one of p and s (s: the OD's cheapest path in the set). OD pairs are
+    processed one after another (Gauss-Seidel); the paths of one OD move together, using
+    incidence products on its columns, and the move is shortened by a line search on the
+    Beckmann objective when the Newton steps overshoot. Link costs are refreshed before
+    the next OD pair. Paths left without flow are dropped from the set.
+    """
+
+    def __init__(self, G: nx.DiGraph, od_table: dict, alpha=0.15, beta=4):
+        self.G = G
+        self.alpha = alpha
+        self.beta = beta
+
+        self.nodes = list(G.nodes())
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.edges = list(G.edges())
+        self.edge_index = {(self.node_index[u], self.node_index[v]): e for e, (u, v) in enumerate(self.edges)}
+        edge_attrs = [attr for _, _, attr in G.edges(data=True)]
+        self.link_ids = [attr['link_id'] for attr in edge_attrs]
+        self.free_flow_time = np.array([attr['free_flow_travel_time'] for attr in edge_attrs], dtype=float)
+        self.capacity = np.array([attr['capacity'] for attr in edge_attrs], dtype=float)
+        self.edge_tail = np.array([self.node_index[u] for u, _ in self.edges], dtype=np.int64)
+        self.edge_head = np.array([self.node_index[v] for _, v in self.edges], dtype=np.int64)
+
+        # destination zones map to their zone node (zone_id == node_id in GMNS files)
+        zone_nodes = {attr['zone_id']: node for node, attr in G.nodes(data=True) if attr.get('zone_id') is not None}
+        self.od_pairs, od_origin, od_dest, volumes = [], [], [], []
+        for (origin, destination), volume in od_table.items():
+            dest_node = zone_nodes.get(destination, destination)
+            if origin not in self.node_index or dest_node not in self.node_index:
+                print(f"Warning: OD pair ({origin}, {destination}) is not on the network. Skipping.")
+                continue
+            self.od_pairs.append((origin, destination))
+            od_origin.append(self.node_index[origin])
+            od_dest.append(self.node_index[dest_node])
+            volumes.append(volume)
+        self.od_origin = np.array(od_origin, dtype=np.int64)
+        self.od_dest = np.array(od_dest, dtype=np.int64)
+        self.volume = np.array(volumes, dtype=float)
+        self.origins, self.od_origin_row = np.unique(self.od_origin, return_inverse=True)
+
+        # working path sets: one column per path
+        self.path_links = []  # edge indices of every path
+        self.path_od = []     # OD index of every path
+        self.path_flow = np.zeros(0)
+        self.path_keys = [dict() for _ in self.od_pairs]  # per OD: tuple(edge indices) -> column
+        self.incidence = csc_matrix((len(self.edges), 0))
+        self.gap_history = []
+        self.system_travel_time_history = []
+
+    def link_costs(self, flow, links=slice(None)):
+        """BPR travel times of the given links (default: all) at their flows."""
+        t0, capacity = self.free_flow_time[links], self.capacity[links]
+        return t0 * (1 + self.alpha * (flow / capacity) ** self.beta)
+
+    def link_cost_derivatives(self, flow, links=slice(None)):
+        t0, capacity = self.free_flow_time[links], self.capacity[links]
+        return t0 * self.alpha * self.beta * flow ** (self.beta - 1) / capacity ** self.beta
+
+    def link_flows(self):
+        return self.incidence @ self.path_flow
+
+    def shortest_paths(self, cost):
+        """
+        Shortest path (edge indices) and its cost for every OD pair, one Dijkstra run per
+        origin. Unreachable OD pairs get (None, inf).
+        """
+        n_nodes = len(self.nodes)
+        graph = csr_matrix((cost, (self.edge_tail, self.edge_head)), shape=(n_nodes, n_nodes))
+        distances, predecessors = dijkstra(graph, indices=self.origins, return_predecessors=True)
+
+        paths, costs = [], distances[self.od_origin_row, self.od_dest]
+        for k, row in enumerate(self.od_origin_row.tolist()):
+            node = int(self.od_dest[k])
+            if not np.isfinite(costs[k]):
+                paths.append(None)
+                continue
+            path = []
+            while node != self.od_origin[k]:
+                prev = int(predecessors[row, node])
+                path.append(self.edge_index[(prev, node)])
+                node = prev
+            paths.append(path[::-1])
+        return paths, costs
+
+    def _add_columns(self, paths):
+        """Add new shortest paths to the working sets; returns the column of every OD's shortest path."""
+        best = np.full(len(self.od_pairs), -1, dtype=np.int64)
+        new_links, new_cols = [], []
+        n_paths = len(self.path_links)
+        for k, path in enumerate(paths):
+            if path is None:
+                continue
+            key = tuple(path)
+            column = self.path_keys[k].get(key)
+            if column is None:
+                column = n_paths + len(new_links)
+                self.path_keys[k][key] = column
+                self.path_links.append(np.array(path, dtype=np.int64))
+                self.path_od.append(k)
+                new_links.append(path)
+                new_cols.append(column)
+            best[k] = column
+        if new_links:
+            self.path_flow = np.concatenate((self.path_flow, np.zeros(len(new_links))))
+            self._build_incidence()
+        return best
+
+    def _build_incidence(self):
+        lengths = [len(links) for links in self.path_links]
+        rows = np.concatenate(self.path_links) if self.path_links else np.zeros(0, dtype=np.int64)
+        cols = np.repeat(np.arange(len(self.path_links)), lengths)
+        self.incidence = csc_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(self.edges), len(self.path_links)))
+
+    def _drop_unused(self, best):
+        """Drop paths without flow that are not an OD's current shortest path."""
+        keep = self.path_flow > 0
+        keep[best[best >= 0]] = True
+        if keep.all():
+            return best
+        new_column = np.cumsum(keep) - 1
+        self.path_links = [links for links, kept in zip(self.path_links, keep) if kept]
+        self.path_od = [od for od, kept in zip(self.path_od, keep) if kept]
+        self.path_flow = self.path_flow[keep]
+        self.path_keys = [dict() for _ in self.od_pairs]
+        for column, (links, od) in enumerate(zip(self.path_links, self.path_od)):
+            self.path_keys[od][tuple(links.tolist())] = column
+        self._build_incidence()
+        best = best.copy()
+        best[best >= 0] = new_column[best[best >= 0]]
+        return best
+
+    def relative_gap(self, cost, shortest_costs):
+        """(total path cost - total shortest path cost) / total path cost."""
+        total_cost = float(self.path_flow @ (self.incidence.T @ cost))
+        reachable = np.isfinite(shortest_costs)
+        shortest_total = float(self.volume[reachable] @ shortest_costs[reachable])
+        return (total_cost - shortest_total) / total_cost if total_cost > 0 else 0.0
+
+    def initialize(self):
+        """All-or-nothing loading on free-flow shortest paths."""
+        paths, _ = self.shortest_paths(self.free_flow_time)
+        best = self._add_columns(paths)
+        reachable = best >= 0
+        for k in np.flatnonzero(~reachable):
+            print(f"Warning: No path for OD pair {self.od_pairs[k]}.")
+        self.path_flow[best[reachable]] = self.volume[reachable]
+        return self
+
+    def _shift_block(self, columns, D, od, touched, flow, cost, derivative, step_size):
+        """
+        Move flow within the OD pair(s) of one block of path columns towards each OD's
+        cheapest path, then update flow, cost and derivative on the touched links.
+        D is the block's incidence restricted to the links it touches.
+        """
+        B = D.toarray()  # blocks are small: dense products beat sparse overhead
+        c, d = cost[touched], derivative[touched]
+        h = self.path_flow[columns]
+        path_cost = B.T @ c
+
+        # cheapest path of every OD in the block (first one on ties)
+        order = np.lexsort((path_cost, od))
+        first = np.r_[True, od[order][1:] != od[order][:-1]]
+        best_of_od = dict(zip(od[order][first].tolist(), order[first].tolist()))
+        best = np.array([best_of_od[k] for k in od.tolist()], dtype=np.int64)
+        movable = (best != np.arange(len(columns))) & (h > 0)
+        if not movable.any():
+            return
+
+        own = B.T @ d
+        shared = (B * B[:, best]).T @ d
+        second_derivative = own + own[best] - 2 * shared
+        excess = path_cost - path_cost[best]
+
+        shift = np.zeros(len(columns))
+        safe = movable & (second_derivative > 0)
+        shift[safe] = step_size * excess[safe] / second_derivative[safe]
+        # no derivative on either path (no flow yet): move everything
+        shift[movable & ~safe & (excess > 0)] = np.inf
+        shift = np.where(movable, np.clip(shift, 0, h), 0.0)
+
+        dh = -shift
+        np.add.at(dh, best[movable], shift[movable])
+
+        # the Newton steps ignore the curvature of links without flow and can overshoot:
+        # shorten the move to the minimum of the Beckmann objective along it
+        dx = B @ dh
+        x = flow[touched]
+
+        def slope(lam):
+            return float(dx @ self.link_costs(x + lam * dx, touched))
+
+        lam = 1.0
+        if slope(1.0) > 0:
+            low, high = 0.0, 1.0
+            for _ in range(20):
+                lam = (low + high) / 2
+                if slope(lam) > 0:
+                    high = lam
+                else:
+                    low = lam
+            lam = low
+
+        new_h = h + lam * dh
+        new_h[new_h < 1e-12] = 0.0
+        self.path_flow[columns] = new_h
+
+        x = x + B @ (new_h - h)
+        flow[touched] = x
+        cost[touched] = self.link_costs(x, touched)
+        derivative[touched] = self.link_cost_derivatives(x, touched)
+
+    def iterate(self, step_size=1.0, inner_sweeps=1):
+        """
+        One gradient projection iteration: column generation for all OD pairs, then
+        inner_sweeps sweeps of flow shifts OD pair by OD pair (Gauss-Seidel) on the
+        working path sets. Returns the relative gap measured before the shifts.
+        """
+        flow = self.link_flows()
+        cost = self.link_costs(flow)
+        derivative = self.link_cost_derivatives(flow)
+
+        paths, shortest_costs = self.shortest_paths(cost)
+        gap = self.relative_gap(cost, shortest_costs)
+        self.gap_history.append(gap)
+        self.system_travel_time_history.append(float(flow @ cost))
+
+        best = self._add_columns(paths)
+        path_od = np.asarray(self.path_od, dtype=np.int64)
+        order = np.argsort(path_od, kind='stable')
+        bounds = np.flatnonzero(np.r_[True, path_od[order][1:] != path_od[order][:-1], True])
+        blocks = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            columns = order[start:stop]
+            D = self.incidence[:, columns]
+            touched = np.unique(D.indices)
+            blocks.append((columns, D[touched, :], path_od[columns], touched))
+        for _ in range(inner_sweeps):
+            for block in blocks:
+                self._shift_block(*block, flow, cost, derivative, step_size)
+
+        self._drop_unused(best)
+        return gap
+
+    def solve(self, max_iterations=100, gap_tolerance=1e-6, step_size=1.0, inner_sweeps=1, verbose=True):
+        """
+        Run gradient projection until the relative gap falls below gap_tolerance.
+
+        Returns:
+            gap_history (list): Relative gap of every iteration.
+        """
+        if not len(self.path_links):
+            self.initialize()
+        for iteration in range(max_iterations):
+            gap = self.iterate(step_size=step_size, inner_sweeps=inner_sweeps)
+            if verbose:
+                print(f"GP iteration {iteration + 1}: relative gap {gap:.3e}, "
+                      f"{len(self.path_links)} paths")
+            if gap < gap_tolerance:
+                if verbose:
+                    print(f"Converged after {iteration + 1} iterations (relative gap).")
+                break
+        return self.gap_history
+
+    def write_to_graph(self):
+        """Store the equilibrium flows and travel times on G."""
+        flow = self.link_flows()
+        cost = self.link_costs(flow)
+        for (u, v), f, t in zip(self.edges, flow.tolist(), cost.tolist()):
+            self.G[u][v]['flow'] = f
+            self.G[u][v]['current_travel_time'] = t
+
+    def path_records(self):
+        """One record per path with flow: OD, flow, cost and link sequence (as in the agent results)."""
+        cost = self.link_costs(self.link_flows())
+        path_cost = self.incidence.T @ cost
+        records = []
+        for column, (links, od) in enumerate(zip(self.path_links, self.path_od)):
+            if self.path_flow[column] <= 0:
+                continue
+            origin, destination = self.od_pairs[od]
+            records.append({
+                'o_zone_id': origin,
+                'd_zone_id': destination,
+                'path_id': column,
+                'flow': float(self.path_flow[column]),
+                'path_travel_time': float(path_cost[column]),
+                'link_sequence': ' '.join(str(self.link_ids[e]) for e in links.tolist()),
+            })
+        return records
@@ -0,0 +1,196 @@
+from collections import defaultdict
+from itertools import islice
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csc_matrix, csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+
+class PathSet:
+    """
+    A bounded set of routes per OD pair with path-size logit choice.
+
+    The routes of all OD pairs are the columns of a sparse link-path incidence matrix D
+    (links x paths), generated once at free-flow costs:
+
+      'link_penalty': repeated shortest path searches per OD, multiplying the costs of the
+                      links of every path found by (1 + penalty) before the next search;
+      'k_shortest':   the k shortest loopless paths (Yen, networkx shortest_simple_paths).
+
+    Paths longer than (1 + max_detour) times the OD's shortest free-flow path are dropped.
+    Under link costs t, with c = D^T t the path costs, every OD chooses its paths with
+
+        P(p) = exp(-c_p / mu + beta * ln PS_p) / sum over the OD's paths q (same)
+        PS_p = sum over links a of p of (l_a / L_p) / (number of the OD's paths using a)
+
+    (path-size correction for overlapping routes; l: link length, L_p: path length).
+    """
+
+    def __init__(self, G: nx.DiGraph, od_pairs, method='link_penalty', k=5, penalty=0.5, max_detour=0.5,
+                 max_searches=None):
+        self.G = G
+        self.nodes = list(G.nodes())
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.edges = list(G.edges())
+        edge_attrs = [attr for _, _, attr in G.edges(data=True)]
+        self.link_ids = [attr['link_id'] for attr in edge_attrs]
+        self.free_flow_time = np.array([attr['free_flow_travel_time'] for attr in edge_attrs], dtype=float)
+        self.length = np.array([attr.get('length', attr['free_flow_travel_time']) for attr in edge_attrs],
+                               dtype=float)
+        self.edge_tail = np.array([self.node_index[u] for u, _ in self.edges], dtype=np.int64)
+        self.edge_head = np.array([self.node_index[v] for _, v in self.edges], dtype=np.int64)
+        self.edge_index = {(self.node_index[u], self.node_index[v]): e for e, (u, v) in enumerate(self.edges)}
+
+        self.od_pairs = [(o, d) for o, d in od_pairs if o in self.node_index and d in self.node_index and o != d]
+        self.od_lookup = {od: i for i, od in enumerate(self.od_pairs)}
+        self.path_links = []  # edge indices of every path
+        self.path_od = []
+        if method == 'link_penalty':
+            generate = self._link_penalty_paths
+        elif method == 'k_shortest':
+            generate = self._k_shortest_paths
+        else:
+            raise ValueError(f"Unknown path set method '{method}', expected 'link_penalty' or 'k_shortest'.")
+        for i, (origin, destination) in enumerate(self.od_pairs):
+            paths = generate(origin, destination, k, penalty, max_searches or 3 * k)
+            if not paths:
+                print(f"Warning: No path from {origin} to {destination}.")
+            shortest = min((self.free_flow_time[p].sum() for p in paths), default=0.0)
+            for p in paths:
+                if self.free_flow_time[p].sum() <= (1 + max_detour) * shortest + 1e-9:
+                    self.path_links.append(p)
+                    self.path_od.append(i)
+        self.path_od = np.array(self.path_od, dtype=np.int64)
+
+        rows = np.concatenate(self.path_links) if self.path_links else np.zeros(0, dtype=np.int64)
+        cols = np.repeat(np.arange(len(self.path_links)), [len(p) for p in self.path_links])
+        self.incidence = csc_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(self.edges), len(self.path_links)))
+        self.path_size = self._path_size(rows, cols)
+
+    def _path_edges(self, predecessors, origin, destination):
+        path, node = [], destination
+        while node != origin:
+            prev = int(predecessors[node])
+            path.append(self.edge_index[(prev, node)])
+            node = prev
+        return np.array(path[::-1], dtype=np.int64)
+
+    def _link_penalty_paths(self, origin, destination, k, penalty, max_searches):
+        o, d = self.node_index[origin], self.node_index[destination]
+        cost = self.free_flow_time.copy()
+        n_nodes = len(self.nodes)
+        paths, seen = [], set()
+        for _ in range(max_searches):
+            graph = csr_matrix((cost, (self.edge_tail, self.edge_head)), shape=(n_nodes, n_nodes))
+            distances, predecessors = dijkstra(graph, indices=o, return_predecessors=True)
+            if not np.isfinite(distances[d]):
+                break
+            path = self._path_edges(predecessors, o, d)
+            if tuple(path) not in seen:
+                seen.add(tuple(path))
+                paths.append(path)
+                if len(paths) == k:
+                    break
+            cost[path] *= 1 + penalty
+        return paths
+
+    def _k_shortest_paths(self, origin, destination, k, penalty, max_searches):
+        try:
+            node_paths = list(islice(nx.shortest_simple_paths(self.G, origin, destination,
+                                                              weight='free_flow_travel_time'), k))
+        except nx.NetworkXNoPath:
+            return []
+        return [np.array([self.edge_index[(self.node_index[u], self.node_index[v])]
+                          for u, v in zip(path[:-1], path[1:])], dtype=np.int64) for path in node_paths]
+
+    def _path_size(self, rows, cols):
+        """PS_p from the incidence entries (link rows, path cols), one pass over all paths."""
+        if not len(rows):
+            return np.zeros(0)
+        n_od = max(len(self.od_pairs), 1)
+        # number of paths of the same OD using each link of each path
+        _, inverse, counts = np.unique(rows * n_od + self.path_od[cols], return_inverse=True, return_counts=True)
+        path_length = np.bincount(cols, weights=self.length[rows], minlength=len(self.path_links))
+        share = self.length[rows] / np.maximum(path_length[cols], 1e-12) / counts[inverse]
+        return np.bincount(cols, weights=share, minlength=len(self.path_links))
+
+    def link_costs_from_graph(self):
+        return np.array([attr.get('current_travel_time', attr['free_flow_travel_time'])
+                         for _, _, attr in self.G.edges(data=True)], dtype=float)
+
+    def path_costs(self, link_costs):
+        return self.incidence.T @ link_costs
+
+    def choice_probabilities(self, link_costs, mu=0.1, beta=1.0):
+        """Path-size logit probability of every path within its OD pair."""
+        scores = -self.path_costs(link_costs) / mu + beta * np.log(np.maximum(self.path_size, 1e-300))
+        od_max = np.full(len(self.od_pairs), -np.inf)
+        np.maximum.at(od_max, self.path_od, scores)
+        weights = np.exp(scores - od_max[self.path_od])
+        return weights / np.bincount(self.path_od, weights=weights, minlength=len(self.od_pairs))[self.path_od]
+
+    def expected_link_flows(self, od_volumes, link_costs, mu=0.1, beta=1.0):
+        """Link flows of the expected path choice; od_volumes aligned with od_pairs."""
+        path_flows = np.asarray(od_volumes, dtype=float)[self.path_od] * self.choice_probabilities(link_costs, mu, beta)
+        return self.incidence @ path_flows
+
+    def sample_agent_paths(self, agents, rng, mu=0.1, beta=1.0):
+        """
+        Draw a path for every agent (one multinomial draw per OD pair) under the current
+        travel times on G.
+
+        Returns:
+            agent_paths (list): Agent path records, as in the rollouts.
+            link_flows (dict): {link_id: flow}, weighted by agent volume.
+        """
+        link_costs = self.link_costs_from_graph()
+        path_costs = self.path_costs(link_costs)
+        free_flow_costs = self.path_costs(self.free_flow_time)
+        probabilities = self.choice_probabilities(link_costs, mu, beta)
+        od_paths = defaultdict(list)
+        for p, i in enumerate(self.path_od.tolist()):
+            od_paths[i].append(p)
+
+        members = defaultdict(list)
+        for agent in agents:
+            od = self.od_lookup.get((agent['origin_node'], agent['destination_node']))
+            if od is None:
+                print(f"Warning: No path set for agent {agent['agent_id']}. Skipping.")
+                continue
+            members[od].append(agent)
+
+        chosen = {}
+        for od, od_agents in members.items():
+            paths = od_paths[od]
+            if not paths:
+                continue
+            counts = rng.multinomial(len(od_agents), probabilities[paths] / probabilities[paths].sum())
+            for agent, p in zip(od_agents, np.repeat(paths, counts).tolist()):
+                chosen[agent['agent_id']] = p
+
+        agent_paths = []
+        path_volume = np.zeros(len(self.path_links))
+        for agent in agents:
+            p = chosen.get(agent['agent_id'])
+            if p is None:
+                continue
+            links = self.path_links[p]
+            volume = agent.get('volume', 1)
+            path_volume[p] += volume
+            agent_paths.append({
+                'agent_id': agent['agent_id'],
+                'o_zone_id': agent['origin_node'],
+                'd_zone_id': agent['destination_node'],
+                'volume': volume,
+                'path_length': len(links),
+                'path_travel_time': float(path_costs[p]),
+                'path_free_flow_travel_time': float(free_flow_costs[p]),
+                'link_sequence': [self.link_ids[e] for e in links.tolist()],
+                'node_sequence': [self.nodes[i] for i in self.edge_tail[links].tolist()]
+                                 + [self.nodes[self.edge_head[links[-1]]]],
+            })
+        flows = self.incidence @ path_volume
+        if all(float(v).is_integer() for v in path_volume.tolist()):
+            flows = flows.round().astype(np.int64)
+        return agent_paths, dict(zip(self.link_ids, flows.tolist()))
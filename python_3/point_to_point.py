@@ -0,0 +1,155 @@
+import heapq
+import math
+
+import networkx as nx
+
+ROUTER_METHODS = ('astar', 'bidirectional')
+
+
+def _link_cost(attr):
+    return attr.get('current_travel_time', attr['free_flow_travel_time'])
+
+
+class PointToPointRouter:
+    """
+    Single origin-destination shortest paths on G's current travel times, searching only
+    around the corridor instead of building a full tree or value function.
+
+    'astar':         A* with h(v) = k * |xy(v) - xy(target)|, k the smallest free-flow travel
+                     time per coordinate unit over all links. Every path is at least as
+                     long as the straight line and BPR travel times never drop below free
+                     flow, so h stays admissible (and consistent) as the costs change;
+                     k is calibrated once. Without coordinates k = 0 (plain Dijkstra).
+    'bidirectional': Dijkstra from both ends, stopping when the two frontiers can no longer
+                     improve the best meeting point.
+
+    Travel times are read from G at query time.
+    """
+
+    def __init__(self, G: nx.DiGraph, method='astar'):
+        if method not in ROUTER_METHODS:
+            raise ValueError(f"Unknown router method '{method}', expected one of {ROUTER_METHODS}.")
+        self.G = G
+        self.method = method
+        self.coords = {}
+        for node, attr in G.nodes(data=True):
+            x, y = attr.get('x_coord'), attr.get('y_coord')
+            if x is None or y is None or not (math.isfinite(x) and math.isfinite(y)):
+                self.coords = None
+                break
+            self.coords[node] = (x, y)
+        self.cost_per_distance = self._calibrate()
+        self.queries = 0
+        self.settled = 0  # nodes settled by all queries
+
+    def _distance(self, u, v):
+        (x1, y1), (x2, y2) = self.coords[u], self.coords[v]
+        return math.hypot(x1 - x2, y1 - y2)
+
+    def _calibrate(self):
+        if self.coords is None:
+            return 0.0
+        ratio = math.inf
+        for u, v, attr in self.G.edges(data=True):
+            distance = self._distance(u, v)
+            if distance > 0:
+                ratio = min(ratio, attr['free_flow_travel_time'] / distance)
+        return ratio if math.isfinite(ratio) else 0.0
+
+    def heuristic(self, node, target):
+        """Lower bound of the travel time from node to target."""
+        return self.cost_per_distance * self._distance(node, target) if self.cost_per_distance else 0.0
+
+    def astar(self, source, target):
+        """(travel time, node path) from source to target; (inf, None) if unreachable."""
+        succ = self.G._succ
+        dist = {source: 0.0}
+        prev = {}
+        closed = set()
+        counter = 0
+        heap = [(self.heuristic(source, target), counter, source)]
+        while heap:
+            _, _, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            closed.add(u)
+            if u == target:
+                break
+            du = dist[u]
+            for v, attr in succ[u].items():
+                if v in closed:
+                    continue
+                dv = du + _link_cost(attr)
+                if dv < dist.get(v, math.inf):
+                    dist[v] = dv
+                    prev[v] = u
+                    counter += 1
+                    heapq.heappush(heap, (dv + self.heuristic(v, target), counter, v))
+        self.queries += 1
+        self.settled += len(closed)
+        if target not in closed:
+            return math.inf, None
+        return dist[target], self._unwind(prev, source, target)
+
+    def bidirectional(self, source, target):
+        """(travel time, node path) from source to target; (inf, None) if unreachable."""
+        if source == target:
+            self.queries += 1
+            return 0.0, [source]
+        adjacency = (self.G._succ, self.G._pred)
+        dist = ({source: 0.0}, {target: 0.0})
+        prev = ({}, {})
+        closed = (set(), set())
+        heaps = ([(0.0, 0, source)], [(0.0, 0, target)])
+        counter = 0
+        best, meeting = math.inf, None
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            du, _, u = heapq.heappop(heaps[side])
+            if u in closed[side]:
+                continue
+            closed[side].add(u)
+            for v, attr in adjacency[side][u].items():
+                dv = du + _link_cost(attr)
+                if dv < dist[side].get(v, math.inf):
+                    dist[side][v] = dv
+                    prev[side][v] = u
+                    counter += 1
+                    heapq.heappush(heaps[side], (dv, counter, v))
+                if v in dist[1 - side] and dv + dist[1 - side][v] < best:
+                    best, meeting = dv + dist[1 - side][v], v
+        self.queries += 1
+        self.settled += len(closed[0]) + len(closed[1])
+        if meeting is None:
+            return math.inf, None
+        forward = self._unwind(prev[0], source, meeting)
+        node, backward = meeting, []
+        while node != target:
+            node = prev[1][node]
+            backward.append(node)
+        return best, forward + backward
+
+    @staticmethod
+    def _unwind(prev, source, node):
+        path = [node]
+        while node != source:
+            node = prev[node]
+            path.append(node)
+        return path[::-1]
+
+    def route(self, source, target):
+        """(travel time, node path) with the configured method."""
+        if self.method == 'astar':
+            return self.astar(source, target)
+        return self.bidirectional(source, target)
+
+    def path(self, source, target):
+        """Node path from source to target, None if unreachable."""
+        return self.route(source, target)[1]
+
+    def path_edges(self, source, target):
+        """Path as a list of (u, v) links, as traced from a value function; [] if unreachable."""
+        nodes = self.path(source, target)
+        return list(zip(nodes[:-1], nodes[1:])) if nodes else []
@@ -1,28 +1,54 @@
 import pandas as pd
 
-def export_agent_results(agents, output_path):
-    """
-    Export agent-level results to CSV.
-
-    Args:
-        agents (list of dict): Each agent must have 'agent_id', 'origin_node', 'destination_node', and 'traveled_path'.
-        output_path (str): Output CSV path.
-    """
+def _agent_records(agents):
     records = []
     for agent in agents:
+        if 'origin_node' in agent:
+            origin, destination, links = agent['origin_node'], agent['destination_node'], agent.get('traveled_path', [])
+        else:  # path records of the full-path rollouts
+            origin, destination, links = agent['o_zone_id'], agent['d_zone_id'], agent['link_sequence']
         records.append({
             'agent_id': agent['agent_id'],
-            'origin_node': agent['origin_node'],
-            'destination_node': agent['destination_node'],
-            'link_sequence': agent.get('traveled_path', [])
+            'origin_node': origin,
+            'destination_node': destination,
+            'volume': agent.get('volume', 1),
+            'link_sequence': links
         })
 
-    df = pd.DataFrame(records)
+    df = pd.DataFrame(records, columns=['agent_id', 'origin_node', 'destination_node', 'volume', 'link_sequence'])
 
     # Convert list to space-separated string
     df['link_sequence'] = df['link_sequence'].apply(lambda x: ' '.join(map(str, x)) if isinstance(x, list) else '')
+    return df
+
 
-    df.to_csv(output_path, index=False)
+def export_agent_results(agents, output_path):
+    """
+    Export agent-level results to CSV.
+
+    Args:
+        agents (list of dict): Each agent must have 'agent_id', 'origin_node', 'destination_node', and 'traveled_path'
+            (or be a path record with 'o_zone_id', 'd_zone_id' and 'link_sequence'); 'volume' defaults to 1.
+        output_path (str): Output CSV path.
+    """
+    export_agent_chunks([agents], output_path)
+
+
+def export_agent_chunks(agent_chunks, output_path):
+    """
+    Export agent-level results to CSV one chunk at a time (e.g. from ODDemand.iter_chunks),
+    so only one chunk of records is held in memory.
+
+    Args:
+        agent_chunks (iterable of list of dict): Agent chunks, written in order.
+        output_path (str): Output CSV path.
+    """
+    first = True
+    for agents in agent_chunks:
+        _agent_records(agents).to_csv(output_path, index=False, mode='w' if first else 'a', header=first)
+        first = False
+    if first:
+        _agent_records([]).to_csv(output_path, index=False)
     print(f" Agent results exported to {output_path}")
 
 
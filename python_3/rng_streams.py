@@ -0,0 +1,97 @@
+from bisect import bisect_right
+from itertools import accumulate
+
+import numpy as np
+
+# first spawn-key element, keeps the stream families apart
+_STEP_UNIFORMS = 0
+_STEP_ORDER = 1
+_AGENT = 2
+# uniforms_at(): gaps up to this many slots are drawn through rather than skipped with advance()
+_SKIP_GAP = 128
+
+
+class RolloutStreams:
+    """
+    Reproducible random numbers for the rollouts, independent of agent order and sharding.
+
+    All streams derive from one seed through numpy SeedSequence spawn keys:
+      - uniforms(step, start, stop): one uniform per agent index for a rollout step.
+        Agent i always gets slot i of the step's PCG64 stream; a shard jumps to its first
+        agent with advance(), so any split of the agents over workers draws the same numbers.
+      - uniforms_at(step, indices): the same numbers for a subset of agents (the active
+        ones), without drawing the slots in between.
+      - permutation(step, indices): the visiting order of a sequential sweep.
+      - agent_generator(agent_index, step): a full Generator for one agent, for rollouts
+        that sample a whole path per agent.
+
+    Steps are counted by next_step() unless passed explicitly.
+    """
+
+    def __init__(self, seed=None):
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.step = 0
+
+    def _bit_generator(self, *spawn_key):
+        return np.random.PCG64(np.random.SeedSequence(self.seed, spawn_key=spawn_key))
+
+    def next_step(self):
+        step = self.step
+        self.step += 1
+        return step
+
+    def uniforms(self, step, start, stop):
+        """Uniforms in [0, 1) of agent indices start..stop-1 for a step."""
+        bit_generator = self._bit_generator(_STEP_UNIFORMS, step)
+        if start:
+            bit_generator.advance(start)  # one 64-bit draw per double
+        return np.random.Generator(bit_generator).random(stop - start)
+
+    def uniforms_at(self, step, indices):
+        """
+        Uniforms of the given agent indices (any order) for a step, equal to
+        uniforms(step, 0, n)[indices] but O(len(indices)): runs of nearby indices are drawn
+        in one go and longer gaps are skipped with advance().
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty(len(indices))
+        if not len(indices):
+            return out
+        gaps = np.diff(indices)
+        order = None  # active indices come sorted; sort anything else
+        if (gaps < 0).any():
+            order = np.argsort(indices, kind='stable')
+            indices = indices[order]
+            gaps = np.diff(indices)
+        breaks = np.flatnonzero(gaps > _SKIP_GAP) + 1
+        distinct = not (gaps == 0).any()  # then a run as long as its span is every slot in it
+
+        bit_generator = self._bit_generator(_STEP_UNIFORMS, step)
+        generator = np.random.Generator(bit_generator)
+        position = 0  # next slot of the stream
+        for a, b in zip(np.r_[0, breaks].tolist(), np.r_[breaks, len(indices)].tolist()):
+            first, last = int(indices[a]), int(indices[b - 1])
+            if first > position:
+                bit_generator.advance(first - position)
+            block = generator.random(last - first + 1)
+            out[a:b] = block if distinct and len(block) == b - a else block[indices[a:b] - first]
+            position = last + 1
+        if order is not None:
+            out[order] = out.copy()
+        return out
+
+    def permutation(self, step, indices):
+        return np.random.Generator(self._bit_generator(_STEP_ORDER, step)).permutation(indices)
+
+    def agent_generator(self, agent_index, step=0):
+        return np.random.Generator(self._bit_generator(_AGENT, step, agent_index))
+
+
+def sample_index(probs, u):
+    """
+    Index drawn from the discrete distribution probs (weights need not sum to one) with the
+    uniform u (inverse CDF). Plain Python: the choice sets are a handful of successors, for
+    which numpy's per-call overhead dominates.
+    """
+    cdf = list(accumulate(probs))
+    return min(bisect_right(cdf, u * cdf[-1]), len(cdf) - 1)
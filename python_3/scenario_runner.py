@@ -0,0 +1,196 @@
+import copy
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import (ScenarioConfig, default_scenario, sweep_mu_values, sweep_random_seeds,
+                    sweep_processes, scenario_results_file)
+from network_loader import load_network
+from demand_loader import load_demand
+from value_function_solver import solve_value_function
+from path_assignment import CHOICE_MODELS, assign_paths_from_value_function, assign_paths_from_path_set
+from path_set_choice import PathSet
+from one_step_rollout_replanned import run_one_step_multiagent_rollout
+from flow_accumulator import FlowDeltaAccumulator
+from active_agents import ActiveAgents
+from rng_streams import RolloutStreams
+from synchronous_rollout import SynchronousRollout, run_synchronous_rollout
+from utils import initialize_travel_times, update_link_cost_bpr, update_link_travel_times
+
+
+# (data_path, packet_size) -> (G, agents, destination_zones), filled once per worker process
+_DATASETS = {}
+
+
+def load_dataset(config: ScenarioConfig):
+    """Load the network and demand of a scenario's dataset."""
+    G = load_network(config.node_file, config.link_file)
+    agents, destination_zones = load_demand(config.demand_file, packet_size=config.packet_size)
+    return G, agents, destination_zones
+
+
+def _init_worker(datasets):
+    _DATASETS.update(datasets)
+
+
+def run_scenario(config: ScenarioConfig, G, agents, destination_zones, return_link_flows=False):
+    """
+    Run the replanned rollout pipeline for one scenario on private copies of G and agents.
+
+    The steps are those of main_replanned.main(): initial value solve and assignment,
+    then per outer iteration a rollout, a BPR update of every link and a value solve.
+    The only extra step is the opt-in MSA relaxation (config.use_msa), which averages
+    the link flows over the iterations before the BPR update; main_replanned has no
+    counterpart. Draws come from RolloutStreams(config.random_seed) (and the path set
+    generator), never from the global numpy RNG, so the seed alone makes a run
+    reproducible.
+
+    Returns:
+        records (list of dict): One record per outer iteration.
+        link_flows (dict): Final {link_id: flow}, only with return_link_flows=True.
+    """
+    start_time = time.time()
+    G = copy.deepcopy(G)
+    agents = copy.deepcopy(agents)
+
+    if config.choice_model not in CHOICE_MODELS:
+        raise ValueError(f"Unknown choice model '{config.choice_model}', expected one of {CHOICE_MODELS}.")
+    use_path_set = config.choice_model == 'path_set'
+
+    initialize_travel_times(G)
+    value_function_dict = {}
+    if use_path_set:
+        od_pairs = dict.fromkeys((agent['origin_node'], agent['destination_node']) for agent in agents)
+        path_set = PathSet(G, od_pairs, method=config.path_set_method, k=config.path_set_size)
+        path_rng = np.random.default_rng(config.random_seed)
+        assign_paths_from_path_set(G, agents, path_set, path_rng, mu=config.mu, beta=config.path_size_beta)
+        for u, v in G.edges():
+            update_link_cost_bpr(G, u, v)
+    else:
+        value_function_dict = {dest_zone: solve_value_function(G, dest_zone) for dest_zone in destination_zones}
+        assign_paths_from_value_function(G, agents, value_function_dict)
+        for dest_zone in destination_zones:
+            value_function_dict[dest_zone] = solve_value_function(G, dest_zone)
+
+    flow_deltas = FlowDeltaAccumulator(G)
+    active_agents = ActiveAgents(agents)
+    streams = RolloutStreams(config.random_seed)
+    if config.rollout_mode == 'parallel' and not use_path_set:
+        raise ValueError("The parallel rollout mode cannot run inside the scenario process pool.")
+    if config.rollout_mode == 'synchronous' and not use_path_set:
+        sync_engine = SynchronousRollout(G, agents, streams=streams)
+    records = []
+    last_link_flows = None
+    for outer_iter in range(config.max_outer_iterations):
+        if use_path_set:
+            completed_count = assign_paths_from_path_set(G, agents, path_set, path_rng, mu=config.mu,
+                                                         beta=config.path_size_beta)
+        elif config.rollout_mode == 'synchronous':
+            completed_count = run_synchronous_rollout(
+                sync_engine, value_function_dict, mu=config.mu, greedy=config.greedy, damping=config.damping
+            )
+        else:
+            completed_count = run_one_step_multiagent_rollout(
+                G, agents, value_function_dict, mu=config.mu, greedy=config.greedy,
+                update_cadence=config.update_cadence, chunk_size=config.chunk_size, flow_deltas=flow_deltas,
+                active=active_agents, streams=streams
+            )
+
+        link_flows = {attr['link_id']: attr['flow'] for _, _, attr in G.edges(data=True)}
+        if config.use_msa and last_link_flows is not None:
+            lambda_relax = 1.0 / (outer_iter + 1)
+            link_flows = {
+                link_id: (1 - lambda_relax) * last_link_flows[link_id] + lambda_relax * flow
+                for link_id, flow in link_flows.items()
+            }
+            update_link_travel_times(G, link_flows)
+        else:
+            for u, v in G.edges():
+                update_link_cost_bpr(G, u, v)
+
+        max_flow_change = np.nan
+        if last_link_flows is not None:
+            max_flow_change = max(abs(link_flows[link_id] - last_link_flows[link_id]) for link_id in link_flows)
+        last_link_flows = link_flows
+
+        total_tt = sum(
+            attr['current_travel_time'] * link_flows[attr['link_id']]
+            for _, _, attr in G.edges(data=True)
+        )
+        records.append({
+            'scenario': config.name,
+            'iteration': outer_iter,
+            'system_travel_time': total_tt,
+            'max_flow_change': max_flow_change,
+            'completed_agents': completed_count,
+            'elapsed_seconds': time.time() - start_time,
+            **config.to_dict(),
+        })
+
+        if not use_path_set:
+            for dest_zone in destination_zones:
+                value_function_dict[dest_zone] = solve_value_function(G, dest_zone)
+
+    if return_link_flows:
+        return records, last_link_flows
+    return records
+
+
+def _run_in_worker(config: ScenarioConfig):
+    G, agents, destination_zones = _DATASETS[(config.data_path, config.packet_size)]
+    return run_scenario(config, G, agents, destination_zones)
+
+
+def run_scenarios(configs, processes=None):
+    """
+    Run a list of ScenarioConfig objects in a process pool.
+
+    Each dataset is loaded once in the parent process and handed to every worker when
+    the pool starts; scenarios then work on their own copies.
+
+    Returns:
+        results (pd.DataFrame): Iteration records of all scenarios, indexed by (scenario, iteration).
+    """
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError("Scenario names must be unique.")
+
+    datasets = {}
+    for config in configs:
+        key = (config.data_path, config.packet_size)
+        if key not in datasets:
+            datasets[key] = load_dataset(config)
+
+    records = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(datasets,)) as pool:
+        for scenario_records in pool.map(_run_in_worker, configs):
+            records.extend(scenario_records)
+
+    return pd.DataFrame(records).set_index(['scenario', 'iteration']).sort_index()
+
+
+def build_sweep(mu_values, random_seeds, **overrides):
+    """ScenarioConfig for every (mu, seed) combination."""
+    return [
+        default_scenario(name=f"mu{mu_value}_seed{seed}", mu=mu_value, random_seed=seed, **overrides)
+        for mu_value, seed in itertools.product(mu_values, random_seeds)
+    ]
+
+
+def main():
+    configs = build_sweep(sweep_mu_values, sweep_random_seeds)
+    start_time = time.time()
+    results = run_scenarios(configs, processes=sweep_processes)
+    print(f"Ran {len(configs)} scenarios in {time.time() - start_time:.2f} seconds")
+
+    os.makedirs(os.path.dirname(scenario_results_file), exist_ok=True)
+    results.to_csv(scenario_results_file)
+    print(f" Scenario results exported to {scenario_results_file}")
+
+
+if __name__ == "__main__":
+    main()
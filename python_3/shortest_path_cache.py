@@ -0,0 +1,161 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+
+class ShortestPathService:
+    """
+    Shortest path trees over G, cached per (root, direction, cost version).
+
+    update_costs() reads the link costs (the same weights the callers used before:
+    'current_travel_time', else 'free_flow_travel_time') and bumps the cost version only
+    when the cost array actually changed; entries of older versions can no longer be
+    hit and are dropped. Within one version, every root is solved once: the all-or-nothing
+    loading of all agents of an origin, or the gap check of all agents of an origin, share
+    one tree.
+
+    A tree is a pair of arrays over the node indices: the distances and the predecessor
+    node (direction 'forward': from root) or successor node ('backward': to root).
+    Trees are evicted least recently used first when there are more than max_trees or
+    they take more than memory_limit_mb.
+
+    With a contraction hierarchy of G (contraction_hierarchy.ContractionHierarchy),
+    distance() and path() are answered by hierarchy queries instead of trees and
+    update_costs() re-customizes the hierarchy; paths are cached per OD pair and cost
+    version. tree() keeps using Dijkstra, which is faster for whole trees.
+    """
+
+    def __init__(self, G, max_trees=4096, memory_limit_mb=256, hierarchy=None):
+        self.G = G
+        self.hierarchy = hierarchy
+        self.nodes = list(G.nodes())
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.edge_tail = np.array([self.node_index[u] for u, _ in G.edges()], dtype=np.int64)
+        self.edge_head = np.array([self.node_index[v] for _, v in G.edges()], dtype=np.int64)
+        self.max_trees = max_trees
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+
+        self.cost = None
+        self.version = 0
+        self._graphs = {}  # direction -> csr matrix of the current costs
+        self.trees = OrderedDict()  # (root index, direction, version) -> (distances, predecessors)
+        self.od_paths = {}  # (source, target) -> node path, hierarchy queries of the current version
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def link_costs(self):
+        return np.array([attr.get('current_travel_time', attr['free_flow_travel_time'])
+                         for _, _, attr in self.G.edges(data=True)], dtype=float)
+
+    def update_costs(self, cost=None):
+        """
+        Set the link costs (array in G.edges() order; default: read from G). Returns the
+        cost version, unchanged if the costs are.
+        """
+        cost = self.link_costs() if cost is None else np.asarray(cost, dtype=float)
+        if self.cost is not None and np.array_equal(cost, self.cost):
+            return self.version
+        self.cost = cost.copy()
+        self.version += 1
+        self._graphs = {}
+        self.invalidations += len(self.trees)
+        self.trees.clear()
+        self.od_paths = {}
+        self.memory = 0
+        if self.hierarchy is not None:
+            self.hierarchy.customize(self.cost)
+        return self.version
+
+    def _graph(self, direction):
+        graph = self._graphs.get(direction)
+        if graph is None:
+            n_nodes = len(self.nodes)
+            if direction == 'forward':
+                graph = csr_matrix((self.cost, (self.edge_tail, self.edge_head)), shape=(n_nodes, n_nodes))
+            elif direction == 'backward':
+                graph = csr_matrix((self.cost, (self.edge_head, self.edge_tail)), shape=(n_nodes, n_nodes))
+            else:
+                raise ValueError(f"Unknown direction '{direction}', expected 'forward' or 'backward'.")
+            self._graphs[direction] = graph
+        return graph
+
+    def tree(self, root, direction='forward'):
+        """(distances, predecessors) of the shortest path tree from (forward) or to (backward) root."""
+        if self.cost is None:
+            self.update_costs()
+        key = (self.node_index[root], direction, self.version)
+        entry = self.trees.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.trees.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        distances, predecessors = dijkstra(self._graph(direction), indices=key[0], return_predecessors=True)
+        entry = (distances, predecessors.astype(np.int32))
+        self.trees[key] = entry
+        self.memory += distances.nbytes + entry[1].nbytes
+        while len(self.trees) > 1 and (len(self.trees) > self.max_trees or self.memory > self.memory_limit):
+            _, (old_distances, old_predecessors) = self.trees.popitem(last=False)
+            self.memory -= old_distances.nbytes + old_predecessors.nbytes
+            self.evictions += 1
+        return entry
+
+    def distance(self, source, target):
+        """Shortest path cost from source to target (inf if there is no path)."""
+        if self.hierarchy is not None:
+            self._count_query(source, target)
+            return self.hierarchy.distance(source, target)
+        distances, _ = self.tree(source)
+        return float(distances[self.node_index[target]])
+
+    def path(self, source, target):
+        """Shortest path from source to target as a node list (None if there is no path)."""
+        if self.hierarchy is not None:
+            key = (source, target)
+            if key not in self.od_paths:
+                self._count_query(source, target)
+                self.od_paths[key] = self.hierarchy.query(source, target)[1]
+            else:
+                self.hits += 1
+            return self.od_paths[key]
+        distances, predecessors = self.tree(source)
+        i, start = self.node_index[target], self.node_index[source]
+        if not np.isfinite(distances[i]):
+            return None
+        path = [i]
+        while i != start:
+            i = int(predecessors[i])
+            path.append(i)
+        return [self.nodes[i] for i in reversed(path)]
+
+    def _count_query(self, source, target):
+        """Hierarchy query: a hit when both search spaces are cached under the current costs."""
+        if self.cost is None:
+            self.update_costs()
+        spaces = self.hierarchy.spaces
+        if (self.node_index[source], 'forward') in spaces and (self.node_index[target], 'backward') in spaces:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def hit_ratio(self):
+        queries = self.hits + self.misses
+        return self.hits / queries if queries else 0.0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio(),
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'trees': len(self.trees),
+            'memory_mb': self.memory / (1024 * 1024),
+            'cost_version': self.version,
+        }
@@ -0,0 +1,223 @@
+import numpy as np
+
+from rng_streams import RolloutStreams
+from instrumentation import NULL_INSTRUMENTATION
+
+
+class SynchronousRollout:
+    """
+    Synchronous (Jacobi) one-step rollout on array state.
+
+    Every active agent picks its next link against the same cost snapshot: choice
+    probabilities are computed once per (node, destination) group and all agents are
+    sampled in one pass (searchsorted over the groups' cumulative probabilities).
+    After the moves, each agent's remaining plan is the greedy path from its new node
+    under the snapshot, so the link flow target is
+
+        traveled flow + flow of the remaining greedy paths,
+
+    and flows move towards it by the damping factor before BPR times are recomputed for
+    all links at once. damping=1 jumps to the target; smaller values damp oscillations.
+
+    Agent dicts are only read when the engine is built; sync_agents() writes positions,
+    traveled paths and planned links back to them. Draws come from RolloutStreams, one
+    uniform per agent index and step.
+    """
+
+    def __init__(self, G, agents, random_seed=None, alpha=0.15, beta=4, streams=None):
+        self.G = G
+        self.agents = agents
+        self.alpha = alpha
+        self.beta = beta
+        self.streams = streams if streams is not None else RolloutStreams(random_seed)
+
+        self.nodes = list(G.nodes())
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        n_nodes = len(self.nodes)
+
+        # CSR adjacency in G.successors() order
+        tails, heads, self.edge_attrs = [], [], []
+        for u, v, attr in G.edges(data=True):
+            tails.append(self.node_index[u])
+            heads.append(self.node_index[v])
+            self.edge_attrs.append(attr)
+        self.edge_tail = np.array(tails, dtype=np.int64)
+        self.edge_head = np.array(heads, dtype=np.int64)
+        self.out_degree = np.bincount(self.edge_tail, minlength=n_nodes)
+        self.indptr = np.concatenate(([0], np.cumsum(self.out_degree)))
+        self.link_ids = [attr['link_id'] for attr in self.edge_attrs]
+        self.free_flow_time = np.array([attr['free_flow_travel_time'] for attr in self.edge_attrs], dtype=float)
+        self.capacity = np.array([attr['capacity'] for attr in self.edge_attrs], dtype=float)
+        self.cost = np.array([attr['current_travel_time'] for attr in self.edge_attrs], dtype=float)
+        self.flow = np.array([attr.get('flow', 0) for attr in self.edge_attrs], dtype=float)
+
+        self.destinations = sorted({agent['destination_node'] for agent in agents})
+        self.destination_nodes = np.array([self.node_index[dest] for dest in self.destinations], dtype=np.int64)
+        dest_row = {dest: d for d, dest in enumerate(self.destinations)}
+        self.position = np.array([self.node_index[a['current_position']] for a in agents], dtype=np.int64)
+        self.dest_node = np.array([self.node_index[a['destination_node']] for a in agents], dtype=np.int64)
+        self.dest_row = np.array([dest_row[a['destination_node']] for a in agents], dtype=np.int64)
+        self.volume = np.array([a.get('volume', 1) for a in agents], dtype=float)
+
+        # flow of the links already traveled; positions are synced from the dicts
+        link_edge = {attr['link_id']: e for e, attr in enumerate(self.edge_attrs)}
+        self.traveled_flow = np.zeros(len(self.edge_attrs), dtype=float)
+        for agent in agents:
+            for link_id in agent['traveled_path']:
+                self.traveled_flow[link_edge[link_id]] += agent.get('volume', 1)
+        self._moves = []  # (agent indices, edge indices) per step, not yet written to the dicts
+        self.next_edge = None  # greedy edge per (destination row, node) of the last snapshot
+
+    def _value_matrix(self, value_function_dict):
+        V = np.full((len(self.destinations), len(self.nodes)), -np.inf)
+        for d, dest in enumerate(self.destinations):
+            value_function = value_function_dict[dest]
+            V[d] = [value_function.get(node, -np.inf) for node in self.nodes]
+        return V
+
+    def _greedy_edges(self, V):
+        """Best outgoing edge of every node for every destination row (-1 if none)."""
+        n_dest, n_nodes = V.shape
+        next_edge = np.full((n_dest, n_nodes), -1, dtype=np.int64)
+        if not len(self.edge_tail):
+            return next_edge
+        scores = V[:, self.edge_head] - self.cost  # (destinations, edges)
+        for d in range(n_dest):
+            order = np.lexsort((np.arange(len(self.edge_tail)), -scores[d], self.edge_tail))
+            tails = self.edge_tail[order]
+            first = order[np.r_[True, tails[1:] != tails[:-1]]]
+            first = first[scores[d, first] > -np.inf]
+            next_edge[d, self.edge_tail[first]] = first
+        next_edge[np.arange(n_dest), self.destination_nodes] = -1
+        return next_edge
+
+    def _planned_flow(self, next_edge, active):
+        """Flow of every agent's remaining greedy path, propagated down the next-hop trees."""
+        n_dest, n_nodes = next_edge.shape
+        n_edges = len(self.edge_tail)
+        flat_next = next_edge.ravel()
+        mass = np.bincount(self.dest_row[active] * n_nodes + self.position[active],
+                           weights=self.volume[active], minlength=n_dest * n_nodes)
+        planned = np.zeros(n_edges)
+        for _ in range(n_nodes):
+            cells = np.flatnonzero(mass)
+            edges = flat_next[cells]
+            keep = edges >= 0
+            if not keep.any():
+                break
+            cells, edges = cells[keep], edges[keep]
+            planned += np.bincount(edges, weights=mass[cells], minlength=n_edges)
+            rows = cells // n_nodes
+            mass = np.bincount(rows * n_nodes + self.edge_head[edges], weights=mass[cells],
+                               minlength=n_dest * n_nodes)
+        return planned
+
+    def step(self, value_function_dict, mu=0.1, greedy=False, damping=1.0, write_back=True):
+        """
+        Move every active agent one link against the current cost snapshot.
+
+        Returns:
+            completed_count (int): Number of agents at their destination after the step.
+            moved_count (int): Number of agents that moved.
+        """
+        V = self._value_matrix(value_function_dict)
+        active = np.flatnonzero((self.position != self.dest_node) & (self.out_degree[self.position] > 0))
+
+        moved_count = 0
+        if len(active):
+            # one group per (destination, node) with an active agent
+            n_nodes = len(self.nodes)
+            group_key = self.dest_row[active] * n_nodes + self.position[active]
+            keys, agent_group = np.unique(group_key, return_inverse=True)
+            group_row, group_node = keys // n_nodes, keys % n_nodes
+
+            # candidate edges of every group, laid out group after group
+            degree = self.out_degree[group_node]
+            group_start = np.concatenate(([0], np.cumsum(degree)[:-1]))
+            cand_group = np.repeat(np.arange(len(keys)), degree)
+            cand_edge = (np.repeat(self.indptr[group_node] - group_start, degree)
+                         + np.arange(degree.sum()))
+            scores = V[group_row[cand_group], self.edge_head[cand_edge]] - self.cost[cand_edge]
+
+            if greedy:
+                # first candidate with the best score in each group, as np.argmax would pick
+                order = np.lexsort((np.arange(len(scores)), -scores, cand_group))
+                choice = order[group_start][agent_group]
+            else:
+                z = scores / mu
+                z = np.exp(z - np.maximum.reduceat(z, group_start)[cand_group])
+                z[np.isnan(z)] = 1.0  # no reachable successor: uniform over the candidates
+                cum = np.cumsum(z)
+                group_total = np.add.reduceat(z, group_start)
+                # cumulative probability within the group, offset by the group number
+                offset = cum[group_start] - z[group_start]
+                cum = (cum - offset[cand_group]) / group_total[cand_group] + cand_group
+                step = self.streams.next_step()
+                u = agent_group + self.streams.uniforms_at(step, active)
+                choice = np.searchsorted(cum, u, side='right')
+                group_end = group_start + degree - 1
+                choice = np.minimum(choice, group_end[agent_group])
+
+            moved_edges = cand_edge[choice]
+            self.position[active] = self.edge_head[moved_edges]
+            self.traveled_flow += np.bincount(moved_edges, weights=self.volume[active], minlength=len(self.edge_tail))
+            self._moves.append((active, moved_edges))
+            moved_count = len(active)
+
+        # flows and costs are updated together, after all moves
+        self.next_edge = self._greedy_edges(V)
+        still_active = np.flatnonzero(self.position != self.dest_node)
+        target = self.traveled_flow + self._planned_flow(self.next_edge, still_active)
+        self.flow += damping * (target - self.flow)
+        self.cost = self.free_flow_time * (1 + self.alpha * (self.flow / self.capacity) ** self.beta)
+
+        if write_back:
+            self.sync_graph()
+        completed_count = len(self.agents) - len(still_active)
+        return completed_count, moved_count
+
+    def sync_graph(self):
+        for attr, flow, cost in zip(self.edge_attrs, self.flow.tolist(), self.cost.tolist()):
+            attr['flow'] = flow
+            attr['current_travel_time'] = cost
+
+    def sync_agents(self):
+        """Write positions, traveled paths and planned links back to the agent dicts."""
+        agents, link_ids = self.agents, self.link_ids
+        for active, edges in self._moves:
+            for i, e in zip(active.tolist(), edges.tolist()):
+                agents[i]['traveled_path'].append(link_ids[e])
+        self._moves = []
+
+        nodes = self.nodes
+        for i, agent in enumerate(agents):
+            pos = int(self.position[i])
+            agent['current_position'] = nodes[pos]
+            if self.next_edge is None:
+                continue
+            plan = []
+            next_edge = self.next_edge[self.dest_row[i]]
+            while pos != self.dest_node[i] and len(plan) < len(nodes):
+                e = next_edge[pos]
+                if e < 0:
+                    break
+                plan.append((nodes[pos], nodes[self.edge_head[e]]))
+                pos = self.edge_head[e]
+            agent['planned_links'] = plan
+
+
+def run_synchronous_rollout(engine, value_function_dict, mu=0.1, greedy=False, damping=1.0,
+                            instrumentation=NULL_INSTRUMENTATION, sync=False):
+    """
+    One synchronous rollout step. The agent dicts are written back (engine.sync_agents(),
+    a loop over all agents) only with sync=True; callers that read them less often than
+    every step call engine.sync_agents() themselves before they do.
+
+    Returns number of agents that completed their trip.
+    """
+    completed_count, moved_count = engine.step(value_function_dict, mu=mu, greedy=greedy, damping=damping)
+    if sync:
+        engine.sync_agents()
+    instrumentation.count('agents_moved', moved_count)
+    instrumentation.count('bpr_updates', len(engine.edge_attrs))
+    return completed_count
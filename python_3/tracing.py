@@ -0,0 +1,100 @@
+import json
+from collections import deque
+
+import pandas as pd
+
+
+class AgentTracer:
+    """
+    Records the decisions of selected agents into an in-memory buffer.
+
+    Register what to watch with trace_agents(), trace_nodes() or trace_destinations();
+    an agent step is recorded when the agent, its current node or its destination is
+    registered. The rollout only takes its traced code path when something is
+    registered, so an idle tracer adds no per-agent work.
+
+    Value functions are traced for registered destinations (all nodes) and for
+    registered nodes (all destinations).
+    """
+
+    def __init__(self, max_records=100000):
+        self.agent_ids = set()
+        self.nodes = set()
+        self.destinations = set()
+        self.records = deque(maxlen=max_records)
+        self.iteration = None  # set by the caller, stamped on every record
+
+    def trace_agents(self, *agent_ids):
+        self.agent_ids.update(agent_ids)
+        return self
+
+    def trace_nodes(self, *nodes):
+        self.nodes.update(nodes)
+        return self
+
+    def trace_destinations(self, *destinations):
+        self.destinations.update(destinations)
+        return self
+
+    def clear_registrations(self):
+        self.agent_ids.clear()
+        self.nodes.clear()
+        self.destinations.clear()
+
+    @property
+    def active(self):
+        return bool(self.agent_ids or self.nodes or self.destinations)
+
+    def matches(self, agent, node):
+        return (agent['agent_id'] in self.agent_ids
+                or node in self.nodes
+                or agent['destination_node'] in self.destinations)
+
+    def record(self, event, **fields):
+        self.records.append({'event': event, 'iteration': self.iteration, **fields})
+
+    def record_decision(self, agent, node, successors, scores, probs, next_node, new_plan):
+        self.record(
+            'decision',
+            agent_id=agent['agent_id'],
+            node=node,
+            destination=agent['destination_node'],
+            successors=list(successors),
+            scores=[float(s) for s in scores],
+            probs=None if probs is None else [float(p) for p in probs],
+            next_node=next_node,
+            replanned=new_plan is not None,
+            planned_links=list(agent['planned_links']),
+            traveled_path=list(agent['traveled_path']),
+        )
+
+    def record_value_function(self, destination_zone, value_function, iterations):
+        if destination_zone in self.destinations:
+            nodes = value_function.keys()
+        else:
+            nodes = [n for n in self.nodes if n in value_function]
+        for node in nodes:
+            self.record('value', destination=destination_zone, node=node,
+                        value=float(value_function[node]), sweeps=iterations)
+
+    def to_frame(self):
+        return pd.DataFrame(list(self.records))
+
+    def dump(self, output_file):
+        """Write the buffer as JSON lines."""
+        with open(output_file, 'w') as f:
+            for rec in self.records:
+                f.write(json.dumps(rec, default=_to_json) + "\n")
+        print(f" Trace records exported to {output_file}")
+
+
+def _to_json(obj):
+    # numpy scalars (node and link IDs read by pandas) -> Python scalars
+    return obj.item() if hasattr(obj, 'item') else str(obj)
+
+
+def make_tracer(agent_ids=(), nodes=(), destinations=(), max_records=100000):
+    """AgentTracer with the given registrations, or None when nothing is registered."""
+    if not (agent_ids or nodes or destinations):
+        return None
+    return AgentTracer(max_records).trace_agents(*agent_ids).trace_nodes(*nodes).trace_destinations(*destinations)
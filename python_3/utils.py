@@ -9,10 +9,18 @@ def softmax(x):
     exp_x = np.exp(x)
     return exp_x / np.sum(exp_x)
 
-def trace_greedy_path_from_value_function(G, start_node, destination_node, value_function):
+def trace_greedy_path_from_value_function(G, start_node, destination_node, value_function, next_hops=None,
+                                          router=None):
     """
     Trace a greedy shortest path from current node to destination using value function.
+    With next_hops (NextHopTable holding destination_node) the precomputed pointers are followed instead.
+    With router (PointToPointRouter) the path is searched on the current travel times instead.
     """
+    if router is not None:
+        return router.path_edges(start_node, destination_node)
+    if next_hops is not None:
+        return next_hops.path(start_node, destination_node)
+
     curr = start_node
     path = []
     while curr != destination_node:
@@ -59,10 +67,11 @@ def aggregate_agent_link_flows(agent_result_file, output_file):
         output_file (str): Path to save aggregated link flow CSV.
     """
     df = pd.read_csv(agent_result_file)
+    volumes = df['volume'] if 'volume' in df else [1] * len(df)
 
     link_flow_count = {}
 
-    for links in df['link_sequence']:
+    for links, volume in zip(df['link_sequence'], volumes):
         if pd.isna(links):
             continue
 
@@ -76,7 +85,7 @@ def aggregate_agent_link_flows(agent_result_file, output_file):
             link_ids = [int(x) for x in links.split() if x.strip().isdigit()]
 
         for link_id in link_ids:
-            link_flow_count[link_id] = link_flow_count.get(link_id, 0) + 1
+            link_flow_count[link_id] = link_flow_count.get(link_id, 0) + volume
 
     # Save to DataFrame
     flow_df = pd.DataFrame({
@@ -91,6 +100,12 @@ def aggregate_agent_link_flows(agent_result_file, output_file):
 
 
 
+def initialize_travel_times(G):
+    for u, v, attr in G.edges(data=True):
+        attr['flow'] = 0
+        attr['current_travel_time'] = attr['free_flow_travel_time']
+
+
 def update_link_travel_times(G, link_flows, alpha=0.15, beta=4):
     """
     Update link travel times using the BPR function.
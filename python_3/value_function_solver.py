@@ -1,8 +1,14 @@
 import networkx as nx
 import numpy as np
 
+try:
+    from instrumentation import NULL_INSTRUMENTATION
+except ImportError:  # imported as python_3.value_function_solver by the python_2 scripts
+    from python_3.instrumentation import NULL_INSTRUMENTATION
 
-def solve_value_function(G: nx.DiGraph, destination_zone: int, mu: float = 1.0):
+
+def solve_value_function(G: nx.DiGraph, destination_zone: int, mu: float = 1.0,
+                         instrumentation=NULL_INSTRUMENTATION, tracer=None):
     """
     Solve the soft Bellman equation for a single destination.
 
@@ -10,6 +16,8 @@ def solve_value_function(G: nx.DiGraph, destination_zone: int, mu: float = 1.0):
         G (nx.DiGraph): Network graph.
         destination_zone (int): Zone ID of the destination.
         mu (float): Softmax temperature parameter.
+        instrumentation (Instrumentation): Receives the 'value_sweeps' counter.
+        tracer (AgentTracer, optional): Records V(node) for traced nodes and destinations.
 
     Returns:
         value_function (dict): Dictionary {node_id: V(node)} for this destination.
@@ -38,7 +46,9 @@ def solve_value_function(G: nx.DiGraph, destination_zone: int, mu: float = 1.0):
     convergence_threshold = 1e-4
     max_iterations = 1000
 
+    sweeps = 0
     for iteration in range(max_iterations):
+        sweeps += 1
         delta = 0
         updated_value = value_function.copy()
 
@@ -71,10 +81,9 @@ def solve_value_function(G: nx.DiGraph, destination_zone: int, mu: float = 1.0):
 
         if delta < convergence_threshold:
             print(f"Value function for destination {destination_zone} converged in {iteration+1} iterations (Δ={delta:.6f}).")
-            # print(f"After iteration {iteration + 1}:")
-            for node, val in value_function.items():
-                print(f"V({node}) = {val:.4f}")
-            print("\n")
             break
 
+    instrumentation.count('value_sweeps', sweeps)
+    if tracer is not None:
+        tracer.record_value_function(destination_zone, value_function, sweeps)
     return value_function